@@ -0,0 +1,245 @@
+# Tests of the plan and GUI logic, no IOCs, beam or databroker needed
+# Start the profile (MAIA_SIMULATE=1 is fine), then from IPython
+# %run -i ~/.ipython/profile_collection/acceptance_tests/test_logic.py
+# and call the test functions.
+
+
+def test_live_map_buffer():
+    """
+    Fill a 3 x 5 snaking map downsampled to at most 2 pixels a side.
+    Successful if odd rows are stored reversed and every display pixel
+    is the mean of its block, the partial blocks at the edges included.
+    """
+    buffer = LiveMapBuffer(max_display=2)
+    buffer.allocate(3, 5, snaking=(False, True))
+    assert buffer.block == (2, 3), buffer.block
+    assert buffer.display.shape == (2, 2), buffer.display.shape
+    rows = np.arange(15, dtype=float).reshape(3, 5)
+    for row, values in enumerate(rows):
+        # in scan order, odd rows run from xstop back to xstart
+        assert buffer.set_row(row, values[::-1] if row % 2 else values)
+    assert not buffer.set_row(3, rows[0])
+    np.testing.assert_array_equal(buffer.image, rows)
+    expected = [
+        [rows[0:2, 0:3].mean(), rows[0:2, 3:5].mean()],
+        [rows[2, 0:3].mean(), rows[2, 3:5].mean()],
+    ]
+    np.testing.assert_allclose(buffer.display, expected)
+    print("Live map buffer complete")
+
+
+def test_live_map_last_row():
+    """
+    Size the live map from the start document of a fly_maia run of
+    shape [2, 10], which scans rows 0, 1 and 2.
+    Successful if the last row is stored too.
+    """
+    buffer = LiveMapBuffer()
+    buffer.allocate(*fly_maia_map_shape({"shape": [2, 10]}))
+    for row in range(3):
+        assert buffer.set_row(row, np.full(10, row + 1.0)), row
+    assert not np.isnan(buffer.image).any(), buffer.image
+    np.testing.assert_array_equal(buffer.image[2], np.full(10, 3.0))
+    print("Live map last row complete")
+
+
+def test_reacquire_after_queue():
+    """
+    Queue three scans, the first of them interrupted by the beam.
+    Successful if the retake runs after the other queued scans and its
+    retry count survives a replay of the queue journal.
+    """
+    import tempfile
+
+    model = QueueModel()
+    items = [QueueItem(f"scan {i}", Position(i, 0, 0)) for i in range(3)]
+    model.add_items(items)
+    with tempfile.TemporaryDirectory() as d:
+        journal = QueueJournal(os.path.join(d, "queue.jsonl"))
+        list_model = QueueListModel(model, journal)
+        journal.record_add(items)
+        list_model.set_status(items[0], RequestStatus.REACQUIRE)
+        assert items[0].retries == 1, items[0].retries
+        assert model.next_pending() is items[1]
+        list_model.set_status(items[1], RequestStatus.COMPLETE)
+        list_model.set_status(items[2], RequestStatus.COMPLETE)
+        assert model.next_pending() is items[0]
+        restored = QueueJournal(journal.path).restore()
+    assert [item.id for item in restored] == [item.id for item in items]
+    assert restored[0].status is RequestStatus.REACQUIRE
+    assert restored[0].retries == 1, restored[0].retries
+    print("Reacquire ordering complete")
+
+
+def test_microscope_calibration():
+    """
+    Calibrate the microscope from a feature seen at two stage positions.
+    Successful if the scale and signs are recovered, view and stage
+    coordinates map back onto each other around the crosshair, and the
+    calibration is saved to and loaded from a bare filename.
+    """
+    import tempfile
+
+    # 2 um per pixel, the view y axis against the stage y axis
+    truth = MicroscopeCalibration(pixel_size=0.002, x_sign=1, y_sign=-1)
+    beam = crosshair_center({"always_centered": True}, 640, 480)
+    assert beam == (320, 240), beam
+    before = truth.stage_to_view(1.0, 2.0, 1.0, 2.0, beam)
+    after = truth.stage_to_view(1.0, 2.0, 1.1, 2.05, beam)
+    calibration = MicroscopeCalibration(x_sign=-1, y_sign=1)
+    calibration.calibrate(before, after, (1.0, 2.0), (1.1, 2.05))
+    assert math.isclose(calibration.pixel_size, 0.002), calibration.pixel_size
+    assert (calibration.x_sign, calibration.y_sign) == (1, -1), calibration
+    px, py = calibration.stage_to_view(1.3, 1.9, 1.0, 2.0, beam)
+    x, y = calibration.view_to_stage(px, py, 1.0, 2.0, beam)
+    assert math.isclose(x, 1.3) and math.isclose(y, 1.9), (x, y)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as d:
+        os.chdir(d)
+        try:
+            calibration.save("calibration.json")
+            assert MicroscopeCalibration.load("calibration.json") == calibration
+        finally:
+            os.chdir(cwd)
+    print("Microscope calibration complete")
+
+
+def test_load_maia_plan_errors():
+    """
+    Load a plan with one good scan and four bad rows.
+    Successful if only the good scan is kept and every problem is
+    reported once against its spreadsheet line.
+    """
+    base = dict(
+        Name="a", Serial="", Info="", XStart=0.0, XStop=1.0, YStart=0.0, YStop=1.0,
+        Pitch=0.01, Dwell=0.01, Type="", Owner="",
+    )
+    rows = [
+        dict(base),
+        dict(base, Name="b", XStart="left"),
+        dict(base, Name="c"),
+        dict(base, Name="c", Dwell=100.0),
+        dict(base, Name="d", YStop=0.0),
+    ]
+    plan, errors = load_maia_plan(pd.DataFrame(rows))
+    assert list(plan["name"]) == ["a"], plan
+    # the header is line 1
+    expected = [
+        (3, "b", "xstart is not a number"),
+        (4, "c", "name is repeated"),
+        (5, "c", "name is repeated"),
+        (5, "c", "dwell outside 0.0001-10.0 s"),
+        (6, "d", "ystart equals ystop"),
+    ]
+    assert list(errors.itertuples(index=False, name=None)) == expected, errors
+    print(format_plan_errors(errors))
+    print("Plan loader errors complete")
+
+
+def test_queue_journal_replay():
+    """
+    Replay a journal left by a crash in the middle of a scan, its last
+    line only half written.
+    Successful if the queue order, removes and the COMPLETE status are
+    restored, the scan that was COLLECTING is QUEUED again, the torn
+    line is skipped and the journal is rewritten as a snapshot.
+    """
+    import tempfile
+
+    items = [QueueItem(f"scan {i}", Position(i, 0, 0)) for i in range(4)]
+    with tempfile.TemporaryDirectory() as d:
+        journal = QueueJournal(os.path.join(d, "queue.jsonl"))
+        journal.record_add(items)
+        journal.record_remove(items[3])
+        journal.record_move(items[2], 0)
+        items[2].status = RequestStatus.COMPLETE
+        journal.record_status(items[2])
+        items[0].status = RequestStatus.COLLECTING
+        journal.record_status(items[0])
+        with open(journal.path, "a") as f:
+            f.write('{"op": "status", "id": "%s", "sta' % items[1].id)
+        restored = journal.restore()
+        with open(journal.path) as f:
+            snapshot = [json.loads(line) for line in f]
+    assert [item.label for item in restored] == ["scan 2", "scan 0", "scan 1"], restored
+    assert [item.status for item in restored] == [
+        RequestStatus.COMPLETE, RequestStatus.QUEUED, RequestStatus.QUEUED
+    ], [item.status for item in restored]
+    assert restored[1].data == items[0].data
+    assert [record["op"] for record in snapshot] == ["add"] * 3, snapshot
+    print("Queue journal replay complete")
+
+
+def test_stage_backlash_takeup():
+    """
+    Ask StageBacklash about moves after forward, reversed and unknown
+    approaches, no stage is moved.
+    Successful if backlash is only taken up when the axis reverses or
+    its state is unknown and the move is too short to take it up itself.
+    """
+    backlash = StageBacklash(None, distances={"x": 0.5, "z": 0.0})
+    # unknown state
+    assert backlash.needs_takeup("x", 1.0, 1.2)
+    assert not backlash.needs_takeup("x", 1.0, 2.0)
+    assert backlash.needs_takeup("x", 1.0, 0.0)
+    assert not backlash.needs_takeup("z", 1.0, 0.0)
+    # last approached from below, as the helper does
+    backlash.record("x", 0.0, 1.0)
+    assert not backlash.needs_takeup("x", 1.0, 1.2)
+    assert backlash.needs_takeup("x", 1.0, 0.8)
+    # moved by something else since
+    assert backlash.needs_takeup("x", 1.5, 1.7)
+    # last approached from above, reversing
+    backlash.record("x", 2.0, 1.0)
+    assert backlash.needs_takeup("x", 1.0, 1.2)
+    backlash.forget("x")
+    assert backlash.needs_takeup("x", 1.0, 1.2)
+    print("Stage backlash complete")
+
+
+def test_order_scans_keeps_pinned():
+    """
+    Optimize the order of six small scans spread out along y, two of
+    them pinned.
+    Successful if the pinned scans keep their slots, every scan is kept
+    once and the stage travel gets shorter.
+    """
+    ys = [5.0, 0.0, 4.0, 1.0, 3.0, 2.0]
+    defns = [
+        MaiaFlyDefinition(
+            ystart=y, ystop=y + 0.1, ypitch=0.01, xstart=0.0, xstop=0.2, xpitch=0.01, dwell=0.01
+        )
+        for y in ys
+    ]
+    pinned = [0, 3]
+    order, before, after = order_scans_for_travel(
+        defns, start=(0.0, 5.0), pinned=pinned, params=MaiaMotionParams()
+    )
+    assert sorted(order) == list(range(len(defns))), order
+    assert all(order[slot] == slot for slot in pinned), order
+    assert after < before, (before, after)
+    print(f"Stage travel {before:.1f} s -> {after:.1f} s, order {order}")
+    print("Queue order complete")
+
+
+def test_motor_pitch_rounding():
+    """
+    Round pitches to motor steps in fly_maia, the time estimate and the
+    plan loader.
+    Successful if a pitch which is already a whole number of steps is
+    kept, others are rounded down with a minimum of 2 steps and all
+    three agree.
+    """
+    pitches = np.array([0.0098, 0.0099, 0.0001, 0.01])
+    expected = np.array([0.0098, 0.0098, 0.0004, 0.01])
+    assert np.allclose(maia_motor_pitch(pitches), expected), maia_motor_pitch(pitches)
+    est = estimate_fly_maia_times(0.0, 0.5, pitches, 0.0, 0.5, pitches, 0.01)
+    assert np.allclose(est["xnum"], np.ceil(0.5 / expected - 1e-9)), est["xnum"]
+    base = dict(
+        Name="a", Serial="", Info="", XStart=0.0, XStop=1.0, YStart=0.0, YStop=1.0,
+        Pitch=0.0098, Dwell=0.01, Type="", Owner="",
+    )
+    plan, errors = load_maia_plan(pd.DataFrame([base]))
+    assert errors.empty, errors
+    assert np.isclose(plan["pitch"].iloc[0], 0.0098), plan["pitch"]
+    print("Motor pitch rounding complete")
@@ -0,0 +1,217 @@
+# Acceptance tests against the simulated devices, safe to run without beam
+# Start the profile with MAIA_SIMULATE=1 (and e.g. MAIA_SIM_TIME_SCALE=10),
+# then from IPython
+# %run -i ~/.ipython/profile_collection/acceptance_tests/test_sim_plans.py
+
+
+def _check_simulated():
+    if not MAIA_SIMULATE:
+        raise RuntimeError("These tests need the profile started with MAIA_SIMULATE=1")
+
+
+def test_sim_fly_maia():
+    """
+    Fly scan in both fly modes against the simulated stage and MAIA.
+    Successful if both runs finish with a fly_progress row per raster row
+    and the start document has the extents that were asked for.
+    """
+    _check_simulated()
+    for fly_mode in ["rows", "continuous"]:
+        print(f"Starting simulated fly scan, {fly_mode} mode")
+        (uid,) = RE(
+            fly_maia(
+                ystart=1.0,
+                ystop=1.02,
+                ypitch=0.01,
+                xstart=2.0,
+                xstop=2.1,
+                xpitch=0.01,
+                dwell=0.01,
+                hf_stage=M,
+                maia=maia,
+                fly_mode=fly_mode,
+            )
+        )
+        progress = db[uid].table("fly_progress")
+        assert len(progress) == 3, progress
+        extents = db[uid].start["extents"]
+        assert np.allclose(extents, [[1.0, 1.02], [2.0, 2.1]]), extents
+    print("Simulated fly scans complete")
+
+
+def test_sim_step_scans():
+    """
+    xscan and yscan against the simulated stage.
+    Successful if both finish back at their start position.
+    """
+    _check_simulated()
+    RE(xscan(0.0, 0.01, 0.002, 0.01, confirm=False))
+    assert abs(M.x.position) < 1e-6
+    RE(yscan(0.0, 0.01, 0.002, 0.01, confirm=False))
+    assert abs(M.y.position) < 1e-6
+    print("Simulated step scans complete")
+
+
+def test_sim_gui_queue():
+    """
+    Queue two scans in the GUI and run them on the queue executor.
+    Successful if both items end up COMPLETE.
+    """
+    _check_simulated()
+    queue_widget = maia_gui.window.scan_control_widget.queue_widget
+    labels = [f"sim-{time.time():.0f}-{i}" for i in range(2)]
+    queue_widget.add_items(
+        [
+            (
+                label,
+                MaiaFlyDefinition(
+                    ystart=1.0, ystop=1.01, ypitch=0.01,
+                    xstart=2.0, xstop=2.05, xpitch=0.01,
+                    dwell=0.01, name=label, md=SampleMetadata(),
+                ),
+            )
+            for label in labels
+        ]
+    )
+    loop = QtCore.QEventLoop()
+    maia_gui.run_engine_controls.executor.finished.connect(loop.quit)
+    maia_gui.run_engine_controls.run()
+    loop.exec_()
+    for label in labels:
+        item = queue_widget.model._labels[label]
+        assert item.status is RequestStatus.COMPLETE, (label, item.status)
+    print("Simulated GUI queue complete")
+
+
+def test_sim_beam_dump():
+    """
+    Dump the simulated beam in the middle of a fly scan.
+    Successful if the scan suspends, finishes every row once the beam is
+    back and its run is recorded as interrupted.
+    """
+    _check_simulated()
+    interruptions = beam_outages.interruptions
+    beam_current.beam_dump(duration=20, delay=20)
+    (uid,) = RE(
+        fly_maia(
+            ystart=1.0,
+            ystop=1.1,
+            ypitch=0.01,
+            xstart=2.0,
+            xstop=2.3,
+            xpitch=0.01,
+            dwell=0.05,
+            hf_stage=M,
+            maia=maia,
+            outline="off",
+        )
+    )
+    assert beam_outages.interruptions == interruptions + 1
+    assert uid in beam_outages.interrupted_runs
+    progress = db[uid].table("fly_progress")
+    assert progress["fly_progress_row"].max() == 10, progress
+    beam_outage_report()
+    print("Simulated beam dump complete")
+
+
+def test_sim_resume_fly_maia():
+    """
+    Pause a fly scan part way, stop it and finish it with resume_fly_maia.
+    Successful if the resumed run scans exactly the rows that were left.
+    """
+    _check_simulated()
+    threading.Timer(2.0, RE.request_pause).start()
+    try:
+        RE(
+            fly_maia(
+                ystart=1.0,
+                ystop=1.1,
+                ypitch=0.01,
+                xstart=2.0,
+                xstop=2.3,
+                xpitch=0.01,
+                dwell=0.05,
+                hf_stage=M,
+                maia=maia,
+                outline="off",
+            )
+        )
+    except RunEngineInterrupted:
+        RE.stop()
+    uid = db[-1].start["uid"]
+    next_row = fly_maia_next_row(db[uid])
+    (resumed,) = RE(resume_fly_maia(uid, outline="off"))
+    rows = db[resumed].table("fly_progress")["fly_progress_row"]
+    assert list(rows) == list(range(next_row, 11)), list(rows)
+    assert db[resumed].start["resumed_from"] == uid
+    print("Simulated resume complete")
+
+
+def test_sim_microscope_stream():
+    """
+    Show the simulated microscope camera for a few seconds.
+    Successful if frames are shown and the latency report is printed.
+    """
+    _check_simulated()
+    stream = maia_gui.window.microscope_view_widget.stream
+    shown = stream.shown
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(3000, loop.quit)
+    loop.exec_()
+    report = stream.latency_report()
+    assert report["shown"] > shown, report
+    print("Simulated microscope stream complete")
+
+
+def test_sim_microscope_regions():
+    """
+    Drag two regions on the microscope view and add them to the queue.
+    Successful if both are queued as fly scans over the dragged stage area.
+    """
+    _check_simulated()
+    window = maia_gui.window
+    overlay = window.microscope_view_widget.overlay
+    window.scan_setup_widget.step_size_input.setText("0.01")
+    window.scan_setup_widget.dwell_input.setText("0.01")
+    window.scan_setup_widget.scan_name_input.setText(f"sim-{time.time():.0f}")
+    overlay.set_mode("select")
+    bx, by = overlay.beam_position()
+    beam = QtCore.QPoint(int(bx), int(by))
+    overlay.add_region(beam, beam + QtCore.QPoint(50, -20))
+    overlay.add_region(beam - QtCore.QPoint(80, 40), beam - QtCore.QPoint(20, 10))
+    regions = list(overlay.regions)
+    queue_widget = window.scan_control_widget.queue_widget
+    n = len(queue_widget.model.get_items())
+    window.add_scan_regions(regions)
+    items = queue_widget.model.get_items()[n:]
+    assert len(items) == 2 and not overlay.regions, items
+    for item, (xstart, xstop, ystart, ystop) in zip(items, regions):
+        assert (item.data.xstart, item.data.xstop) == (xstart, xstop), item
+        assert (item.data.ystart, item.data.ystop) == (ystart, ystop), item
+        queue_widget.list_model.remove_item(queue_widget.model.row_of(item))
+    overlay.set_mode("off")
+    print("Simulated microscope regions complete")
+
+
+def test_sim_nudge():
+    """
+    Click a nudge button five times in a row.
+    Successful if the clicks end up as at most two moves and the stage
+    lands five nudges away without the GUI blocking.
+    """
+    _check_simulated()
+    sample_control = maia_gui.window.sample_control_widget
+    sample_control.nudge_amount_spin_box.setValue(0.01)
+    start = M.x.position
+    moves = []
+    sample_control.motion.started.connect(moves.append)
+    for _ in range(5):
+        sample_control.nudge("right")
+    loop = QtCore.QEventLoop()
+    while sample_control.motion.busy:
+        QtCore.QTimer.singleShot(50, loop.quit)
+        loop.exec_()
+    sample_control.motion.started.disconnect(moves.append)
+    assert len(moves) <= 2, moves
+    assert abs(M.x.position - (start + 0.05)) < 1e-6, M.x.position
+    print("Simulated nudge complete")
@@ -0,0 +1,338 @@
+# Plan overhead benchmarks, run against the simulated devices
+# Start the profile with MAIA_SIMULATE=1 (MAIA_SIM_TIME_SCALE=1 for real
+# motion times), then from IPython
+# %run -i ~/.ipython/profile_collection/benchmarks/plan_overhead.py
+# results = run_plan_benchmarks()
+# compare_benchmarks()
+#
+# Each run appends one JSON line per case to BENCHMARK_RESULTS, tagged
+# with the git commit of the profile, so runs from different commits can
+# be compared with compare_benchmarks().
+
+import datetime
+import json
+import os
+import subprocess
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+try:
+    BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    BENCHMARK_DIR = os.getcwd()
+
+BENCHMARK_RESULTS = os.environ.get(
+    "MAIA_BENCHMARK_RESULTS", os.path.join(BENCHMARK_DIR, "results.jsonl")
+)
+
+# (xsize, ysize) in mm, pitch in mm and dwell in s of the fly scan grid
+BENCHMARK_MAP_SIZES = [(0.05, 0.02), (0.2, 0.05)]
+BENCHMARK_PITCH = 0.01
+BENCHMARK_DWELLS = [0.001, 0.01]
+# where the benchmark maps are put, away from 0 so backlash moves stay positive
+BENCHMARK_ORIGIN = (2.0, 1.0)
+
+# messages after which the next phase of a fly scan starts
+PHASE_STARTS = {
+    "open_run": "prepare",
+    "kickoff": "rows",
+    "complete": "cleanup",
+    # metadata reset and, in a batch, the set up of the next scan
+    "close_run": "post_run",
+}
+
+
+class PlanMessageRecorder:
+    """RE.msg_hook recording the time every message is processed at.
+
+    A message is charged with the time until the next one is processed,
+    which for blocking messages (wait, sleep, kickoff, ...) is the time
+    the RunEngine spent on it.  Time the plan itself spends between
+    messages (e.g. a time.sleep inside the generator) lands on the
+    message before it.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, msg):
+        self.records.append((time.monotonic(), msg.command))
+
+    def summary(self, t_end):
+        """Messages, put completions, phase and per-command wall times."""
+        times = [t for t, _ in self.records] + [t_end]
+        by_command = defaultdict(float)
+        phases = defaultdict(float)
+        phase = "setup"
+        for (t, command), t_next in zip(self.records, times[1:]):
+            phase = PHASE_STARTS.get(command, phase)
+            by_command[command] += t_next - t
+            phases[phase] += t_next - t
+        counts = Counter(command for _, command in self.records)
+        return dict(
+            messages=len(self.records),
+            # every set is waited on, so each costs a put completion
+            put_completions=counts["set"],
+            waits=counts["wait"],
+            idle_time=by_command["sleep"],
+            phases=dict(phases),
+            time_by_command=dict(by_command),
+            counts=dict(counts),
+        )
+
+
+def _git_commit():
+    """(commit, dirty) of the profile collection, or (None, None)."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, text=True
+        ).strip()
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=BENCHMARK_DIR,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def _fly_case(xsize, ysize, pitch, dwell):
+    x0, y0 = BENCHMARK_ORIGIN
+    return dict(
+        ystart=y0, ystop=y0 + ysize, ypitch=pitch,
+        xstart=x0, xstop=x0 + xsize, xpitch=pitch,
+        dwell=dwell,
+    )
+
+
+def _fly_integration_time(p):
+    """Pixel time of a fly_maia map, the rest of the scan is overhead."""
+    est = estimate_fly_maia_times(**p)
+    return float((est["ynum"] + 1) * est["xnum"] * p["dwell"])
+
+
+def plan_benchmark_cases(map_sizes=None, dwells=None, pitch=None, fly_modes=("rows", "continuous")):
+    """The benchmark grid as a list of (plan name, params, plan factory, integration time)."""
+    map_sizes = map_sizes or BENCHMARK_MAP_SIZES
+    dwells = dwells or BENCHMARK_DWELLS
+    pitch = pitch or BENCHMARK_PITCH
+    x0, y0 = BENCHMARK_ORIGIN
+    cases = []
+    for (xsize, ysize) in map_sizes:
+        for dwell in dwells:
+            p = _fly_case(xsize, ysize, pitch, dwell)
+            for fly_mode in fly_modes:
+                cases.append((
+                    "fly_maia",
+                    dict(p, fly_mode=fly_mode),
+                    lambda p=p, fly_mode=fly_mode: fly_maia(
+                        **p, hf_stage=M, maia=maia, fly_mode=fly_mode
+                    ),
+                    _fly_integration_time(p),
+                ))
+
+            xnum = max(int(round(xsize / pitch)), 2)
+            ynum = max(int(round(ysize / pitch)), 2)
+            fs = dict(
+                ystart=y0, ystop=y0 + ysize, ynum=ynum,
+                xstart=x0, xstop=x0 + xsize, xnum=xnum,
+                dwell=dwell,
+            )
+            cases.append((
+                "fly_maia_finger_sync",
+                fs,
+                lambda fs=fs: fly_maia_finger_sync(**fs, shut_b=shutter, hf_stage=M),
+                ynum * (xnum - 1) * dwell,
+            ))
+
+            for name, plan in (("xscan", xscan), ("yscan", yscan)):
+                step = dict(start=x0 if name == "xscan" else y0, stop=None, step=pitch, dwell=dwell)
+                step["stop"] = step["start"] + xsize
+                cases.append((
+                    name,
+                    step,
+                    lambda plan=plan, step=step: plan(**step, confirm=False),
+                    # one dwell per point
+                    max(int(round(xsize / pitch)), 3) * dwell,
+                ))
+
+        # two scans of this size back to back through the spreadsheet path
+        p = _fly_case(xsize, ysize, pitch, dwells[0])
+        cases.append((
+            "Run_Multiple_Scans",
+            dict(p, n_scans=2),
+            lambda p=p: _run_multiple_scans_plan(p, 2),
+            2 * _fly_integration_time(p),
+        ))
+    return cases
+
+
+def _run_multiple_scans_plan(p, n_scans):
+    """Run_Multiple_Scans over a temporary spreadsheet of n_scans copies of p."""
+    rows = [
+        dict(
+            name=f"bench-{i}", serial="", info="benchmark", type="", owner="",
+            xstart=p["xstart"], xstop=p["xstop"], ystart=p["ystart"], ystop=p["ystop"],
+            pitch=p["xpitch"], dwell=p["dwell"],
+        )
+        for i in range(n_scans)
+    ]
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+        pd.DataFrame(rows).to_csv(f, index=False)
+    try:
+        yield from Run_Multiple_Scans(f.name)
+    finally:
+        os.unlink(f.name)
+
+
+def run_plan_benchmark(plan_name, params, plan_factory, integration_time):
+    """Run one benchmark case and return its result record."""
+    recorder = PlanMessageRecorder()
+    old_hook = RE.msg_hook
+    RE.msg_hook = recorder
+    t0 = time.monotonic()
+    try:
+        RE(plan_factory())
+    finally:
+        t_end = time.monotonic()
+        RE.msg_hook = old_hook
+    wall = t_end - t0
+    # simulated motion is sped up, so is the time spent crossing pixels
+    integration = integration_time / SIM_TIME_SCALE
+    n_scans = params.get("n_scans", 1)
+    record = dict(
+        plan=plan_name,
+        params=params,
+        n_scans=n_scans,
+        wall_time=wall,
+        integration_time=integration,
+        overhead=wall - integration,
+        overhead_per_scan=(wall - integration) / n_scans,
+    )
+    record.update(recorder.summary(t_end))
+    return record
+
+
+def run_plan_benchmarks(cases=None, *, plans=None, repeat=1, results_file=None):
+    """Run the benchmark grid against the simulated devices.
+
+    Parameters
+    ----------
+    cases : list, optional
+        As returned by plan_benchmark_cases, the default grid if None.
+    plans : list of str, optional
+        Only run the cases of these plans.
+    repeat : int, optional
+        Number of runs of every case.
+    results_file : str, optional
+        JSON lines file the records are appended to, BENCHMARK_RESULTS
+        by default.  Pass False to not write anything.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per run.
+    """
+    if not MAIA_SIMULATE:
+        raise RuntimeError("Benchmarks drive the stage, start the profile with MAIA_SIMULATE=1")
+    cases = cases or plan_benchmark_cases()
+    if plans is not None:
+        cases = [c for c in cases if c[0] in plans]
+    if results_file is None:
+        results_file = BENCHMARK_RESULTS
+    commit, dirty = _git_commit()
+    tag = dict(
+        timestamp=datetime.datetime.now().isoformat(timespec="seconds"),
+        commit=commit,
+        dirty=dirty,
+        sim_time_scale=SIM_TIME_SCALE,
+    )
+    records = []
+    for n, (plan_name, params, plan_factory, integration_time) in enumerate(cases * repeat):
+        print(f"benchmark {n + 1}/{len(cases) * repeat}: {plan_name} {params}")
+        record = dict(tag, **run_plan_benchmark(plan_name, params, plan_factory, integration_time))
+        records.append(record)
+        if results_file:
+            os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+            with open(results_file, "a") as f:
+                f.write(json.dumps(record) + "\n")
+    results = pd.DataFrame(records)
+    print_benchmark_summary(results)
+    return results
+
+
+def _case_key(df):
+    return df["plan"] + " " + df["params"].apply(
+        lambda p: ",".join(f"{k}={v}" for k, v in sorted(p.items()))
+    )
+
+
+def print_benchmark_summary(results):
+    """Table of the overhead, idle time and message counts per case."""
+    df = results.assign(case=_case_key(results))
+    phases = pd.DataFrame(list(df["phases"])).fillna(0.0).add_prefix("t_")
+    table = pd.concat(
+        [
+            df[["case", "wall_time", "overhead_per_scan", "idle_time", "messages", "put_completions"]],
+            phases,
+        ],
+        axis=1,
+    ).groupby("case").mean()
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(table.round(3))
+
+
+def load_benchmarks(results_file=None):
+    """All recorded benchmark runs as a DataFrame."""
+    with open(results_file or BENCHMARK_RESULTS) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare_benchmarks(baseline=None, current=None, *, results_file=None, threshold=0.1, min_change=0.05):
+    """Compare the per-scan overhead of two commits.
+
+    Parameters
+    ----------
+    baseline, current : str, optional
+        Commits to compare, by default the last two commits with results.
+        Only runs with the same sim_time_scale are compared.
+    threshold : float, optional
+        Relative increase of the mean overhead flagged as a regression.
+    min_change : float, optional
+        Absolute increase in s below which changes are ignored.
+
+    Returns
+    -------
+    pd.DataFrame
+        Mean overhead per case for both commits, the change and a
+        'regression' flag.
+    """
+    df = load_benchmarks(results_file)
+    df["case"] = _case_key(df)
+    commits = list(dict.fromkeys(df["commit"]))
+    if current is None:
+        current = commits[-1]
+    if baseline is None:
+        earlier = commits[: commits.index(current)]
+        if not earlier:
+            raise ValueError(f"No results recorded before {current}")
+        baseline = earlier[-1]
+    scale = df.loc[df["commit"] == current, "sim_time_scale"].iloc[-1]
+    df = df[df["sim_time_scale"] == scale]
+    overhead = df.groupby(["case", "commit"])["overhead_per_scan"].mean().unstack()
+    table = pd.DataFrame({"baseline": overhead[baseline], "current": overhead[current]}).dropna()
+    table["change"] = table["current"] - table["baseline"]
+    table["regression"] = (table["change"] > min_change) & (
+        table["change"] > threshold * table["baseline"].abs()
+    )
+    print(f"Per-scan overhead in s, {baseline} -> {current} (sim_time_scale={scale})")
+    with pd.option_context("display.width", 200, "display.max_colwidth", 80):
+        print(table.round(3))
+    n = int(table["regression"].sum())
+    if n:
+        print(f"{n} case(s) got slower by more than {threshold:.0%}")
+    return table
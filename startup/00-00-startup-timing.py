@@ -0,0 +1,384 @@
+# Startup profiling, runs before every other startup file
+# Times each startup file as IPython runs it, the sections marked with
+# `with startup_timer.section(...)` inside them and, once the last
+# file has run, which devices created during startup are connected.
+# Set MAIA_STARTUP_CONNECT_WAIT to a time in s to wait up to that long
+# for them and time each connection instead.  Set MAIA_STARTUP_PROFILE=1
+# to also split the time of each file into the time spent in imports
+# and in ophyd wait_for_connection calls, this hooks builtins.__import__
+# and the ophyd wait_for_connection methods until startup ends.  Each
+# startup is appended to MAIA_STARTUP_LOG as one JSON line and compared
+# with the startups before it, anything much slower than usual is
+# flagged in the report.  startup_report() prints the
+# report again, including what was built on first use since, and
+# startup_history() returns the logged startups.
+import atexit
+import builtins
+import datetime
+import glob
+import json
+import os
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from ophyd import Device, Signal
+from ophyd.ophydobj import OphydObject
+from ophyd.signal import EpicsSignalBase
+
+MAIA_STARTUP_LOG = os.environ.get(
+    "MAIA_STARTUP_LOG", os.path.expanduser("~/.maia_gui/startup.jsonl")
+)
+MAIA_STARTUP_CONNECT_WAIT = float(os.environ.get("MAIA_STARTUP_CONNECT_WAIT") or 0)
+MAIA_STARTUP_PROFILE = os.environ.get("MAIA_STARTUP_PROFILE", "0") not in ("", "0")
+
+
+def _profile_commit(path):
+    """Short git commit of the profile, with a + if it has local changes, or None."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=path, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=path,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if status.strip() else "")
+
+
+class StartupTimer:
+    """Wall, import and connection time of the startup files and devices.
+
+    Parameters
+    ----------
+    startup_files : list of str
+        The startup files in the order IPython runs them, the report is
+        printed after the last one.
+    log : str, optional
+        JSON lines file every startup is appended to and compared with.
+        Nothing is logged if None.
+    profile : bool, optional
+        Also time the imports and ophyd connections of each file, by
+        hooking them for the duration of the startup.
+    """
+
+    def __init__(self, startup_files, log=None, profile=False):
+        self.t0 = time.monotonic()
+        self.startup_dir = os.path.dirname(startup_files[0]) if startup_files else None
+        self.last_file = os.path.basename(startup_files[-1]) if startup_files else None
+        self.log = log
+        self.profile = profile
+        self.total = None
+        self.current_file = None
+        self.files = []
+        self.sections = []
+        # top level ophyd objects created during startup, by name
+        self.devices = {}
+        self.connections = []
+        # sections run after startup, e.g. the GUI built on first use
+        self.deferred = []
+        self.regressions = []
+        self._thread = threading.get_ident()
+        self._depth = {"import": 0, "connect": 0}
+        self._spent = {"import": 0.0, "connect": 0.0}
+        self._originals = []
+        OphydObject.add_instantiation_callback(self._instantiated)
+
+    @property
+    def done(self):
+        return self.total is not None
+
+    def _instantiated(self, obj):
+        if not self.done and obj.parent is None and obj.name:
+            self.devices[obj.name] = (obj, self.current_file)
+
+    @contextmanager
+    def _timing(self, kind):
+        # only the outermost import or connection of the startup thread
+        # counts, nested ones are part of its time
+        if self.current_file is None or threading.get_ident() != self._thread or self._depth[kind]:
+            yield
+            return
+        self._depth[kind] += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self._depth[kind] -= 1
+            self._spent[kind] += time.monotonic() - t0
+
+    def _patch(self, owner, name, make_wrapper):
+        original = owner.__dict__[name]
+        self._originals.append((owner, name, original))
+        setattr(owner, name, make_wrapper(original))
+
+    def _install_hooks(self):
+        def timed_import(original):
+            def __import__(*args, **kwargs):
+                with self._timing("import"):
+                    return original(*args, **kwargs)
+            return __import__
+
+        def timed_connection(original):
+            def wait_for_connection(obj, *args, **kwargs):
+                with self._timing("connect"):
+                    return original(obj, *args, **kwargs)
+            return wait_for_connection
+
+        self._patch(builtins, "__import__", timed_import)
+        for cls in (Signal, EpicsSignalBase, Device):
+            self._patch(cls, "wait_for_connection", timed_connection)
+
+    def _remove_hooks(self):
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = []
+
+    def install(self, shell):
+        """Time the startup files run through shell.safe_execfile from now on."""
+        run = shell.safe_execfile
+        if self.profile:
+            self._install_hooks()
+            # in case startup never gets to the last file
+            atexit.register(self._remove_hooks)
+
+        def timed_execfile(fname, *args, **kwargs):
+            name = os.path.basename(fname)
+            self.current_file = name
+            self._spent = {"import": 0.0, "connect": 0.0}
+            t0 = time.monotonic()
+            ok = False
+            try:
+                run(fname, *args, **kwargs)
+                ok = True
+            finally:
+                self.files.append({
+                    "file": name,
+                    "time": time.monotonic() - t0,
+                    "import_time": self._spent["import"] if self.profile else None,
+                    "connect_time": self._spent["connect"] if self.profile else None,
+                    "ok": ok,
+                })
+                self.current_file = None
+                if not ok or name == self.last_file:
+                    # back to the IPython method for %run
+                    del shell.safe_execfile
+                    self._remove_hooks()
+                    self.finish(shell.user_ns, connect_timeout=MAIA_STARTUP_CONNECT_WAIT)
+
+        shell.safe_execfile = timed_execfile
+
+    @contextmanager
+    def section(self, name):
+        """Time a part of a startup file, or something built on first use after startup."""
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            record = {"file": self.current_file, "section": name, "time": time.monotonic() - t0}
+            if self.done:
+                self.deferred.append(record)
+                print(f"{name} built in {record['time']:.2f} s")
+            else:
+                self.sections.append(record)
+
+    def connect_devices(self, timeout=0.0):
+        """Record which devices created during startup are connected.
+
+        With a ``timeout`` in s, wait up to that long in all for them to
+        connect and time each one, otherwise only look without waiting.
+        """
+        deadline = time.monotonic() + timeout
+        for name, (device, file) in self.devices.items():
+            if not hasattr(device, "wait_for_connection"):
+                continue
+            if timeout <= 0:
+                self.connections.append(
+                    {"device": name, "file": file, "time": None, "error": None,
+                     "connected": device.connected}
+                )
+                continue
+            t0 = time.monotonic()
+            error = None
+            try:
+                device.wait_for_connection(timeout=max(deadline - t0, 0.01))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            self.connections.append(
+                {"device": name, "file": file, "time": time.monotonic() - t0, "error": error,
+                 "connected": error is None}
+            )
+
+    def finish(self, namespace, connect_timeout=0.0):
+        """End of startup, check the device connections, log and report.
+
+        Only the devices left in ``namespace`` are kept, not the ones
+        made by imported modules.  See connect_devices for ``connect_timeout``.
+        """
+        in_namespace = {id(value) for value in namespace.values()}
+        self.devices = {
+            name: (device, file)
+            for name, (device, file) in self.devices.items()
+            if id(device) in in_namespace
+        }
+        self.connect_devices(connect_timeout)
+        self.total = time.monotonic() - self.t0
+        record = self.record(
+            simulate=bool(namespace.get("MAIA_SIMULATE", False)),
+            lazy=bool(namespace.get("MAIA_LAZY_STARTUP", False)),
+            connect_wait=connect_timeout,
+        )
+        if self.log is not None:
+            history = load_startup_log(self.log)
+            self.regressions = startup_regressions(record, history)
+            record["regressions"] = self.regressions
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.log)), exist_ok=True)
+                with open(self.log, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Could not write the startup log {self.log}: {e}")
+        self.report()
+
+    def record(self, **tags):
+        """This startup as one log record."""
+        return dict(
+            timestamp=datetime.datetime.now().isoformat(timespec="seconds"),
+            commit=_profile_commit(self.startup_dir) if self.startup_dir else None,
+            **tags,
+            total=self.total,
+            files=self.files,
+            sections=self.sections,
+            devices=self.connections,
+        )
+
+    def report(self):
+        if self.total is None:
+            print(f"Startup running for {time.monotonic() - self.t0:.2f} s")
+        else:
+            print(f"Startup took {self.total:.2f} s")
+        if self.profile:
+            print(f"  {'':<28}{'total':>9}{'imports':>10}{'connect':>10}")
+        for record in self.files:
+            status = "" if record["ok"] else "  FAILED"
+            split = ""
+            if record["import_time"] is not None:
+                split = f"{record['import_time']:8.2f} s{record['connect_time']:8.2f} s"
+            print(f"  {record['file']:<28}{record['time']:8.2f} s{split}{status}")
+            for section in self.sections:
+                if section["file"] == record["file"]:
+                    print(f"    {section['section']:<26}{section['time']:8.2f} s")
+        timed = [r for r in self.connections if r["time"] is not None]
+        if timed:
+            print("Device connections")
+            for record in sorted(timed, key=lambda r: -r["time"]):
+                status = "" if record["error"] is None else f"  {record['error']}"
+                print(f"  {record['device']:<28}{record['time']:8.2f} s  {record['file']}{status}")
+        elif self.connections:
+            waiting = [r["device"] for r in self.connections if not r["connected"]]
+            print(
+                f"{len(self.connections) - len(waiting)} of {len(self.connections)} devices "
+                "connected at the end of startup"
+            )
+            if waiting:
+                print(f"  not yet: {', '.join(waiting)}")
+        if self.deferred:
+            print("Built on first use")
+            for record in self.deferred:
+                print(f"  {record['section']:<28}{record['time']:8.2f} s")
+        if self.regressions:
+            print("Slower than usual")
+            for r in self.regressions:
+                print(f"  {r['key']:<28}{r['time']:8.2f} s, usually {r['usual']:.2f} s")
+
+
+def load_startup_log(path=None):
+    """All logged startups, oldest first."""
+    path = path or MAIA_STARTUP_LOG
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def startup_times(record):
+    """{key: time in s} of a startup record, its total, files, sections and devices."""
+    times = {"total": record["total"]}
+    for r in record["files"]:
+        times[r["file"]] = r["time"]
+        if r["import_time"] is not None:
+            times[f"{r['file']} imports"] = r["import_time"]
+            times[f"{r['file']} connect"] = r["connect_time"]
+    for r in record["sections"]:
+        times[f"{r['file']}: {r['section']}"] = r["time"]
+    for r in record["devices"]:
+        if r["time"] is not None:
+            times[f"device {r['device']}"] = r["time"]
+    return times
+
+
+def startup_regressions(record, history, *, last=5, threshold=0.5, min_change=0.5):
+    """Parts of a startup much slower than in the startups before it.
+
+    Each time is compared with its median over the last ``last``
+    successful startups of the same mode (simulated, lazy and connection wait), and
+    flagged if it is more than ``threshold`` (relative) and ``min_change``
+    s over it.
+    """
+    previous = [
+        r for r in history
+        if r["simulate"] == record["simulate"]
+        and r["lazy"] == record["lazy"]
+        and r.get("connect_wait") == record["connect_wait"]
+        and all(f["ok"] for f in r["files"])
+    ][-last:]
+    if not previous:
+        return []
+    past = [startup_times(r) for r in previous]
+    regressions = []
+    for key, t in startup_times(record).items():
+        values = [times[key] for times in past if key in times]
+        if not values:
+            continue
+        usual = statistics.median(values)
+        if t - usual > min_change and t - usual > threshold * usual:
+            regressions.append({"key": key, "time": t, "usual": usual})
+    return regressions
+
+
+def startup_history(path=None):
+    """Logged startups as a DataFrame, one row per startup and a column per file, section and device."""
+    import pandas as pd
+
+    records = load_startup_log(path)
+    return pd.DataFrame(
+        [startup_times(r) for r in records],
+        index=pd.to_datetime([r["timestamp"] for r in records]),
+    ).assign(
+        commit=[r["commit"] for r in records],
+        simulate=[r["simulate"] for r in records],
+        lazy=[r["lazy"] for r in records],
+        connect_wait=[r.get("connect_wait") for r in records],
+    )
+
+
+def startup_report():
+    startup_timer.report()
+
+
+try:
+    startup_timer
+except NameError:
+    startup_timer = StartupTimer(
+        sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))),
+        log=MAIA_STARTUP_LOG,
+        profile=MAIA_STARTUP_PROFILE,
+    )
+    if get_ipython() is not None:
+        startup_timer.install(get_ipython())
@@ -1,34 +1,56 @@
 from ophyd import EpicsSignal
 from bluesky.suspenders import SuspendFloor
+import os
 import sys
 import nslsii
 import builtins
 
-nslsii.configure_base(
-  get_ipython().user_ns, 
-  'xfm',
-  publish_documents_with_kafka=True
-
-  )
-import redis
-from redis_json_dict import RedisJSONDict
-
-uri = "info.xfm.nsls2.bnl.gov"
-# Provide an endstation prefix, if needed, with a trailing "-"
-new_md = RedisJSONDict(redis.Redis(uri), prefix="maia")
-#BEAMLINE_ID = 'xfm'
-
-nslsii.configure_olog(get_ipython().user_ns)
-
-#Optional: set any metadata that rarely changes.
-#RE.md['beamline_id'] = 'XFM'
-RE.md = new_md
+# Set MAIA_SIMULATE=1 to run the profile against the simulated devices
+# in 05-sim-devices.py, without Kafka, Redis or olog.
+MAIA_SIMULATE = os.environ.get("MAIA_SIMULATE", "0") not in ("", "0")
+# Set MAIA_LAZY_STARTUP=1 for a quick restart: the GUI and the MAIA
+# device are built on first use.  Kafka, Redis and olog still connect
+# here, the RunEngine needs them before the first plan.
+MAIA_LAZY_STARTUP = os.environ.get("MAIA_LAZY_STARTUP", "0") not in ("", "0")
+
+if MAIA_SIMULATE:
+    from databroker import Broker
+
+    with startup_timer.section("databroker"):
+        nslsii.configure_base(
+          get_ipython().user_ns,
+          Broker.named("temp"),
+          publish_documents_with_kafka=False
+          )
+else:
+    with startup_timer.section("databroker, kafka"):
+        nslsii.configure_base(
+          get_ipython().user_ns, 
+          'xfm',
+          publish_documents_with_kafka=True
+
+          )
+    import redis
+    from redis_json_dict import RedisJSONDict
+
+    uri = "info.xfm.nsls2.bnl.gov"
+    # Provide an endstation prefix, if needed, with a trailing "-"
+    with startup_timer.section("redis"):
+        new_md = RedisJSONDict(redis.Redis(uri), prefix="maia")
+    #BEAMLINE_ID = 'xfm'
+
+    with startup_timer.section("olog"):
+        nslsii.configure_olog(get_ipython().user_ns)
+
+    #Optional: set any metadata that rarely changes.
+    #RE.md['beamline_id'] = 'XFM'
+    RE.md = new_md
 
 #beam_current = EpicsSignal('XF:04BM-ES:2{Sclr:1}scaler1.s4')
-beam_current = EpicsSignal('SR:OPS-BI{DCCT:1}I:Real-I')
+if not MAIA_SIMULATE:
+    beam_current = EpicsSignal('SR:OPS-BI{DCCT:1}I:Real-I')
 
-#sus = SuspendFloor(beam_current,395,resume_thresh=400)
-#RE.install_suspender(sus)
+# the beam current suspender is installed in 45-beam-policy.py
 get_ipython().run_line_magic("matplotlib", "qt")
 
 
@@ -0,0 +1,379 @@
+import io
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from ophyd import Component as Cpt, Device, Signal
+from ophyd.positioner import PositionerBase
+from ophyd.status import DeviceStatus
+from ophyd.status import wait as status_wait
+
+# Simulated stand-ins for the beamline hardware, selected with the
+# MAIA_SIMULATE environment variable (see 00-base.py).  They model the
+# timing of the real devices closely enough to run and benchmark the
+# plans and the GUI without beam.
+
+# Speed up simulated motion and actuation, e.g. 10 for CI
+SIM_TIME_SCALE = float(os.environ.get("MAIA_SIM_TIME_SCALE", 1))
+
+
+def sim_trapezoid(distance, velocity, accl, t):
+    """Distance covered t s into a trapezoidal move.
+
+    ``accl`` is the EpicsMotor ACCL, the time to reach ``velocity``.
+    Short moves that never reach full speed are triangular.
+
+    Returns
+    -------
+    s : float
+        Distance covered.
+    done : bool
+        Whether the move is finished.
+    """
+    accl = max(accl, 1e-6)
+    a = velocity / accl
+    if distance >= velocity * accl:
+        t_ramp = accl
+        t_total = distance / velocity + accl
+    else:
+        t_ramp = math.sqrt(distance / a)
+        t_total = 2 * t_ramp
+    if t >= t_total:
+        return distance, True
+    if t < t_ramp:
+        return 0.5 * a * t**2, False
+    if t > t_total - t_ramp:
+        return distance - 0.5 * a * (t_total - t) ** 2, False
+    return 0.5 * a * t_ramp**2 + a * t_ramp * (t - t_ramp), False
+
+
+class SimMotor(Device, PositionerBase):
+    """EpicsMotor look-alike with velocity, acceleration and settle time."""
+    user_readback = Cpt(Signal, value=0.0, kind="hinted")
+    user_setpoint = Cpt(Signal, value=0.0, kind="normal")
+    velocity = Cpt(Signal, value=1.0, kind="config")
+    acceleration = Cpt(Signal, value=0.2, kind="config")
+    motor_is_moving = Cpt(Signal, value=0, kind="omitted")
+
+    def __init__(
+        self,
+        prefix="",
+        *,
+        name,
+        limits=(0, 0),
+        settle_time=0.05,
+        latency=0.02,
+        update_period=0.02,
+        **kwargs,
+    ):
+        super().__init__(prefix, name=name, settle_time=settle_time, **kwargs)
+        # like EpicsMotor, the readback carries the motor name
+        self.user_readback.name = self.name
+        self._limits = tuple(limits)
+        self.latency = latency
+        self.update_period = update_period
+        self._stop_requested = threading.Event()
+        self._stop_success = False
+        self._position = self.user_readback.get()
+
+    @property
+    def limits(self):
+        return self._limits
+
+    @property
+    def egu(self):
+        return "mm"
+
+    def move(self, position, wait=True, **kwargs):
+        self._stop_requested.clear()
+        status = super().move(position, **kwargs)
+        self.user_setpoint.put(position)
+        threading.Thread(
+            target=self._run_move, args=(self.position, position), daemon=True
+        ).start()
+        if wait:
+            status_wait(status)
+        return status
+
+    def _run_move(self, start, target):
+        distance = target - start
+        direction = math.copysign(1, distance)
+        velocity = max(abs(self.velocity.get()), 1e-9)
+        accl = self.acceleration.get()
+        time.sleep(self.latency / SIM_TIME_SCALE)
+        self.motor_is_moving.put(1)
+        t0 = time.monotonic()
+        success = True
+        while True:
+            if self._stop_requested.is_set():
+                success = self._stop_success
+                break
+            t = (time.monotonic() - t0) * SIM_TIME_SCALE
+            s, done = sim_trapezoid(abs(distance), velocity, accl, t)
+            position = start + direction * s
+            self.user_readback.put(position)
+            self._set_position(position)
+            if done:
+                break
+            time.sleep(self.update_period)
+        self.motor_is_moving.put(0)
+        self._done_moving(success=success)
+
+    def stop(self, *, success=False):
+        # like EpicsMotor, a stop with success=True (e.g. on suspend)
+        # completes the move status instead of failing it
+        self._stop_success = success
+        self._stop_requested.set()
+
+
+class SimMaiaStage(Device):
+    x = Cpt(SimMotor, "x")
+    y = Cpt(SimMotor, "y")
+    z = Cpt(SimMotor, "z")
+    r = Cpt(SimMotor, "r")
+
+
+class SimTwoButtonShutter(Device):
+    """TwoButtonShutter look-alike whose actuation takes time and can fail.
+
+    Each attempt takes ``actuation_time`` s and fails with probability
+    ``failure_rate``, up to MAX_ATTEMPTS; ``attempts`` holds the count
+    of the last set.
+    """
+    RETRY_PERIOD = 0.5
+    MAX_ATTEMPTS = 10
+    open_str = "Open"
+    close_str = "Close"
+    open_val = "Open"
+    close_val = "Not Open"
+
+    status = Cpt(Signal, value="Not Open", kind="normal")
+
+    def __init__(self, prefix="", *, name, actuation_time=1.0, failure_rate=0.0, **kwargs):
+        super().__init__(prefix, name=name, **kwargs)
+        self.actuation_time = actuation_time
+        self.failure_rate = failure_rate
+        self.attempts = 0
+
+    def set(self, val):
+        target = {self.open_str: self.open_val, self.close_str: self.close_val}[val]
+        st = DeviceStatus(self)
+        self.attempts = 0
+        if self.status.get() == target:
+            st._finished()
+            return st
+
+        def actuate():
+            for self.attempts in range(1, self.MAX_ATTEMPTS + 1):
+                time.sleep(self.actuation_time / SIM_TIME_SCALE)
+                if random.random() >= self.failure_rate:
+                    self.status.put(target)
+                    st._finished()
+                    return
+                time.sleep(self.RETRY_PERIOD / SIM_TIME_SCALE)
+            st._finished(success=False)
+
+        threading.Thread(target=actuate, daemon=True).start()
+        return st
+
+
+class SimBeamCurrent(Signal):
+    """Ring current in mA that can be dumped on demand.
+
+    ``beam_dump`` drops the current to 0 for ``duration`` s, optionally
+    after ``delay`` s, to exercise the beam suspender in the middle of a
+    scan.  Both times are sped up by SIM_TIME_SCALE.
+    """
+
+    def __init__(self, *, name, nominal=400.0, **kwargs):
+        super().__init__(name=name, value=nominal, **kwargs)
+        self.nominal = nominal
+
+    def beam_dump(self, duration=60.0, delay=0.0):
+        def dump():
+            self.put(0.0)
+            threading.Timer(duration / SIM_TIME_SCALE, self.put, args=(self.nominal,)).start()
+
+        threading.Timer(delay / SIM_TIME_SCALE, dump).start()
+
+
+class SimMaiaRecord(Device):
+    value = Cpt(Signal, value="")
+
+
+class SimMAIA(Device):
+    """The parts of nslsii.detectors.maia.MAIA used by the fly plans.
+
+    kickoff/complete finish when ``blog_discard_mon`` drops to 0/rises
+    to 1, as on the real detector, after ``run_delay`` s.
+    """
+    blog_discard_mon = Cpt(SimMaiaRecord, "")
+    blog_group_next_sp = Cpt(SimMaiaRecord, "")
+    newrun_cmd = Cpt(SimMaiaRecord, "")
+    endrun_cmd = Cpt(SimMaiaRecord, "")
+    pixel_enable_cmd = Cpt(SimMaiaRecord, "")
+    pixel_event_enable_cmd = Cpt(SimMaiaRecord, "")
+    photon_enable_sp = Cpt(SimMaiaRecord, "")
+    enc_axis_0_pos_sp = Cpt(SimMaiaRecord, "")
+    enc_axis_1_pos_sp = Cpt(SimMaiaRecord, "")
+    x_pixel_dim_origin_sp = Cpt(SimMaiaRecord, "")
+    y_pixel_dim_origin_sp = Cpt(SimMaiaRecord, "")
+    x_pixel_dim_pitch_sp = Cpt(SimMaiaRecord, "")
+    y_pixel_dim_pitch_sp = Cpt(SimMaiaRecord, "")
+    x_pixel_dim_coord_extent_sp = Cpt(SimMaiaRecord, "")
+    y_pixel_dim_coord_extent_sp = Cpt(SimMaiaRecord, "")
+    scan_order_sp = Cpt(SimMaiaRecord, "")
+    pixel_dwell = Cpt(SimMaiaRecord, "")
+    meta_val_beam_energy_sp = Cpt(SimMaiaRecord, "")
+    meta_val_beam_particle_sp = Cpt(SimMaiaRecord, "")
+    meta_val_sample_info_sp = Cpt(SimMaiaRecord, "")
+    meta_val_sample_name_sp = Cpt(SimMaiaRecord, "")
+    meta_val_sample_owner_sp = Cpt(SimMaiaRecord, "")
+    meta_val_sample_serial_sp = Cpt(SimMaiaRecord, "")
+    meta_val_sample_type_sp = Cpt(SimMaiaRecord, "")
+    meta_val_scan_crossref_sp = Cpt(SimMaiaRecord, "")
+    meta_val_scan_dwell = Cpt(SimMaiaRecord, "")
+    meta_val_scan_info_sp = Cpt(SimMaiaRecord, "")
+    meta_val_scan_order_sp = Cpt(SimMaiaRecord, "")
+    meta_val_scan_region_sp = Cpt(SimMaiaRecord, "")
+    meta_val_scan_seq_num_sp = Cpt(SimMaiaRecord, "")
+    meta_val_scan_seq_total_sp = Cpt(SimMaiaRecord, "")
+
+    def __init__(self, prefix="", *, name, run_delay=0.5, **kwargs):
+        super().__init__(prefix, name=name, **kwargs)
+        self.run_delay = run_delay
+        self._run_numbers = itertools.count(1)
+        self.run_number = 0
+        self.blog_discard_mon.value.put(1)
+
+    def _set_discard(self, value):
+        st = DeviceStatus(self)
+
+        def finish():
+            self.blog_discard_mon.value.put(value)
+            st._finished()
+
+        threading.Timer(self.run_delay / SIM_TIME_SCALE, finish).start()
+        return st
+
+    def kickoff(self):
+        self.pixel_enable_cmd.value.put(1)
+        self.pixel_event_enable_cmd.value.put(1)
+        self.photon_enable_sp.value.put(1)
+        self.newrun_cmd.value.put("1")
+        self.run_number = next(self._run_numbers)
+        return self._set_discard(0)
+
+    def complete(self):
+        self.endrun_cmd.value.put("1")
+        return self._set_discard(1)
+
+    def row_counts(self, row):
+        """Counts of every pixel of a finished raster row, in scan order.
+
+        The sample is a grid of 50 um features, wherever the map is, with
+        Poisson noise for the pixel dwell.  Odd rows are scanned
+        backwards.
+        """
+        xnum = int(self.x_pixel_dim_coord_extent_sp.value.get())
+        x = self.x_pixel_dim_origin_sp.value.get() + (np.arange(xnum) + 0.5) * self.x_pixel_dim_pitch_sp.value.get()
+        y = self.y_pixel_dim_origin_sp.value.get() + (row + 0.5) * self.y_pixel_dim_pitch_sp.value.get()
+        rate = 1e4 * (1.2 + np.sin(2 * np.pi * x / 0.05) * np.cos(2 * np.pi * y / 0.05))
+        counts = np.random.poisson(rate * float(self.pixel_dwell.value.get())).astype(float)
+        return counts[::-1] if row % 2 else counts
+
+    def collect(self):
+        now = time.time()
+        data = {
+            f"{self.name}_blogd_data_path": "/sim/maia",
+            f"{self.name}_run_number": self.run_number,
+        }
+        yield {
+            "data": data,
+            "timestamps": {k: now for k in data},
+            "time": now,
+            "seq_num": 0,
+        }
+
+    def describe_collect(self):
+        source = "SIM:MAIA"
+        return {
+            "primary": {
+                f"{self.name}_blogd_data_path": {"source": source, "dtype": "string", "shape": []},
+                f"{self.name}_run_number": {"source": source, "dtype": "integer", "shape": []},
+            }
+        }
+
+
+class SimMjpegCamera:
+    """Local MJPEG server standing in for the microscope camera.
+
+    Serves a moving test pattern as multipart/x-mixed-replace at ``fps``
+    (or the ``fps`` query of the request, as the Axis cameras do) on
+    ``url``.  Frames carry their frame number, so dropped frames are
+    visible.  Needs Pillow, which qmicroscope brings along.
+    """
+
+    BOUNDARY = "frame"
+
+    def __init__(self, *, fps=30, size=(640, 480), nframes=60, port=0):
+        from PIL import Image, ImageDraw
+
+        self.fps = fps
+        self.frames = []
+        width, height = size
+        for n in range(nframes):
+            image = Image.new("RGB", size, (40, 40, 40))
+            draw = ImageDraw.Draw(image)
+            x = int(width * n / nframes)
+            draw.rectangle([x, 0, x + width // 10, height], fill=(200, 200, 80))
+            draw.text((10, 10), f"frame {n}", fill=(255, 255, 255))
+            buf = io.BytesIO()
+            image.save(buf, format="JPEG", quality=80)
+            self.frames.append(buf.getvalue())
+        camera = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = dict(
+                    kv.split("=", 1) for kv in self.path.partition("?")[2].split("&") if "=" in kv
+                )
+                period = 1 / float(query.get("fps", camera.fps))
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", f"multipart/x-mixed-replace; boundary={camera.BOUNDARY}"
+                )
+                self.end_headers()
+                try:
+                    for n in itertools.count():
+                        frame = camera.frames[n % len(camera.frames)]
+                        self.wfile.write(
+                            f"--{camera.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                            f"Content-Length: {len(frame)}\r\n\r\n".encode()
+                            + frame
+                            + b"\r\n"
+                        )
+                        time.sleep(period)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/mjpg/1/video.mjpg".format(self.server.server_address[1])
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
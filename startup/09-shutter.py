@@ -1,5 +1,7 @@
-from nslsii.devices import TwoButtonShutter
+if MAIA_SIMULATE:
+    shutter = SimTwoButtonShutter("XF:04BMB-PPS{Sh:A}", name="shutter")
+else:
+    from nslsii.devices import TwoButtonShutter
 
-
-shutter = TwoButtonShutter("XF:04BMB-PPS{Sh:A}", name="shutter")
+    shutter = TwoButtonShutter("XF:04BMB-PPS{Sh:A}", name="shutter")
 shutter.MAX_ATTEMPTS = 20
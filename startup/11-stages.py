@@ -36,7 +36,10 @@ class MaiaStage(Device):
     z    = Cpt(EpicsMotor, '{PI180:1-Ax:MaiaZ}Mtr')
     r    = Cpt(EpicsMotor, '{SR50pp:1-Ax:MaiaR}Mtr')
 
-M = MaiaStage('XF:04BMC-ES:2', name='M')
+if MAIA_SIMULATE:
+    M = SimMaiaStage('XF:04BMC-ES:2', name='M')
+else:
+    M = MaiaStage('XF:04BMC-ES:2', name='M')
 M_x   = M.x
 M_y   = M.y
 M_z   = M.z
@@ -1,14 +1,77 @@
 #config_ophyd_logging(level='DEBUG')
-from nslsii.detectors.maia import MAIA
+import copy
+
+from ophyd import Component as Cpt, Device, Signal
+from ophyd.device import DynamicDeviceComponent
+
+
+def lazy_device_class(cls):
+    """Subclass of the Device ``cls`` whose components, and theirs, are made on first use."""
+    attrs = {}
+    for attr, cpt in cls._sig_attrs.items():
+        cpt = copy.copy(cpt)
+        cpt.lazy = True
+        if not isinstance(cpt, DynamicDeviceComponent) and issubclass(cpt.cls, Device):
+            cpt.cls = lazy_device_class(cpt.cls)
+        attrs[attr] = cpt
+    return type(f"Lazy{cls.__name__}", (cls,), attrs)
+
+
+if MAIA_SIMULATE:
+    maia = SimMAIA('XFM:MAIA', name='maia')
+else:
+    with startup_timer.section("MAIA device"):
+        from nslsii.detectors.maia import MAIA
+
+        # in a lazy startup the MAIA signals are made, and connected, the
+        # first time they are used instead of all of them here
+        maia_class = lazy_device_class(MAIA) if MAIA_LAZY_STARTUP else MAIA
+        maia = maia_class('XFM:MAIA', name='maia')
+
 
-maia = MAIA('XFM:MAIA', name='maia')
 import numpy as np
 
 import bluesky.plans as bp
 import bluesky.plan_stubs as bps
 import bluesky.preprocessors as bpp
+import math
 import socket
-#import time
+import time
+from dataclasses import dataclass
+
+
+class MaiaFlyProgress(Device):
+    """Soft signals read once per raster row into a 'fly_progress' stream."""
+    row = Cpt(Signal, value=0)
+    nrows = Cpt(Signal, value=0)
+    row_time = Cpt(Signal, value=0.0)
+    x_velocity = Cpt(Signal, value=0.0)
+    x_velocity_setpoint = Cpt(Signal, value=0.0)
+    pixel_rate = Cpt(Signal, value=0.0)
+    eta = Cpt(Signal, value=0.0)
+
+
+fly_progress = MaiaFlyProgress(name="fly_progress")
+
+
+class MaiaShutterLog(Device):
+    """Soft signals read into a 'shutter' stream for every shutter action of a scan."""
+    action = Cpt(Signal, value="")
+    actuation_time = Cpt(Signal, value=0.0)
+    # -1 if the shutter does not report its attempts
+    attempts = Cpt(Signal, value=0)
+
+
+shutter_log = MaiaShutterLog(name="shutter_log")
+
+
+class MaiaRowCounts(Device):
+    """Counts per pixel of the last raster row, in scan order, read into a 'maia_rows' stream."""
+    row = Cpt(Signal, value=0)
+    counts = Cpt(Signal, value=[])
+
+
+maia_rows = MaiaRowCounts(name="maia_rows")
 
 #HOST = '192.168.2.196'    # The remote host
 #PORT = 9001              # The same port as used by the server
@@ -38,12 +101,21 @@ import socket
     #print(val)
 #    return(val)
 
-def xscan(start, stop, step, dwell):
+def maia_motor_pitch(pitch, mres=0.0002, min_steps=2):
+    """Round a pitch down to a whole number of motor steps, at least ``min_steps``.
+
+    Works on scalars and arrays.  The quotient is nudged up by a small
+    tolerance first, a pitch which already is a multiple of ``mres``
+    would otherwise lose a step to float division (0.0098 / 0.0002 is
+    48.99999...).
+    """
+    steps = np.floor(np.asarray(pitch, dtype=float) / mres + 1e-6)
+    return np.maximum(steps, min_steps) * mres
+
+
+def xscan(start, stop, step, dwell, confirm=True):
     mres=0.0002
-    nxpitch=int(step/mres)
-    if(nxpitch<3): # Force minimum pitch to 3 motor steps
-        nxpitch=3
-    step=nxpitch*mres
+    step=float(maia_motor_pitch(step, mres, min_steps=3)) # Force minimum pitch to 3 motor steps
     print("Warning: I am forcing step to be an integer multiple of motor resolution: ", step);
     speed=step/dwell
     print("Speed=",speed)
@@ -61,7 +133,8 @@ def xscan(start, stop, step, dwell):
     yield from bps.mv(M.x.velocity, speed)
     print("set speed")
     print("Start=",start,"  Stop=",stop,"Step=",step,"   Speed=",speed)
-    input("Press any key if it's OK to continue")
+    if confirm:
+        input("Press any key if it's OK to continue")
     # Move to beginning of scan
     yield from bps.mv(M.x, start)
     for i in range(0,xnum):
@@ -73,12 +146,9 @@ def xscan(start, stop, step, dwell):
     #fout.close()
     yield from bps.mv(M.x, start)
 
-def yscan(start, stop, step, dwell):
+def yscan(start, stop, step, dwell, confirm=True):
     mres=0.0002
-    nxpitch=int(step/mres)
-    if(nxpitch<3): # Force minimum pitch to 3 motor steps
-        nxpitch=3
-    step=nxpitch*mres
+    step=float(maia_motor_pitch(step, mres, min_steps=3)) # Force minimum pitch to 3 motor steps
     print("Warning: I am forcing step to be an integer multiple of motor resolution: ", step);
     speed=abs(step/dwell)
     print("Speed=",speed)
@@ -98,7 +168,8 @@ def yscan(start, stop, step, dwell):
     yield from bps.mv(M.y.velocity, speed)
     print("set speed")
     print("Start=",start,"  Stop=",stop,"Step=",step,"   Speed=",speed)
-    input("Press any key if it's OK to continue")
+    if confirm:
+        input("Press any key if it's OK to continue")
     # Move to beginning of scan
     yield from bps.mv(M.y, start)
     for i in range(0,xnum):
@@ -113,6 +184,384 @@ def yscan(start, stop, step, dwell):
 sample_md = {"sample": {"name": "Ni mesh", "owner": "stolen"}}
 
 
+def _maia_value_matches(current, target):
+    """Return True if a MAIA readback already holds the target value."""
+    if isinstance(current, str) or isinstance(target, str):
+        return str(current) == str(target)
+    try:
+        return bool(np.isclose(current, target))
+    except TypeError:
+        return current == target
+
+
+def maia_mv_changed(targets, *, commands=(), label="maia"):
+    """Write a batch of MAIA setpoints as one concurrent ``bps.mv``.
+
+    Each put to the XFM:MAIA IOC waits for its own put completion, so
+    issuing them one at a time costs a round trip per signal.  Here the
+    current values of ``targets`` are read, signals which already hold
+    their target are dropped and the rest are set together with
+    ``commands`` and waited on as a single group.  ``commands`` are not
+    read.
+
+    Parameters
+    ----------
+    targets : list of (signal, value)
+        The setpoints to write and their target values.
+    commands : list of (signal, value), optional
+        Signals that act on every write, like the encoder syncs and the
+        next blog group.  They are always written, even with the same value.
+    label : str, optional
+        Prefix for the timing report.
+    """
+    t0 = time.monotonic()
+    args = []
+    for sig, val in targets:
+        current = yield from bps.rd(sig)
+        if not _maia_value_matches(current, val):
+            args += [sig, val]
+    for sig, val in commands:
+        args += [sig, val]
+    if args:
+        yield from bps.mv(*args)
+    print(
+        "{}: wrote {} of {} signals in {:.3f} s".format(
+            label, len(args) // 2, len(targets) + len(commands), time.monotonic() - t0
+        )
+    )
+
+
+def maia_serpentine_trajectory(xstart, xstop, ystart, ypitch, nrows):
+    """Precompute the serpentine raster as arrays of row targets.
+
+    Even rows run from ``xstart`` to ``xstop`` and odd rows back again,
+    so the x target of row i is the end of that row.
+
+    Returns
+    -------
+    y, x : np.ndarray
+        The y position of each row and the x position it finishes at.
+    """
+    rows = np.arange(nrows)
+    y = ystart + rows * ypitch
+    x = np.where(rows % 2, xstart, xstop)
+    return y, x
+
+
+def maia_row_overhead(overscan, spd_x, x_accl, y_step_time, fly_mode="rows"):
+    """Predicted dead time of one raster row in s.
+
+    This is the row time minus the time spent crossing pixels: the two
+    overscan segments, the x acceleration ramps (ACCL is the time to
+    reach speed, a trapezoidal move costs one ACCL extra) and, when the
+    y step is not overlapped with the x turnaround, the y step itself.
+    """
+    overhead = 2 * overscan / spd_x + x_accl
+    if fly_mode != "continuous":
+        overhead += y_step_time
+    return overhead
+
+
+# keep the shutter open between scans of a batch if the gap is shorter, in s
+SHUTTER_KEEP_OPEN_MAX_GAP = 30.0
+
+
+@dataclass
+class MaiaFlyWaits:
+    """Timeouts of the condition waits in fly_maia, in s.
+
+    ``outline_pause`` is the only fixed wait left, the time the stage
+    stays at the far corner of the scan in the 'fast' outline mode so
+    that it can be watched.
+    """
+    outline_pause: float = 0.5
+    shutter_timeout: float = 30.0
+    recording_timeout: float = 10.0
+    motion_timeout: float = 60.0
+    poll_period: float = 0.05
+
+
+def wait_until(signal, condition, *, timeout, label, report=None, poll_period=0.05, raise_on_timeout=True):
+    """Poll a signal until ``condition(value)`` is true.
+
+    Parameters
+    ----------
+    signal : Signal
+        Read with ``bps.rd`` every ``poll_period`` s.
+    condition : callable
+        Called with the signal value.
+    timeout : float
+        Give up after this many s.
+    label : str
+        Name of the wait in the report and error message.
+    report : list, optional
+        (label, seconds) of the wait is appended to it.
+    raise_on_timeout : bool, optional
+        Raise TimeoutError on timeout, otherwise print a warning and
+        carry on.
+
+    Returns
+    -------
+    float
+        The time waited in s.
+    """
+    t0 = time.monotonic()
+    while True:
+        value = yield from bps.rd(signal)
+        if condition(value):
+            break
+        if time.monotonic() - t0 > timeout:
+            msg = "{}: {} still {!r} after {} s".format(label, signal.name, value, timeout)
+            if raise_on_timeout:
+                raise TimeoutError(msg)
+            print("Warning:", msg)
+            break
+        yield from bps.sleep(poll_period)
+    elapsed = time.monotonic() - t0
+    if report is not None:
+        report.append((label, elapsed))
+    return elapsed
+
+
+def wait_motors_idle(motors, *, timeout, label="motors idle", report=None, poll_period=0.05, raise_on_timeout=True):
+    """Wait until none of the motors reports it is moving."""
+    t0 = time.monotonic()
+    for motor in motors:
+        yield from wait_until(
+            motor.motor_is_moving,
+            lambda v: not v,
+            timeout=max(timeout - (time.monotonic() - t0), 0),
+            label=label,
+            poll_period=poll_period,
+            raise_on_timeout=raise_on_timeout,
+        )
+    elapsed = time.monotonic() - t0
+    if report is not None:
+        report.append((label, elapsed))
+    return elapsed
+
+
+def print_wait_report(report, label="fly_maia"):
+    """One line summary of the waits collected by wait_until."""
+    total = sum(t for _, t in report)
+    print(
+        "{} waits: {} (total {:.2f} s)".format(
+            label, ", ".join("{} {:.2f} s".format(k, t) for k, t in report), total
+        )
+    )
+
+
+class StageBacklash:
+    """Backlash aware positioning of the axes of a MaiaStage.
+
+    Positions are always approached moving in ``direction``.  The last
+    approach direction and position of every axis is remembered, and the
+    take-up move past the target is only made when the axis would
+    reverse, or when its state is unknown (first use, or the axis was
+    moved by something else since).  The moves of all axes are done
+    together.
+
+    Use ``StageBacklash.for_stage(M)`` to share the state between plans.
+    """
+    _registry = {}
+
+    def __init__(self, stage, distances=None, direction=1, tolerance=0.001):
+        self.stage = stage
+        # take-up distance in mm per axis
+        self.distances = {"x": 1.0, "y": 1.0}
+        self.distances.update(distances or {})
+        self.direction = direction
+        self.tolerance = tolerance
+        # axis -> (direction, position) of the last move
+        self._state = {}
+
+    @classmethod
+    def for_stage(cls, stage):
+        """The StageBacklash of a stage, created on first use."""
+        if stage.name not in cls._registry:
+            cls._registry[stage.name] = cls(stage)
+        return cls._registry[stage.name]
+
+    def record(self, axis, start, target):
+        """Note a move of ``axis`` made without this helper."""
+        if abs(target - start) > self.tolerance:
+            self._state[axis] = (math.copysign(1, target - start), target)
+
+    def forget(self, axis=None):
+        """Take up backlash on the next move of ``axis`` (all if None)."""
+        if axis is None:
+            self._state.clear()
+        else:
+            self._state.pop(axis, None)
+
+    def needs_takeup(self, axis, current, target):
+        distance = self.distances.get(axis, 0.0)
+        if not distance:
+            return False
+        travel = (target - current) * self.direction
+        last_direction, last_position = self._state.get(axis, (None, None))
+        if last_direction is None or abs(current - last_position) > self.tolerance:
+            # unknown state, unless the move itself is long enough
+            return travel <= distance
+        if last_direction != self.direction:
+            return True
+        return travel < -self.tolerance
+
+    def mv(self, **targets):
+        """Move axes to their targets, e.g. ``yield from backlash.mv(x=1.0, y=2.0)``."""
+        takeup = []
+        final = []
+        for axis, target in targets.items():
+            motor = getattr(self.stage, axis)
+            current = yield from bps.rd(motor)
+            if self.needs_takeup(axis, current, target):
+                takeup += [motor, target - self.direction * self.distances[axis]]
+                final += [motor, target]
+            elif abs(target - current) > self.tolerance:
+                final += [motor, target]
+            else:
+                continue
+            self._state[axis] = (self.direction, target)
+        if takeup:
+            yield from bps.mv(*takeup)
+            print("backlash taken up on", ", ".join(m.name for m in takeup[::2]))
+        if final:
+            yield from bps.mv(*final)
+
+
+def suspenders_tripped(RE=None):
+    """True if any suspender installed on the RunEngine is tripped."""
+    RE = RE or globals().get("RE")
+    if RE is None:
+        return False
+    return any(suspender.tripped for suspender in RE.suspenders)
+
+
+def shutter_suspend_plans(shutter, waits=None):
+    """pre_plan/post_plan for suspenders: close the shutter, reopen it after.
+
+    The shutter is only reopened if it was open when the suspender
+    tripped.
+    """
+    waits = waits or MaiaFlyWaits()
+    was_open = []
+
+    def pre_plan():
+        current = yield from bps.rd(shutter.status)
+        was_open[:] = [current == shutter.open_val]
+        yield from actuate_shutter(shutter, "Close", waits=waits)
+
+    def post_plan():
+        if was_open and was_open[0]:
+            yield from actuate_shutter(shutter, "Open", waits=waits)
+
+    return pre_plan, post_plan
+
+
+MAIA_OUTLINE_MODES = ("off", "fast", "visual")
+
+# Called with (xstart, xstop, ystart, ystop) in mm when a scan is
+# outlined in 'visual' mode, e.g. by the GUI to draw it on the microscope
+# view.  They run in the RunEngine thread and must not block.
+maia_outline_callbacks = []
+
+
+def mark_scan_outline(hf_stage, xstart, xstop, ystart, ystop, *, mode="fast", pause=0.0, report=None, backlash=None):
+    """Show the extent of a scan before it starts.
+
+    Parameters
+    ----------
+    mode : {'off', 'fast', 'visual'}
+        'off' does nothing.  'fast' drives the beam round the four
+        corners of the scan, from the start corner along x first, each
+        leg one move of x and y together, pausing at the far corner.
+        'visual' leaves the stage where it is and hands the outline to
+        the ``maia_outline_callbacks``.
+    pause : float, optional
+        Time at the far corner in 'fast' mode, in s.
+    report : list, optional
+        The pause is appended to it as ('outline pause', s).
+    backlash : StageBacklash, optional
+        Told about the outline moves.
+    """
+    if mode not in MAIA_OUTLINE_MODES:
+        raise ValueError(f"Unknown outline mode {mode!r}, use one of {MAIA_OUTLINE_MODES}")
+    if mode == "off":
+        return
+    if mode == "visual":
+        if not maia_outline_callbacks:
+            print("Warning: no outline viewer registered, the scan outline is not shown")
+        for callback in maia_outline_callbacks:
+            callback(xstart, xstop, ystart, ystop)
+        return
+    print("mark scan outline")
+    yield from bps.mv(hf_stage.x, xstop, hf_stage.y, ystart)
+    yield from bps.mv(hf_stage.x, xstop, hf_stage.y, ystop)
+    if pause:
+        yield from bps.sleep(pause)
+        if report is not None:
+            report.append(("outline pause", pause))
+    yield from bps.mv(hf_stage.x, xstart, hf_stage.y, ystop)
+    yield from bps.mv(hf_stage.x, xstart, hf_stage.y, ystart)
+    if backlash is not None:
+        backlash.record("x", xstop, xstart)
+        backlash.record("y", ystop, ystart)
+    print("done outline")
+
+
+def soft_event(device, stream, **values):
+    """Set soft signals of a device and record them as an event in ``stream``."""
+    args = []
+    for k, v in values.items():
+        args += [getattr(device, k), v]
+    yield from bps.mv(*args)
+    yield from bps.trigger_and_read([device], name=stream)
+
+
+def fly_progress_event(progress, **values):
+    """Set the progress signals and record them as a 'fly_progress' event."""
+    yield from soft_event(progress, "fly_progress", **values)
+
+
+def actuate_shutter(shutter, action, *, waits, report=None):
+    """Open or close the shutter unless it already is.
+
+    Parameters
+    ----------
+    action : {'Open', 'Close'}
+    waits : MaiaFlyWaits
+        For the shutter timeout.  Failing to open raises TimeoutError,
+        failing to close only warns.
+
+    Returns
+    -------
+    actuation_time : float
+        In s, 0 if the shutter was already there.
+    attempts : int
+        Number of attempts the shutter needed, 0 if it was already
+        there and -1 if the shutter does not report it.
+    """
+    target = shutter.open_val if action == "Open" else shutter.close_val
+    current = yield from bps.rd(shutter.status)
+    if current == target:
+        return 0.0, 0
+    t0 = time.monotonic()
+    yield from bps.mv(shutter, action)
+    yield from wait_until(
+        shutter.status,
+        lambda v: v == target,
+        timeout=waits.shutter_timeout,
+        label="shutter {}".format(action.lower()),
+        report=report,
+        poll_period=waits.poll_period,
+        raise_on_timeout=action == "Open",
+    )
+    elapsed = time.monotonic() - t0
+    attempts = getattr(shutter, "attempts", -1)
+    print("shutter {}: {:.2f} s, attempts {}".format(action.lower(), elapsed, attempts))
+    return elapsed, attempts
+
+
 def fly_maia(
     ystart,
     ystop,
@@ -127,7 +576,17 @@ def fly_maia(
     shutter = shutter,
     hf_stage,
     maia,
-    print_params=False
+    print_params=False,
+    fly_mode="rows",
+    progress=fly_progress,
+    waits=None,
+    outline="fast",
+    backlash=None,
+    return_to_origin=True,
+    close_shutter=True,
+    shutter_log=shutter_log,
+    start_row=0,
+    row_counts=maia_rows,
 ):
     """Run a flyscan with the maia
 
@@ -162,20 +621,78 @@ print("open run")
              ['region', 'info', 'seq_num', 'seq_total']
 
         are passed through to maia metadata.
+
+    fly_mode : {'rows', 'continuous'}, optional
+        'rows' moves y then x for every row, each waiting for the motor
+        to stop.  'continuous' precomputes the serpentine trajectory and
+        steps y while x turns around into the next row, widening the x
+        overscan so that the y move finishes before the first pixel.
+
+    progress : MaiaFlyProgress, optional
+        Read after every row into a 'fly_progress' stream with the row
+        time, achieved x velocity, pixel rate and projected finish time
+        (unix time).
+
+    waits : MaiaFlyWaits, optional
+        Timeouts of the waits on the shutter, the MAIA and the motors and
+        the outline pause.  The time spent in each wait is printed at the
+        end of the scan.
+
+    outline : {'off', 'fast', 'visual'}, optional
+        How the scan extent is shown before the map, see
+        mark_scan_outline.  Use 'off' for unattended batches.
+
+    backlash : StageBacklash, optional
+        Used for all positioning moves, so backlash is only taken up on
+        axes that reverse.  Defaults to the shared one of ``hf_stage``.
+
+    return_to_origin : bool, optional
+        Drive the stage back to the scan origin at the end.  Set it to
+        False when another scan follows, which moves to its own start
+        anyway.
+
+    close_shutter : bool, optional
+        Close the shutter at the end.  Set it to False to keep it open
+        for a scan that follows shortly; it is still closed if the scan
+        fails or a suspender is tripped.  The shutter is only opened if
+        it is not open yet.
+
+    shutter_log : MaiaShutterLog, optional
+        Every shutter action (or the lack of one) with its actuation time
+        and attempts goes into a 'shutter' stream.
+
+    start_row : int, optional
+        First raster row to scan, to finish a map that was stopped part
+        way, see resume_fly_maia.  The MAIA pixel origin and extent stay
+        those of the whole map, so the rows land on the same pixels.
+
+    row_counts : MaiaRowCounts, optional
+        If the maia has a ``row_counts(row)`` summary of a finished row,
+        it is read after every row into a 'maia_rows' stream for the
+        live map.
     """
+    # as called, for resume_fly_maia
+    scan_args = dict(
+        ystart=ystart, ystop=ystop, ypitch=ypitch,
+        xstart=xstart, xstop=xstop, xpitch=xpitch,
+        dwell=dwell, group=group, fly_mode=fly_mode,
+    )
+    waits = waits or MaiaFlyWaits()
+    backlash = backlash or StageBacklash.for_stage(hf_stage)
+    wait_report = []
+    # what cleanup needs to know about how far the raster got
+    scan_state = {"run_open": False, "rows_done": False}
+    if fly_mode not in ("rows", "continuous"):
+        raise ValueError(f"Unknown fly_mode {fly_mode!r}")
+    if outline not in MAIA_OUTLINE_MODES:
+        raise ValueError(f"Unknown outline mode {outline!r}")
     if print_params:
         print(f"ystart={ystart}, ystop={ystop}, ypitch={ypitch}, xstart={xstart}, xstop={xstop}, xpitch={xpitch}, dwell={dwell}")
     x_mres=0.0002
     y_mres=0.0002
-    nxpitch=int(xpitch/x_mres)
-    if(nxpitch<2): # Force minimum pitch to 2 motor steps
-        nxpitch=2
-    nypitch=int(ypitch/y_mres)
-    if(nypitch<2): # Force minimum pitch to 2 motor steps
-        nypitch=2
-    xpitch=nxpitch*x_mres
+    xpitch=float(maia_motor_pitch(xpitch, x_mres)) # Force minimum pitch to 2 motor steps
     print("Warning: I am forcing xpitch to be an integer multiple of motor resolution: ", xpitch);
-    ypitch=nypitch*y_mres
+    ypitch=float(maia_motor_pitch(ypitch, y_mres))
     print("Warning: I am forcing ypitch to be an integer multiple of motor resolution: ", ypitch);
     if xstart > xstop:
         xstop, xstart = xstart, xstop
@@ -194,10 +711,13 @@ print("open run")
 
     xsize = xnum*xpitch
     xstop=xstart+xsize
-    ysize=ystart*xpitch
+    ysize=ynum*ypitch
     ystop=ystart+ysize
 
     print("Warning: I am forcing xsize to be an integer multiple of xpitch: ", xsize);
+    # the raster has ynum + 1 rows
+    if not 0 <= start_row <= ynum:
+        raise ValueError(f"start_row must be between 0 and {ynum}, not {start_row}")
 
     #if(ystart+ynum*ypitch < ystop):       #        yield from bps.sleep(0.5)
         #        a_x=str(maia_get("encoder.axis[0].position\n"))
@@ -221,8 +741,12 @@ print("open run")
             xnum=xnum,
             dwell=dwell,
             group=repr(group),
+            fly_mode=fly_mode,
+            outline=outline,
+            start_row=start_row,
             md=md,
         ),
+        "scan_args": scan_args,
         "extents": [[ystart, ystop], [xstart, xstop]],
         "snaking": [False, True],
         "plan_name": "fly_maia",
@@ -231,20 +755,25 @@ print("open run")
 
     md = _md
 
+    setup_t0 = time.monotonic()
+    # collect every MAIA setpoint and write them as one concurrent set
+    maia_targets = []
     sample_md = md.get("sample", {})
     for k in ["info", "name", "owner", "serial", "type"]:
         v = sample_md.get(k, "")
         sig = getattr(maia, "meta_val_sample_{}_sp.value".format(k))
-        yield from bps.mv(sig, str(v))
+        maia_targets.append((sig, str(v)))
 
     scan_md = md.get("scan", {})
     for k in ["region", "info", "seq_num", "seq_total"]:
         v = scan_md.get(k, "")
         sig = getattr(maia, "meta_val_scan_{}_sp.value".format(k))
-        yield from bps.mv(sig, str(v))
+        maia_targets.append((sig, str(v)))
 
+    # commands, written on every scan
+    maia_commands = []
     if group is not None:
-        yield from bps.mv(maia.blog_group_next_sp.value, group)
+        maia_commands.append((maia.blog_group_next_sp.value, group))
 
     #if xstart > xstop:
     #    xstop, xstart = xstart, xstop
@@ -260,33 +789,33 @@ print("open run")
     spd_x = xpitch / dwell
     print("speed_x=",spd_x)
 
-    # Move to bottom LH corner of scan
-    yield from bps.mv(hf_stage.x, xstart, hf_stage.y, ystart)
+    # Move to bottom LH corner of scan (of the rows left to do)
+    yield from backlash.mv(x=xstart, y=ystart + start_row * ypitch)
 
     x_val = yield from bps.rd(hf_stage.x)
     y_val = yield from bps.rd(hf_stage.y)
     # TODO, depends on actual device
     # Tell Hymod what we're doing
-    yield from bps.mv(maia.enc_axis_0_pos_sp.value, x_val)
-    yield from bps.mv(maia.enc_axis_1_pos_sp.value, y_val)
-
-    yield from bps.mv(maia.x_pixel_dim_origin_sp.value, xstart)
-    yield from bps.mv(maia.y_pixel_dim_origin_sp.value, ystart)
-
-    yield from bps.mv(maia.x_pixel_dim_pitch_sp.value, xpitch)
-    yield from bps.mv(maia.y_pixel_dim_pitch_sp.value, ypitch)
-
-    yield from bps.mv(maia.x_pixel_dim_coord_extent_sp.value, xnum)
-    yield from bps.mv(maia.y_pixel_dim_coord_extent_sp.value, ynum)
-    yield from bps.mv(maia.scan_order_sp.value, "01")
-    yield from bps.mv(maia.meta_val_scan_order_sp.value, "01")
-    yield from bps.mv(maia.pixel_dwell.value, dwell)
-    yield from bps.mv(maia.meta_val_scan_dwell.value, str(dwell))
-
-    yield from bps.mv(maia.meta_val_beam_particle_sp.value, "photon")
-    yield from bps.mv(
-        maia.meta_val_beam_energy_sp.value, "{:.2f}".format(20_000)
-        )
+    maia_commands += [
+        (maia.enc_axis_0_pos_sp.value, x_val),
+        (maia.enc_axis_1_pos_sp.value, y_val),
+    ]
+    maia_targets += [
+        (maia.x_pixel_dim_origin_sp.value, xstart),
+        (maia.y_pixel_dim_origin_sp.value, ystart),
+        (maia.x_pixel_dim_pitch_sp.value, xpitch),
+        (maia.y_pixel_dim_pitch_sp.value, ypitch),
+        (maia.x_pixel_dim_coord_extent_sp.value, xnum),
+        (maia.y_pixel_dim_coord_extent_sp.value, ynum),
+        (maia.scan_order_sp.value, "01"),
+        (maia.meta_val_scan_order_sp.value, "01"),
+        (maia.pixel_dwell.value, dwell),
+        (maia.meta_val_scan_dwell.value, str(dwell)),
+        (maia.meta_val_beam_particle_sp.value, "photon"),
+        (maia.meta_val_beam_energy_sp.value, "{:.2f}".format(20_000)),
+    ]
+    yield from maia_mv_changed(maia_targets, commands=maia_commands, label="maia setup")
+    print("maia setup total time: {:.3f} s".format(time.monotonic() - setup_t0))
     #    yield from bps.mv(maia.maia_scan_info
     # need something to generate a filename here.
     #    yield from bps.mv(maia.blog_group_next_sp,datafile))
@@ -294,45 +823,65 @@ print("open run")
 
     @bpp.reset_positions_decorator([hf_stage.x.velocity])
     def _raster_plan():
-        print("mark scan outline")
-        yield from bps.mv(hf_stage.x, xstart)
-        yield from bps.mv(hf_stage.y, ystart)
-        yield from bps.sleep(1.0)
-        yield from bps.mv(hf_stage.x, xstop)
-        yield from bps.sleep(1.0)
-        yield from bps.mv(hf_stage.y, ystop)
-        yield from bps.sleep(1.0)
-        yield from bps.mv(hf_stage.x, xstart)
-        #yield from bps.sleep(1.0)
-        yield from bps.mv(hf_stage.y, ystart)
+        # the stage is at the start corner, show the rows actually scanned
+        yield from mark_scan_outline(
+            hf_stage,
+            xstart,
+            xstop,
+            ystart + start_row * ypitch,
+            ystop,
+            mode=outline,
+            pause=waits.outline_pause,
+            report=wait_report,
+            backlash=backlash,
+        )
         #input("Press enter if it's OK to continue")
-        print("done outline")
         # open file to save positions
         #fout=open('/home/xf04bm/positions.dat','w')
+        x_accl = yield from bps.rd(hf_stage.x.acceleration)
+        y_spd = yield from bps.rd(hf_stage.y.velocity)
+        y_accl = yield from bps.rd(hf_stage.y.acceleration)
+        y_step_time = ypitch / y_spd + y_accl if y_spd else 0.0
+        overscan = xpitch/2
+        if fly_mode == "continuous":
+            # y steps while x re-accelerates into the next row, so the
+            # overscan has to be long enough to cover the y move
+            overscan = max(overscan, spd_x * (y_step_time - x_accl / 2))
+        xstartnew=xstart-overscan
+        xstopnew=xstop+overscan
+        ystartnew=ystart #-ypitch/2
+        ystopnew=ystop #+ypitch/2
+        ynumnew=ynum+1
+        y_traj, x_traj = maia_serpentine_trajectory(
+            xstartnew, xstopnew, ystartnew, ypitch, ynumnew
+        )
+        # odd rows start at the far end
+        x_row_start = xstopnew if start_row % 2 else xstartnew
+        # take up backlash where needed, before x is slowed down to scan speed
+        yield from backlash.mv(x=x_row_start, y=y_traj[start_row])
+        print("Backlash removed")
 	    # set the motors to the right speed
         yield from bps.mv(hf_stage.x.velocity, spd_x)
         print("set speed")
-        yield from bps.mv(shutter, "Open")
+        open_time, open_attempts = yield from actuate_shutter(
+            shutter, "Open", waits=waits, report=wait_report
+        )
 #        yield from bps.sleep(1)
         start_uid = yield from bps.open_run(md)
-        yield from bps.sleep(2)
+        scan_state["run_open"] = True
+        yield from soft_event(
+            shutter_log,
+            "shutter",
+            action="open" if open_attempts else "already open",
+            actuation_time=open_time,
+            attempts=open_attempts,
+        )
         print("open run")
         yield from bps.mv(maia.meta_val_scan_crossref_sp.value, start_uid)
         # long int here.  consequneces of changing?
         #    yield from bps.mv(maia.scan_number_sp,start_uid)
         yield from bps.stage(maia)  # currently a no-op
         print("Stage maia")
-        xstartnew=xstart-xpitch/2
-        xstopnew=xstop+xpitch/2
-        ystartnew=ystart #-ypitch/2
-        ystopnew=ystop #+ypitch/2
-        ynumnew=ynum+1
-        #take up backlash
-        yield from bps.mv(hf_stage.x, xstartnew-1.0)
-        yield from bps.mv(hf_stage.x, xstartnew)
-        yield from bps.mv(hf_stage.y, ystartnew-1.0)
-        yield from bps.mv(hf_stage.y, ystartnew)
-        print("Backlash removed")
         #yield from bps.sleep(1)
         yield from bps.kickoff(maia, wait=True)
         print("kickoff")
@@ -340,54 +889,190 @@ print("open run")
         print("checkpoint")
         #yield from bps.mv(hf_stage.x, xstart)
         #yield from bps.mv(hf_stage.y, ystart)
-        yield from bps.sleep(2)
+        yield from wait_until(
+            maia.blog_discard_mon.value,
+            lambda v: _maia_value_matches(v, 0),
+            timeout=waits.recording_timeout,
+            label="maia recording",
+            report=wait_report,
+            poll_period=waits.poll_period,
+        )
         # by row
-        for i in range(0,ynumnew):
-            y_pos=ystartnew+i*ypitch
-            
-            #yield from bps.checkpoint()
-            # move to the row we want
-            yield from bps.mv(hf_stage.y, y_pos)
-            if i % 2:
-                # for odd-rows move from stop to start
-                yield from bps.mv(hf_stage.x, xstartnew)
+        row_times = []
+        row_length = xstopnew - xstartnew
+        rows_t0 = time.monotonic()
+        x_prev, y_prev = x_row_start, y_traj[start_row]
+        for i in range(start_row, ynumnew):
+            y_pos, x_pos = y_traj[i], x_traj[i]
+            t_row = time.monotonic()
+            # a suspension (beam dump) stops the stage and rewinds to
+            # here; once the beam is back the row carries on from where
+            # the stage stopped, so no pixel is scanned twice
+            yield from bps.checkpoint()
+            if fly_mode == "continuous":
+                # step y during the x turnaround
+                yield from bps.mv(hf_stage.y, y_pos, hf_stage.x, x_pos)
+                t_x = t_row
             else:
-                # for even-rows move from start to stop
-                yield from bps.mv(hf_stage.x, xstopnew)
+                # move to the row we want, then along it
+                # (even rows start to stop, odd rows stop to start)
+                yield from bps.mv(hf_stage.y, y_pos)
+                t_x = time.monotonic()
+                yield from bps.mv(hf_stage.x, x_pos)
+            now = time.monotonic()
+            backlash.record("x", x_prev, x_pos)
+            backlash.record("y", y_prev, y_pos)
+            x_prev, y_prev = x_pos, y_pos
+            row_times.append(now - t_row)
+            yield from fly_progress_event(
+                progress,
+                row=i,
+                nrows=ynumnew,
+                row_time=row_times[-1],
+                # cruise velocity, ignoring the acceleration ramps
+                x_velocity=row_length / max(now - t_x - x_accl, 1e-3),
+                x_velocity_setpoint=spd_x,
+                pixel_rate=len(row_times) * xnum / (now - rows_t0),
+                eta=time.time() + (ynumnew - i - 1) * np.mean(row_times),
+            )
+            if hasattr(maia, "row_counts"):
+                yield from soft_event(
+                    row_counts, "maia_rows", row=i, counts=maia.row_counts(i)
+                )
+
+        pixel_time = xsize / spd_x
+        predicted = maia_row_overhead(
+            overscan, spd_x, x_accl, y_step_time, fly_mode
+        )
+        measured = np.asarray(row_times) - pixel_time
+        print(
+            "{} mode row overhead: predicted {:.3f} s, measured mean {:.3f} s"
+            " (max {:.3f} s) over {} rows".format(
+                fly_mode, predicted, measured.mean(), measured.max(), len(row_times)
+            )
+        )
+        if fly_mode == "continuous":
+            rows_predicted = maia_row_overhead(
+                xpitch / 2, spd_x, x_accl, y_step_time, "rows"
+            )
+            print(
+                "rows mode would cost {:.3f} s per row, {:.1f} s recovered".format(
+                    rows_predicted,
+                    len(row_times) * rows_predicted - measured.sum(),
+                )
+            )
+        scan_state["rows_done"] = True
  
     def _cleanup_plan():
         # stop the maia ("I'll wait until you're done")
         yield from bps.complete(maia, wait=True)
         
         # return stage to scan origin
-        yield from bps.mv(hf_stage.x, xstart-1.0)
-        yield from bps.mv(hf_stage.x, xstart)
-        yield from bps.mv(hf_stage.y, ystart-1.0)
-        yield from bps.mv(hf_stage.y, ystart)
-        # shut the shutter
-        yield from bps.mv(shutter, "Close")
-        yield from bps.sleep(2)
+        if return_to_origin:
+            yield from backlash.mv(x=xstart, y=ystart)
+        # shut the shutter, unless the next scan follows shortly
+        if close_shutter or not scan_state["rows_done"] or suspenders_tripped():
+            close_time, close_attempts = yield from actuate_shutter(
+                shutter, "Close", waits=waits, report=wait_report
+            )
+            action = "close" if close_attempts else "already closed"
+        else:
+            close_time, close_attempts = 0.0, 0
+            action = "kept open"
+            print("shutter kept open for the next scan")
+        if scan_state["run_open"]:
+            yield from soft_event(
+                shutter_log,
+                "shutter",
+                action=action,
+                actuation_time=close_time,
+                attempts=close_attempts,
+            )
         # collect data from maia
         yield from bps.collect(maia)
         yield from bps.close_run()
         yield from bps.unstage(maia)
         #yield from bps.close_run()
-        yield from bps.mv(maia.meta_val_scan_crossref_sp.value, "")
+        maia_targets = [(maia.meta_val_scan_crossref_sp.value, "")]
         for k in ["info", "name", "owner", "serial", "type"]:
             sig = getattr(maia, "meta_val_sample_{}_sp.value".format(k))
-            yield from bps.mv(sig, "")
+            maia_targets.append((sig, ""))
 
         for k in ["region", "info", "seq_num", "seq_total"]:
             sig = getattr(maia, "meta_val_scan_{}_sp.value".format(k))
-            yield from bps.mv(sig, "")
-        yield from bps.mv(maia.meta_val_beam_energy_sp.value, "")
-        yield from bps.mv(maia.meta_val_scan_dwell.value, "")
-        yield from bps.mv(maia.meta_val_scan_order_sp.value, "")
-        yield from bps.sleep(2)
+            maia_targets.append((sig, ""))
+        maia_targets += [
+            (maia.meta_val_beam_energy_sp.value, ""),
+            (maia.meta_val_scan_dwell.value, ""),
+            (maia.meta_val_scan_order_sp.value, ""),
+        ]
+        yield from maia_mv_changed(maia_targets, label="maia cleanup")
+        yield from wait_until(
+            maia.blog_discard_mon.value,
+            lambda v: _maia_value_matches(v, 1),
+            timeout=waits.recording_timeout,
+            label="maia stopped",
+            report=wait_report,
+            poll_period=waits.poll_period,
+            raise_on_timeout=False,
+        )
+        yield from wait_motors_idle(
+            [hf_stage.x, hf_stage.y],
+            timeout=waits.motion_timeout,
+            report=wait_report,
+            poll_period=waits.poll_period,
+            raise_on_timeout=False,
+        )
+        print_wait_report(wait_report)
 
     return (yield from bpp.finalize_wrapper(_raster_plan(), _cleanup_plan()))
 
 
+def fly_maia_next_row(header):
+    """First raster row a fly_maia run did not finish.
+
+    Every finished row has an event in the 'fly_progress' stream, a run
+    without any starts over from its own start_row.
+    """
+    rows = header.table("fly_progress")
+    if len(rows):
+        return int(rows[fly_progress.row.name].max()) + 1
+    return header.start["plan_args"].get("start_row", 0)
+
+
+def resume_fly_maia(uid, *, db=None, **kwargs):
+    """Finish a fly_maia map that was stopped or aborted part way.
+
+    The rows the run did not finish are scanned as a new run with the
+    same scan arguments, so the MAIA pixel origin and extent match and
+    the two runs can be merged.  The new run has 'resumed_from' set to
+    ``uid``.
+
+    Parameters
+    ----------
+    uid : str
+        The run to finish.
+    db : Broker, optional
+        Where to look it up, the profile's ``db`` by default.
+    **kwargs
+        Passed on to fly_maia, hf_stage defaults to M and maia to maia.
+    """
+    header = (db or globals()["db"])[uid]
+    start = header.start
+    if start.get("plan_name") != "fly_maia" or "scan_args" not in start:
+        raise ValueError(f"{uid} is not a fly_maia run that can be resumed")
+    next_row = fly_maia_next_row(header)
+    nrows = start["plan_args"]["ynum"] + 1
+    if next_row >= nrows:
+        print(f"All {nrows} rows of {start['uid']} were scanned, nothing to resume")
+        return
+    print(f"Resuming {start['uid']} from row {next_row} of {nrows}")
+    kwargs.setdefault("hf_stage", M)
+    kwargs.setdefault("maia", maia)
+    md = dict(start["plan_args"]["md"], resumed_from=start["uid"])
+    return (yield from fly_maia(**start["scan_args"], md=md, start_row=next_row, **kwargs))
+
+
 def fly_maia_finger_sync(
     ystart,
     ystop,
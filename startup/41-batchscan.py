@@ -2,10 +2,81 @@ import os
 import pandas as pd
 import numpy as np
 
-def Run_Multiple_Scans(file_path):
-    data = np.array(pd.read_csv(file_path))
-    for line in data:
+def Run_Multiple_Scans(
+    file_path,
+    skip_invalid=False,
+    between_scans=0.0,
+    waits=None,
+    outline="off",
+    optimize_order=False,
+    chain=True,
+    keep_shutter_open=True,
+    shutter_gap=SHUTTER_KEEP_OPEN_MAX_GAP,
+):
+    """Run every scan of a plan spreadsheet with fly_maia.
+
+    optimize_order reorders the scans to cut stage travel between them
+    (see order_scans_for_travel), chain skips the return to the scan
+    origin when another scan follows.  With keep_shutter_open the
+    shutter stays open into the next scan when the estimated gap is at
+    most shutter_gap s.  Scans interrupted by a beam outage are written
+    to a <file>_redo.csv plan at the end, to be run again.
+    """
+    plan, errors = load_maia_plan(file_path, hf_stage=M)
+    if len(errors):
+        print(f"Rejected rows in {file_path}:\n{format_plan_errors(errors)}")
+        if not skip_invalid:
+            raise ValueError(
+                f"{len(errors)} problems in {file_path}, fix them or pass skip_invalid=True"
+            )
+    waits = waits or MaiaFlyWaits()
+    params = MaiaMotionParams.from_stage(M)
+    # rows with the attribute names of a MaiaFlyDefinition
+    defns = list(plan.assign(xpitch=plan["pitch"], ypitch=plan["pitch"]).itertuples(index=False))
+    if optimize_order and len(plan) > 1:
+        order, before, after = order_scans_for_travel(
+            defns, start=(M.x.position, M.y.position), params=params, return_to_origin=not chain
+        )
+        plan = plan.iloc[order]
+        defns = [defns[i] for i in order]
+        print(f"Reordered scans, stage travel {format_duration(before)} -> {format_duration(after)}")
+    last = np.arange(len(plan)) == len(plan) - 1
+    if keep_shutter_open:
+        close = shutter_close_after(
+            defns, max_gap=shutter_gap, params=params, return_to_origin=not chain,
+            waits=waits, outline=outline,
+        )
+    else:
+        close = np.ones(len(plan), dtype=bool)
+    print(f"Shutter cycles: {close.sum()} for {len(plan)} scans")
+    eta_kwargs = dict(
+        ystart=plan["ystart"], ystop=plan["ystop"], ypitch=plan["pitch"],
+        xstart=plan["xstart"], xstop=plan["xstop"], xpitch=plan["pitch"],
+        dwell=plan["dwell"], params=params, waits=waits,
+        outline=outline, return_to_origin=last | (not chain),
+        open_shutter=np.r_[True, close[:-1]], close_shutter=close,
+    )
+    # including the travel from the stage position and between the scans
+    starts = queue_start_positions(
+        estimate_fly_maia_times(**eta_kwargs), (M.x.position, M.y.position)
+    )
+    eta = estimate_fly_maia_times(**eta_kwargs, start=starts)["total"] + between_scans
+    remaining = eta.sum()
+    print(f"Estimated time for {len(plan)} scans: {format_duration(remaining)}")
+    redo = []
+    for index, line, line_eta, is_last, close_shutter in zip(plan.index, plan.itertuples(index=False), eta, last, close):
         print(f"Starting line: {line}")
-        yield from fly_maia(ystart=line[5], ystop=line[6], ypitch=line[7], xstart=line[3], xstop=line[4], xpitch=line[7], dwell=line[8], hf_stage=M, maia=maia, md={'sample': {'info': line[2], 'name': line[0], 'owner': line[10], 'type': line[9], 'serial': line[1]}}, print_params=True)
-        print(f"Done with line: {line}")
-        sleep(5)
+        interruptions = beam_outages.interruptions
+        yield from fly_maia(ystart=line.ystart, ystop=line.ystop, ypitch=line.pitch, xstart=line.xstart, xstop=line.xstop, xpitch=line.pitch, dwell=line.dwell, hf_stage=M, maia=maia, md={'sample': {'info': line.info, 'name': line.name, 'owner': line.owner, 'type': line.type, 'serial': line.serial}}, print_params=True, waits=waits, outline=outline, return_to_origin=is_last or not chain, close_shutter=bool(close_shutter))
+        if beam_outages.interruptions > interruptions:
+            redo.append(index)
+        remaining -= line_eta
+        print(f"Done with line: {line}, queue ETA {format_duration(remaining)}")
+        # the next scan can start as soon as the stage has stopped
+        yield from wait_motors_idle([M.x, M.y], timeout=waits.motion_timeout, poll_period=waits.poll_period)
+        if between_scans:
+            yield from bps.sleep(between_scans)
+    if redo:
+        redo_path = os.path.splitext(file_path)[0] + "_redo.csv"
+        plan.loc[redo, list(MAIA_PLAN_COLUMNS)].to_csv(redo_path, index=False)
+        print(f"{len(redo)} scans were interrupted by the beam, run them again with Run_Multiple_Scans({redo_path!r})")
@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class MaiaMotionParams:
+    """Motor and shutter timings used by the fly_maia timing model.
+
+    Velocities are in mm/s, accelerations are EpicsMotor ACCL values,
+    i.e. the time in s to reach speed.  Backlash take-up distances are
+    in mm.
+    """
+    x_velocity: float = 1.0
+    x_accl: float = 0.2
+    y_velocity: float = 1.0
+    y_accl: float = 0.2
+    shutter_time: float = 2.0
+    put_latency: float = 0.05
+    x_backlash: float = 1.0
+    y_backlash: float = 1.0
+
+    @classmethod
+    def from_stage(cls, hf_stage, **kwargs):
+        """Read the current velocity/acceleration and backlash of the stage axes."""
+        backlash = StageBacklash.for_stage(hf_stage).distances
+        params = dict(
+            x_velocity=hf_stage.x.velocity.get(),
+            x_accl=hf_stage.x.acceleration.get(),
+            y_velocity=hf_stage.y.velocity.get(),
+            y_accl=hf_stage.y.acceleration.get(),
+            x_backlash=backlash.get("x", 0.0),
+            y_backlash=backlash.get("y", 0.0),
+        )
+        params.update(kwargs)
+        return cls(**params)
+
+
+def _move_time(distance, velocity, accl):
+    """Time for a trapezoidal move, zero if the motor does not move."""
+    distance = np.abs(distance)
+    return np.where(distance > 0, distance / velocity + accl, 0.0)
+
+
+def _axis_travel_time(start, target, velocity, accl, backlash):
+    """Positioning time of one axis, approaching from below as StageBacklash does."""
+    distance = target - start
+    reverse = distance < 0
+    return np.where(
+        reverse,
+        _move_time(np.abs(distance) + backlash, velocity, accl) + _move_time(backlash, velocity, accl),
+        _move_time(distance, velocity, accl),
+    )
+
+
+def estimate_fly_maia_times(
+    ystart,
+    ystop,
+    ypitch,
+    xstart,
+    xstop,
+    xpitch,
+    dwell,
+    *,
+    params=None,
+    fly_mode="rows",
+    mres=0.0002,
+    waits=None,
+    outline="fast",
+    return_to_origin=True,
+    open_shutter=True,
+    close_shutter=True,
+    start=None,
+):
+    """Estimate the duration of fly_maia scans, vectorized over scans.
+
+    All positional arguments may be scalars or equal length arrays (for
+    example the columns of a plan spreadsheet).  The pitch/size rounding
+    and the sequence of moves, sleeps and shutter actions mirror
+    fly_maia.
+
+    The condition waits of fly_maia (shutter, MAIA recording, motors
+    idle) are counted as one ``put_latency`` each, the outline pauses
+    is taken from ``waits`` (a MaiaFlyWaits) and only counts in the
+    'fast' ``outline`` mode.  ``return_to_origin``, ``open_shutter``
+    (False if the previous scan left it open) and ``close_shutter`` may
+    be given per scan.  ``start`` is the (x, y) of the stage before the
+    scan, scalars or arrays; the move from there to the start corner is
+    then part of 'setup', otherwise the stage is taken to be there.
+
+    Returns
+    -------
+    dict of np.ndarray
+        'setup', 'outline', 'rows', 'cleanup' and 'total' times in s,
+        plus 'per_row' overhead, 'xnum' and 'ynum', and the start corner
+        ('x_start', 'y_start') and the position the stage is left at
+        ('x_end', 'y_end').
+    """
+    params = params or MaiaMotionParams()
+    waits = waits or MaiaFlyWaits()
+    condition_wait = params.put_latency
+    ystart, ystop, ypitch, xstart, xstop, xpitch, dwell = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float)
+          for a in (ystart, ystop, ypitch, xstart, xstop, xpitch, dwell))
+    )
+
+    # pitch and size rounding as done in fly_maia
+    xpitch = maia_motor_pitch(xpitch, mres)
+    ypitch = maia_motor_pitch(ypitch, mres)
+    xstart, xstop = np.minimum(xstart, xstop), np.maximum(xstart, xstop)
+    ystart, ystop = np.minimum(ystart, ystop), np.maximum(ystart, ystop)
+    xnum = np.floor((xstop - xstart) / xpitch)
+    xnum = np.where(xstart + xnum * xpitch < xstop, xnum + 1, xnum)
+    ynum = np.floor((ystop - ystart) / ypitch)
+    xsize = xnum * xpitch
+    ysize = ynum * ypitch
+    spd_x = xpitch / dwell
+    nrows = ynum + 1
+
+    vx, ax = params.x_velocity, params.x_accl
+    vy, ay = params.y_velocity, params.y_accl
+    bx, by = params.x_backlash, params.y_backlash
+
+    # one batched MAIA write
+    setup = np.full(xnum.shape, params.put_latency)
+    if start is not None:
+        # the backlash move to the start corner, both axes together
+        setup = setup + np.maximum(
+            _axis_travel_time(np.asarray(start[0], dtype=float), xstart, vx, ax, bx),
+            _axis_travel_time(np.asarray(start[1], dtype=float), ystart, vy, ay, by),
+        )
+
+    if outline == "fast":
+        # round the four corners, one axis moving on each leg
+        outline_time = (
+            2 * _move_time(xsize, vx, ax) + 2 * _move_time(ysize, vy, ay) + waits.outline_pause
+        )
+    else:
+        outline_time = np.zeros(xnum.shape)
+
+    y_step_time = ypitch / vy + ay
+    overscan = xpitch / 2
+    if fly_mode == "continuous":
+        overscan = np.maximum(overscan, spd_x * (y_step_time - ax / 2))
+    per_row = maia_row_overhead(overscan, spd_x, ax, y_step_time, fly_mode)
+    # x reverses onto the overscan start, y only after the 'fast'
+    # outline came back down to ystart, both axes together
+    y_takeup = 1.0 if outline == "fast" else 0.0
+    rows = (
+        params.shutter_time * np.asarray(open_shutter, dtype=float)
+        + condition_wait  # shutter open
+        + np.maximum(_move_time(bx + overscan, vx, ax), y_takeup * _move_time(by, vy, ay))
+        + np.maximum(_move_time(bx, vx, ax), y_takeup * _move_time(by, vy, ay))
+        + condition_wait  # maia recording
+        + nrows * (xsize / spd_x + per_row)
+    )
+
+    # the last row ends at the far side if there is an odd number of rows
+    x_end_offset = np.where(nrows % 2, xsize + overscan, overscan)
+    # both axes reverse back to the origin, together
+    return_time = (
+        np.maximum(_move_time(x_end_offset + bx, vx, ax), _move_time(ysize + by, vy, ay))
+        + np.maximum(_move_time(bx, vx, ax), _move_time(by, vy, ay))
+    )
+    # may differ per scan, e.g. only the last scan of a chained batch returns
+    return_to_origin = np.broadcast_to(np.asarray(return_to_origin, dtype=bool), xnum.shape)
+    x_end = np.where(
+        return_to_origin,
+        xstart,
+        np.where(nrows % 2, xstart + xsize + overscan, xstart - overscan),
+    )
+    y_end = np.where(return_to_origin, ystart, ystart + ysize)
+    cleanup = (
+        np.where(return_to_origin, return_time, 0.0)
+        + params.shutter_time * np.asarray(close_shutter, dtype=float)
+        + condition_wait  # shutter closed
+        + params.put_latency
+        + 2 * condition_wait  # maia stopped, motors idle
+    )
+
+    return dict(
+        setup=setup,
+        outline=outline_time,
+        rows=rows,
+        cleanup=cleanup,
+        total=setup + outline_time + rows + cleanup,
+        per_row=per_row,
+        xnum=xnum,
+        ynum=ynum,
+        x_start=xstart,
+        y_start=ystart,
+        x_end=x_end,
+        y_end=y_end,
+    )
+
+
+def estimate_fly_maia_time(defn, **kwargs):
+    """Estimate a single scan from a MaiaFlyDefinition.
+
+    Returns the breakdown of estimate_fly_maia_times as floats.
+    """
+    est = estimate_fly_maia_times(
+        defn.ystart,
+        defn.ystop,
+        defn.ypitch,
+        defn.xstart,
+        defn.xstop,
+        defn.xpitch,
+        defn.dwell,
+        **kwargs,
+    )
+    return {k: float(v) for k, v in est.items()}
+
+
+def definition_columns(defns):
+    """The scan parameters of MaiaFlyDefinitions as columns for estimate_fly_maia_times."""
+    return {
+        name: [getattr(d, name) for d in defns]
+        for name in ("ystart", "ystop", "ypitch", "xstart", "xstop", "xpitch", "dwell")
+    }
+
+
+def queue_start_positions(est, start=None):
+    """Stage (x, y) before each scan of a queue, from estimate_fly_maia_times of its scans.
+
+    The first scan starts from ``start``, or its own start corner if
+    None, every other one from where the scan before left the stage.
+    """
+    x0, y0 = (est["x_start"][0], est["y_start"][0]) if start is None else start
+    return np.r_[x0, est["x_end"][:-1]], np.r_[y0, est["y_end"][:-1]]
+
+
+def estimate_queue_time(defns, *, start=None, between_scans=0.0, **kwargs):
+    """Estimate the total time of a list of MaiaFlyDefinitions.
+
+    The stage travel from ``start``, the (x, y) of the stage, to the
+    first scan and between the scans is included.
+
+    Returns
+    -------
+    total : float
+        Total queue time in s, including ``between_scans`` per scan.
+    per_scan : np.ndarray
+        Estimated time of each scan in s.
+    """
+    if not len(defns):
+        return 0.0, np.zeros(0)
+    columns = definition_columns(defns)
+    starts = queue_start_positions(estimate_fly_maia_times(**columns, **kwargs), start)
+    per_scan = estimate_fly_maia_times(**columns, start=starts, **kwargs)["total"] + between_scans
+    return float(per_scan.sum()), per_scan
+
+
+def format_duration(seconds):
+    """Format a duration in s as h:mm:ss."""
+    seconds = int(round(seconds))
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+MAIA_PLAN_COLUMNS = {
+    "name": str,
+    "serial": str,
+    "info": str,
+    "xstart": float,
+    "xstop": float,
+    "ystart": float,
+    "ystop": float,
+    "pitch": float,
+    "dwell": float,
+    "type": str,
+    "owner": str,
+}
+
+
+def _axis_limits(motor):
+    """(low, high) soft limits of a motor, or None if it has none set."""
+    low, high = motor.limits
+    if low == high == 0:
+        return None
+    return low, high
+
+
+def load_maia_plan(
+    source,
+    *,
+    hf_stage=None,
+    mres=0.0002,
+    dwell_limits=(1e-4, 10.0),
+):
+    """Load and validate a fly_maia plan spreadsheet in one vectorized pass.
+
+    Parameters
+    ----------
+    source : str or pd.DataFrame
+        Path to a .csv or .xlsx file, or an already loaded table.  Column
+        names are case insensitive and must include MAIA_PLAN_COLUMNS.
+    hf_stage : MaiaStage, optional
+        If given, scan extents are checked against the x/y soft limits.
+    mres : float, optional
+        Motor resolution, pitches are rounded down to a multiple of it
+        (at least 2 steps) as fly_maia does.
+    dwell_limits : (float, float), optional
+        Allowed dwell range in s.
+
+    Returns
+    -------
+    plan : pd.DataFrame
+        The valid rows with typed columns, keeping the original index.
+    errors : pd.DataFrame
+        One row per problem with the spreadsheet 'line' (the header is
+        line 1), the scan 'name' and the 'error' message.
+    """
+    if isinstance(source, pd.DataFrame):
+        df = source.copy()
+    elif str(source).endswith(".xlsx"):
+        df = pd.read_excel(source)
+    else:
+        df = pd.read_csv(source)
+    df.columns = df.columns.str.strip().str.lower()
+
+    missing = set(MAIA_PLAN_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Columns missing from plan: {','.join(sorted(missing))}")
+    df = df[list(MAIA_PLAN_COLUMNS)].copy()
+
+    problems = {}
+    for column, kind in MAIA_PLAN_COLUMNS.items():
+        if kind is float:
+            values = pd.to_numeric(df[column], errors="coerce")
+            problems[f"{column} is not a number"] = values.isna()
+            df[column] = values.astype(float)
+        else:
+            df[column] = df[column].fillna("").astype(str).str.strip()
+
+    problems["name is empty"] = df["name"] == ""
+    problems["name is repeated"] = df["name"].duplicated(keep=False) & (df["name"] != "")
+    problems["pitch must be positive"] = df["pitch"] <= 0
+    low, high = dwell_limits
+    problems[f"dwell outside {low}-{high} s"] = (df["dwell"] < low) | (df["dwell"] > high)
+    problems["xstart equals xstop"] = df["xstart"] == df["xstop"]
+    problems["ystart equals ystop"] = df["ystart"] == df["ystop"]
+
+    if hf_stage is not None:
+        for axis in ("x", "y"):
+            limits = _axis_limits(getattr(hf_stage, axis))
+            if limits is None:
+                continue
+            for column in (f"{axis}start", f"{axis}stop"):
+                problems[f"{column} outside {axis} limits {limits}"] = (
+                    (df[column] < limits[0]) | (df[column] > limits[1])
+                )
+
+    # same rounding as fly_maia
+    df["pitch"] = maia_motor_pitch(df["pitch"], mres)
+
+    problems = {message: mask.to_numpy() for message, mask in problems.items()}
+    lines = df.index.to_numpy() + 2
+    names = df["name"].to_numpy()
+    errors = [
+        pd.DataFrame({"line": lines[mask], "name": names[mask], "error": message})
+        for message, mask in problems.items()
+        if mask.any()
+    ]
+    if errors:
+        errors = pd.concat(errors).sort_values("line", kind="stable").reset_index(drop=True)
+    else:
+        errors = pd.DataFrame(columns=["line", "name", "error"])
+
+    bad = np.logical_or.reduce(list(problems.values()))
+    return df[~bad], errors
+
+
+def format_plan_errors(errors, max_lines=20):
+    """Human readable error report of load_maia_plan."""
+    lines = [
+        f"line {row.line} ({row.name}): {row.error}"
+        for row in errors.head(max_lines).itertuples(index=False)
+    ]
+    if len(errors) > max_lines:
+        lines.append(f"... and {len(errors) - max_lines} more")
+    return "\n".join(lines)
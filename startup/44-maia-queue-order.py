@@ -0,0 +1,184 @@
+import time
+
+import numpy as np
+
+
+def scan_travel_times(defns, *, start=None, params=None, return_to_origin=False, **kwargs):
+    """Stage travel times between fly_maia scans.
+
+    Parameters
+    ----------
+    defns : list of MaiaFlyDefinition
+    start : (float, float), optional
+        Current (x, y) of the stage.
+    params : MaiaMotionParams, optional
+    return_to_origin : bool, optional
+        Whether scans return to their start corner at the end.  If not
+        the next scan starts from where the last row finished.
+
+    Returns
+    -------
+    travel : np.ndarray
+        travel[i, j] is the time in s from the end of scan i to the start
+        of scan j, x and y moving together.
+    first : np.ndarray
+        Time from ``start`` to the start of every scan, zeros if no
+        ``start`` is given.
+    """
+    params = params or MaiaMotionParams()
+    est = estimate_fly_maia_times(
+        **definition_columns(defns), params=params, return_to_origin=return_to_origin, **kwargs
+    )
+    x0, y0, x1, y1 = est["x_start"], est["y_start"], est["x_end"], est["y_end"]
+
+    def travel_time(xa, ya, xb, yb):
+        return np.maximum(
+            _axis_travel_time(xa, xb, params.x_velocity, params.x_accl, params.x_backlash),
+            _axis_travel_time(ya, yb, params.y_velocity, params.y_accl, params.y_backlash),
+        )
+
+    travel = travel_time(x1[:, None], y1[:, None], x0[None, :], y0[None, :])
+    if start is None:
+        first = np.zeros(len(defns))
+    else:
+        first = travel_time(start[0], start[1], x0, y0)
+    return travel, first
+
+
+def _route_time(order, travel, first):
+    order = np.asarray(order)
+    return float(first[order[0]] + travel[order[:-1], order[1:]].sum())
+
+
+def _swap_delta(order, i, j, travel, first):
+    """Change of the route time if the scans at positions i < j swap, from the legs they touch."""
+    # leg k arrives at position k, leg 0 from the stage start
+    legs = {k for k in (i, i + 1, j, j + 1) if k < len(order)}
+
+    def legs_time():
+        return sum(
+            first[order[0]] if k == 0 else travel[order[k - 1], order[k]] for k in legs
+        )
+
+    before = legs_time()
+    order[i], order[j] = order[j], order[i]
+    after = legs_time()
+    order[i], order[j] = order[j], order[i]
+    return after - before
+
+
+def order_scans_for_travel(
+    defns, *, start=None, pinned=(), params=None, return_to_origin=False, max_passes=20, max_time=2.0
+):
+    """Reorder fly_maia scans to cut the stage travel between them.
+
+    The order is built nearest neighbour first and then improved by
+    swapping pairs of scans until no swap helps, or for at most
+    ``max_time`` s.  Pinned scans keep their place in the queue, the
+    others fill the remaining slots.
+
+    Parameters
+    ----------
+    defns : list of MaiaFlyDefinition
+    start : (float, float), optional
+        Current (x, y) of the stage, where the first scan is reached from.
+    pinned : iterable of int, optional
+        Indices of scans that must stay where they are.
+    params : MaiaMotionParams, optional
+    return_to_origin : bool, optional
+        See scan_travel_times.  Chained scans (False) end away from
+        their origin, which changes the best order.
+    max_passes : int, optional
+        Most passes over all the pairs of scans.
+    max_time : float, optional
+        Time in s after which the swaps stop and the order so far is
+        kept, so large queues do not hold up the GUI.
+
+    Returns
+    -------
+    order : list of int
+        Indices into ``defns`` in the new order.
+    before, after : float
+        Total travel time in s of the original and the new order.
+    """
+    n = len(defns)
+    if n < 2:
+        return list(range(n)), 0.0, 0.0
+    travel, first = scan_travel_times(
+        defns, start=start, params=params, return_to_origin=return_to_origin
+    )
+    pinned = set(pinned)
+    free_slots = [i for i in range(n) if i not in pinned]
+
+    # nearest neighbour, pinned scans stay in their slot
+    order = []
+    remaining = set(free_slots)
+    for slot in range(n):
+        if slot in pinned:
+            order.append(slot)
+            continue
+        candidates = sorted(remaining)
+        cost = first[candidates] if not order else travel[order[-1], candidates]
+        best = candidates[int(np.argmin(cost))]
+        order.append(best)
+        remaining.remove(best)
+
+    # pairwise swaps of the free slots
+    deadline = time.monotonic() + max_time
+    for _ in range(max_passes):
+        improved = False
+        for a in range(len(free_slots)):
+            if time.monotonic() > deadline:
+                break
+            for b in range(a + 1, len(free_slots)):
+                i, j = free_slots[a], free_slots[b]
+                if _swap_delta(order, i, j, travel, first) < -1e-9:
+                    order[i], order[j] = order[j], order[i]
+                    improved = True
+        if not improved or time.monotonic() > deadline:
+            break
+    best_time = _route_time(order, travel, first)
+
+    before = _route_time(list(range(n)), travel, first)
+    if best_time >= before:
+        return list(range(n)), before, before
+    return order, before, best_time
+
+
+def estimate_scan_gaps(defns, *, params=None, return_to_origin=False, **kwargs):
+    """Time in s from the last row of each scan to the first row of the next.
+
+    This is how long the shutter is open for nothing when it is kept
+    open between two scans: the end of the scan, the travel to the next
+    one and its set up, outline and backlash take-up.  The last scan has
+    no gap (inf).
+    """
+    params = params or MaiaMotionParams()
+    n = len(defns)
+    gaps = np.full(n, np.inf)
+    if n < 2:
+        return gaps
+    est = estimate_fly_maia_times(
+        **definition_columns(defns),
+        params=params,
+        return_to_origin=return_to_origin,
+        open_shutter=False,
+        close_shutter=False,
+        **kwargs,
+    )
+    travel, _ = scan_travel_times(defns, params=params, return_to_origin=return_to_origin, **kwargs)
+    dwell = np.asarray([d.dwell for d in defns], dtype=float)
+    row_time = est["xnum"] * dwell + est["per_row"]
+    before_rows = est["setup"] + est["outline"] + est["rows"] - (est["ynum"] + 1) * row_time
+    gaps[:-1] = est["cleanup"][:-1] + travel[np.arange(n - 1), np.arange(1, n)] + before_rows[1:]
+    return gaps
+
+
+def shutter_close_after(defns, *, max_gap, params=None, return_to_origin=False, **kwargs):
+    """Which scans of a batch should close the shutter at their end.
+
+    The shutter is kept open into the next scan if the gap to it is at
+    most ``max_gap`` s; the last scan always closes it.
+    """
+    gaps = estimate_scan_gaps(defns, params=params, return_to_origin=return_to_origin, **kwargs)
+    return gaps > max_gap
@@ -0,0 +1,228 @@
+import datetime
+import json
+import os
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+from bluesky.suspenders import SuspendFloor
+
+# Beam outages seen by the beam suspender go here, one JSON line each,
+# so the time lost to them can be reported per night across sessions.
+MAIA_BEAM_LOG = os.environ.get(
+    "MAIA_BEAM_LOG",
+    None if MAIA_SIMULATE else os.path.expanduser("~/.maia_gui/beam_outages.jsonl"),
+)
+
+
+@dataclass
+class MaiaBeamPolicy:
+    """When scans are suspended for the beam.
+
+    Scans suspend when the ring current drops below ``floor`` mA and
+    resume ``resume_delay`` s after it is back above ``resume_thresh``,
+    to let the optics settle after a refill.
+    """
+    floor: float = 395.0
+    resume_thresh: float = 400.0
+    resume_delay: float = 60.0
+
+
+def beam_night(t):
+    """The night a unix time belongs to, from noon to noon, as the date of the evening."""
+    return (datetime.datetime.fromtimestamp(t) - datetime.timedelta(hours=12)).date()
+
+
+class BeamOutageLog:
+    """Beam outages and the runs they interrupted.
+
+    An outage lasts from the current dropping below the policy floor to
+    it being back above the resume threshold.  The suspender pre_plan
+    calls ``suspended``, which marks the runs open at that point as
+    interrupted; their data has a gap and they have to be taken again.
+    Subscribe the log to the RunEngine so it knows which runs are open.
+
+    Parameters
+    ----------
+    policy : MaiaBeamPolicy
+    path : str, optional
+        JSON lines file every finished outage and every interrupted run
+        is appended to.  In memory only if None.
+    """
+
+    def __init__(self, policy, path=None):
+        self.policy = policy
+        self.path = path
+        self.records = []
+        # number of run interruptions so far, for callers to check if a
+        # scan was hit
+        self.interruptions = 0
+        self.interrupted_runs = set()
+        self._open_runs = {}
+        self._outage = None
+        self._suspended_at = None
+
+    def _write(self, record):
+        self.records.append(record)
+        if self.path is None:
+            return
+        # called from the beam_current callback, don't let a bad path lose the record
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"Could not write the beam outage log {self.path}: {e}")
+
+    @property
+    def beam_down(self):
+        return self._outage is not None
+
+    def current_changed(self, value, **kwargs):
+        """beam_current subscription, tracks the start and end of outages."""
+        if value is None:
+            return
+        now = time.time()
+        if self._outage is None and value < self.policy.floor:
+            self._outage = {"kind": "outage", "start": now, "runs": []}
+            print(f"Beam current {value:.1f} mA, below {self.policy.floor} mA at {time.ctime(now)}")
+        elif self._outage is not None and value >= self.policy.resume_thresh:
+            outage, self._outage = self._outage, None
+            outage["end"] = now
+            outage["duration"] = now - outage["start"]
+            self._write(outage)
+            print(f"Beam back after {format_duration(outage['duration'])}")
+
+    def __call__(self, name, doc):
+        if name == "start":
+            self._open_runs[doc["uid"]] = doc
+        elif name == "stop":
+            start = self._open_runs.pop(doc["run_start"], None)
+            if start is not None and doc["run_start"] in self.interrupted_runs:
+                self._write({
+                    "kind": "rescan",
+                    "uid": start["uid"],
+                    "plan_name": start.get("plan_name"),
+                    "start": start["time"],
+                    "end": doc["time"],
+                    # time spent scanning that has to be spent again
+                    "scan_time": doc["time"] - start["time"] - self._suspended_time(start["uid"]),
+                })
+
+    def _suspended_time(self, uid):
+        return sum(
+            r["resumed"] - r["suspended"]
+            for r in self.records
+            if r["kind"] == "suspension" and uid in r["runs"]
+        )
+
+    def suspended(self):
+        """Called when a plan is suspended, marks the open runs as interrupted."""
+        runs = list(self._open_runs)
+        self._suspended_at = (time.time(), runs)
+        if not runs:
+            return
+        self.interruptions += 1
+        self.interrupted_runs.update(runs)
+        if self._outage is not None:
+            self._outage["runs"] += runs
+        print(f"Beam lost during {len(runs)} run(s), they are marked to be taken again")
+
+    def resumed(self):
+        """Called when a suspended plan resumes."""
+        if self._suspended_at is None:
+            return
+        (t, runs), self._suspended_at = self._suspended_at, None
+        self.records.append({"kind": "suspension", "suspended": t, "resumed": time.time(), "runs": runs})
+
+    def load(self):
+        """All recorded outages and rescans, from the file if there is one."""
+        if self.path is None or not os.path.exists(self.path):
+            return list(self.records)
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def beam_outage_report(log=None):
+    """Time lost to beam outages per night.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexed by night with the number of outages, the beam down time,
+        the number of runs that have to be taken again, the scan time
+        spent on them and the total time lost, all times in s.
+    """
+    log = log or beam_outages
+    records = [r for r in log.load() if r["kind"] in ("outage", "rescan")]
+    columns = ["outages", "beam_down", "rescans", "rescan_time", "lost"]
+    if not records:
+        print("No beam outages recorded")
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records)
+    df["night"] = df["start"].apply(beam_night)
+    outages = df[df["kind"] == "outage"].groupby("night")
+    rescans = df[df["kind"] == "rescan"].groupby("night")
+    report = pd.DataFrame({
+        "outages": outages.size(),
+        "beam_down": outages["duration"].sum() if "duration" in df else 0.0,
+        "rescans": rescans.size(),
+        "rescan_time": rescans["scan_time"].sum() if "scan_time" in df else 0.0,
+    }).fillna(0)
+    report[["outages", "rescans"]] = report[["outages", "rescans"]].astype(int)
+    report["lost"] = report["beam_down"] + report["rescan_time"]
+    table = report.copy()
+    for c in ("beam_down", "rescan_time", "lost"):
+        table[c] = table[c].apply(format_duration)
+    print(table)
+    return report[columns]
+
+
+def install_beam_suspender(RE, beam_current, *, shutter=shutter, policy=None, log=None):
+    """Suspend scans while the ring current is low.
+
+    The shutter is closed for the outage and reopened when the scan
+    resumes.  fly_maia has a checkpoint at every row, so a scan stops
+    where it is and finishes the row once the beam is back; the
+    interrupted run is recorded in ``log``.
+
+    Returns
+    -------
+    SuspendFloor
+        Pass it to RE.remove_suspender to stop suspending on the beam.
+    """
+    policy = policy or MaiaBeamPolicy()
+    log = log or BeamOutageLog(policy)
+    shutter_pre_plan, shutter_post_plan = shutter_suspend_plans(shutter)
+
+    def pre_plan():
+        log.suspended()
+        yield from shutter_pre_plan()
+
+    def post_plan():
+        yield from shutter_post_plan()
+        log.resumed()
+
+    suspender = SuspendFloor(
+        beam_current,
+        policy.floor,
+        resume_thresh=policy.resume_thresh,
+        sleep=policy.resume_delay,
+        pre_plan=pre_plan,
+        post_plan=post_plan,
+        tripped_message=f"ring current below {policy.floor} mA",
+    )
+    RE.install_suspender(suspender)
+    return suspender
+
+
+if MAIA_SIMULATE:
+    beam_current = SimBeamCurrent(name="beam_current")
+
+beam_policy = MaiaBeamPolicy()
+if MAIA_SIMULATE:
+    beam_policy.resume_delay /= SIM_TIME_SCALE
+beam_outages = BeamOutageLog(beam_policy, MAIA_BEAM_LOG)
+beam_current.subscribe(beam_outages.current_changed)
+RE.subscribe(beam_outages)
+beam_suspender = install_beam_suspender(RE, beam_current, policy=beam_policy, log=beam_outages)
@@ -1,8 +1,19 @@
+import collections
+import contextlib
 import copy
+import json
+import math
+import os
 import queue
+import threading
+import time
 import traceback
-from dataclasses import asdict, dataclass, fields
+import urllib.request
+import uuid
+import warnings
+from dataclasses import asdict, dataclass, fields, is_dataclass
 from enum import Enum
+from functools import partial
 from multiprocessing import Pipe, Process, Value
 from typing import Optional
 from unittest.mock import Mock
@@ -10,8 +21,10 @@ import builtins
 import sys
 
 import bluesky.plan_stubs as bps
+import matplotlib
+import numpy as np
 import pandas as pd
-from bluesky.run_engine import RunEngine
+from bluesky.run_engine import DuringTask, RunEngine
 from ophyd import Component as Cpt
 from ophyd import Device, EpicsMotor, EpicsSignalRO
 from bluesky.utils import install_qt_kicker, RunEngineInterrupted
@@ -71,33 +84,92 @@ class RequestStatus(Enum):
     COLLECTING = (QtCore.Qt.GlobalColor.black, QtCore.Qt.GlobalColor.green) 
     COMPLETE = (QtCore.Qt.GlobalColor.black, QtCore.Qt.GlobalColor.cyan)
     QUEUED = (QtCore.Qt.GlobalColor.black, QtCore.Qt.GlobalColor.white)
+    # interrupted by a beam outage, to be taken again
+    REACQUIRE = (QtCore.Qt.GlobalColor.black, QtCore.Qt.GlobalColor.yellow)
+
+    @property
+    def pending(self):
+        return self in (RequestStatus.QUEUED, RequestStatus.REACQUIRE)
+
+
+# times a scan is taken again after beam outages before it is left as it is
+MAIA_MAX_REACQUIRE = 2
 
 
 class QueueItem:
-    def __init__(self, label, data):
+    def __init__(self, label, data, id=None):
         self.label = label
         self.data = data
         self.status = RequestStatus.QUEUED
+        # fraction of the scan done while collecting
+        self.progress = None
+        # stable reference that survives reorders and removes
+        self.id = id or uuid.uuid4().hex
+        # keep this row when the queue order is optimized
+        self.pinned = False
+        # times the scan was taken again after a beam outage
+        self.retries = 0
 
 
 class QueueModel:
+    """Ordered queue of QueueItems with label and id indexes.
+
+    Label checks, id lookups and row lookups are dict lookups, so adding
+    and updating items does not scan the queue.
+    """
+
     def __init__(self):
         self.queue: list[QueueItem] = []
+        self._labels: dict[str, QueueItem] = {}
+        self._ids: dict[str, QueueItem] = {}
+        self._rows: dict[str, int] = {}
 
-    def add_item(self, item):
+    def validate_item(self, item):
         # Check if item label is empty
         if not item.label:
             raise ValueError("No label specified for item")
         # Check if new item has the same label as existing item
-        for i in self.queue:
-            if i.label == item.label:
-                raise ValueError(f"Item with label {item.label} already exists")
+        if item.label in self._labels:
+            raise ValueError(f"Item with label {item.label} already exists")
+
+    def validate_items(self, items):
+        """Check a batch of new items, raising one error listing every problem."""
+        errors = []
+        seen = set()
+        for item in items:
+            try:
+                self.validate_item(item)
+                if item.label in seen:
+                    raise ValueError(f"Item with label {item.label} is repeated")
+            except ValueError as e:
+                errors.append(str(e))
+            seen.add(item.label)
+        if errors:
+            raise ValueError("\n".join(errors))
+
+    def _index(self, start=0):
+        for row in range(start, len(self.queue)):
+            self._rows[self.queue[row].id] = row
+
+    def add_item(self, item):
+        self.add_items([item])
 
-        self.queue.append(item)
+    def add_items(self, items):
+        self.validate_items(items)
+        start = len(self.queue)
+        self.queue.extend(items)
+        for item in items:
+            self._labels[item.label] = item
+            self._ids[item.id] = item
+        self._index(start)
 
     def remove_item(self, index):
         if 0 <= index < len(self.queue):
-            del self.queue[index]
+            item = self.queue.pop(index)
+            del self._labels[item.label]
+            del self._ids[item.id]
+            del self._rows[item.id]
+            self._index(index)
 
     def move_item_up(self, index):
         if 1 <= index < len(self.queue):
@@ -105,6 +177,8 @@ class QueueModel:
                 self.queue[index],
                 self.queue[index - 1],
             )
+            self._rows[self.queue[index - 1].id] = index - 1
+            self._rows[self.queue[index].id] = index
 
     def move_item_down(self, index):
         if 0 <= index < len(self.queue) - 1:
@@ -112,24 +186,353 @@ class QueueModel:
                 self.queue[index],
                 self.queue[index + 1],
             )
+            self._rows[self.queue[index].id] = index
+            self._rows[self.queue[index + 1].id] = index + 1
+
+    def reorder(self, items):
+        """Replace the queue order, ``items`` must be the queued items."""
+        if sorted(item.id for item in items) != sorted(self._ids):
+            raise ValueError("Reorder must keep the same items")
+        self.queue[:] = items
+        self._index()
 
     def get_items(self):
         return self.queue
 
+    def get_item(self, id):
+        return self._ids.get(id)
+
+    def row_of(self, item):
+        """Current row of an item, or None if it is no longer queued."""
+        return self._rows.get(item.id)
+
+    def next_pending(self, statuses=None):
+        return next_pending(self.queue, statuses)
+
+
+def next_pending(items, statuses=None):
+    """Next of ``items`` to collect, the scans to be taken again after all the queued ones.
+
+    ``statuses`` maps item ids to a status to use instead of the one
+    the item has, e.g. one that was sent to the GUI but not set yet.
+    """
+    statuses = statuses or {}
+    reacquire = None
+    for item in list(items):
+        status = statuses.get(item.id, item.status)
+        if status is RequestStatus.QUEUED:
+            return item
+        if reacquire is None and status is RequestStatus.REACQUIRE:
+            reacquire = item
+    return reacquire
+
+
+# what the executor thread sees of a QueueItem, copied in the GUI thread
+QueueEntry = collections.namedtuple("QueueEntry", ["id", "label", "data", "status", "retries"])
+
+
+def queue_snapshot(items):
+    """QueueEntry copies of QueueItems, in queue order."""
+    return [
+        QueueEntry(item.id, item.label, copy.copy(item.data), item.status, item.retries)
+        for item in items
+    ]
+
+
+MAIA_QUEUE_JOURNAL_DIR = os.environ.get(
+    "MAIA_QUEUE_JOURNAL_DIR", os.path.expanduser("~/.maia_gui")
+)
+
+
+def _encode_data(obj):
+    if is_dataclass(obj):
+        return {
+            "type": type(obj).__name__,
+            "fields": {f.name: _encode_data(getattr(obj, f.name)) for f in fields(obj)},
+        }
+    if hasattr(obj, "item"):
+        # numpy scalars from imported plans
+        return obj.item()
+    return obj
+
+
+def _decode_data(obj):
+    types = {
+        cls.__name__: cls
+        for cls in (MaiaFlyDefinition, Position, SampleMetadata, ScanMetadata)
+    }
+    if isinstance(obj, dict) and "type" in obj and "fields" in obj:
+        kwargs = {k: _decode_data(v) for k, v in obj["fields"].items()}
+        return types[obj["type"]](**kwargs)
+    return obj
+
+
+class QueueJournal:
+    """Append-only journal of a queue, replayed to restore it.
+
+    Every add, remove, move, reorder, pin and status change is appended as one JSON
+    line and fsynced, so the queue and the COMPLETE status of items
+    survive a crash or a reload of the GUI.  On restore the journal is
+    replayed, an item that was COLLECTING goes back to QUEUED and the
+    file is rewritten as a compact snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _write(self, records, mode="a", path=None):
+        with open(path or self.path, mode) as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _add_record(self, item):
+        return {
+            "op": "add",
+            "id": item.id,
+            "label": item.label,
+            "status": item.status.name,
+            "pinned": item.pinned,
+            "retries": item.retries,
+            "data": _encode_data(item.data),
+            "time": time.time(),
+        }
+
+    def record_add(self, items):
+        self._write([self._add_record(item) for item in items])
+
+    def record_remove(self, item):
+        self._write([{"op": "remove", "id": item.id, "time": time.time()}])
+
+    def record_move(self, item, row):
+        self._write([{"op": "move", "id": item.id, "row": row, "time": time.time()}])
+
+    def record_order(self, items):
+        self._write([{"op": "order", "ids": [item.id for item in items], "time": time.time()}])
+
+    def record_pinned(self, item):
+        self._write(
+            [{"op": "pinned", "id": item.id, "pinned": item.pinned, "time": time.time()}]
+        )
+
+    def record_status(self, item):
+        self._write([{
+            "op": "status",
+            "id": item.id,
+            "status": item.status.name,
+            "retries": item.retries,
+            "time": time.time(),
+        }])
+
+    def restore(self):
+        items = {}
+        order = []
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return []
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn last line from a crash
+                    continue
+                op = record["op"]
+                if op == "order":
+                    ids = [id for id in record["ids"] if id in items]
+                    rest = [id for id in order if id not in set(ids)]
+                    order = ids + rest
+                    continue
+                id = record["id"]
+                if op == "add":
+                    item = QueueItem(record["label"], _decode_data(record["data"]), id=id)
+                    item.status = RequestStatus[record["status"]]
+                    item.pinned = record.get("pinned", False)
+                    item.retries = record.get("retries", 0)
+                    items[id] = item
+                    order.append(id)
+                elif id not in items:
+                    continue
+                elif op == "remove":
+                    del items[id]
+                    order.remove(id)
+                elif op == "move":
+                    order.remove(id)
+                    order.insert(record["row"], id)
+                elif op == "status":
+                    items[id].status = RequestStatus[record["status"]]
+                    items[id].retries = record.get("retries", items[id].retries)
+                elif op == "pinned":
+                    items[id].pinned = record["pinned"]
+
+        restored = [items[id] for id in order]
+        for item in restored:
+            if item.status is RequestStatus.COLLECTING:
+                item.status = RequestStatus.QUEUED
+        tmp = self.path + ".tmp"
+        self._write([self._add_record(item) for item in restored], mode="w", path=tmp)
+        os.replace(tmp, self.path)
+        return restored
+
+
+def queue_item_tooltip(item):
+    text = """<table border='1' style='border-collapse: collapse;'>
+    <tr>
+    <th style='border: 1px solid black;'>Parameter</th>
+    <th style='border: 1px solid black;'>Value</th>
+    </tr>"""
+    for field in fields(item.data):
+        key = field.name
+        value = getattr(item.data, key)
+
+        text += f"""<tr><td style='border: 1px solid black;'>{key}</td>
+        <td style='border: 1px solid black;'>{value}</td></tr>"""
+    return text + "</table>"
+
+
+class QueueListModel(QtCore.QAbstractListModel):
+    """Qt list model over a QueueModel.
+
+    All changes to the queue go through this class so that views get
+    row level insert/remove/move/dataChanged notifications instead of a
+    rebuild.  Tooltips are only generated when the view asks for one.
+    """
+
+    def __init__(self, queue_model: QueueModel, journal: Optional[QueueJournal] = None):
+        super().__init__()
+        self.queue_model = queue_model
+        self.journal = journal
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.queue_model.queue)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.queue_model.queue[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            label = str(item.label)
+            if item.status is RequestStatus.COLLECTING and item.progress is not None:
+                label += f" ({item.progress:.0%})"
+            if item.status is RequestStatus.REACQUIRE:
+                label += f" [beam outage, retake {item.retries}/{MAIA_MAX_REACQUIRE}]"
+            if item.pinned:
+                label += " [pinned]"
+            return label
+        if role == QtCore.Qt.ToolTipRole:
+            return queue_item_tooltip(item)
+        if role == QtCore.Qt.ForegroundRole:
+            return QtGui.QBrush(item.status.value[0])
+        if role == QtCore.Qt.BackgroundRole:
+            return QtGui.QBrush(item.status.value[1])
+        return None
+
+    def item(self, row):
+        return self.queue_model.queue[row]
+
+    def add_item(self, item):
+        self.add_items([item])
+
+    def add_items(self, items):
+        if not items:
+            return
+        self.queue_model.validate_items(items)
+        row = len(self.queue_model.queue)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(items) - 1)
+        self.queue_model.add_items(items)
+        self.endInsertRows()
+        if self.journal is not None:
+            self.journal.record_add(items)
+
+    def remove_item(self, row):
+        if 0 <= row < len(self.queue_model.queue):
+            item = self.queue_model.queue[row]
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            self.queue_model.remove_item(row)
+            self.endRemoveRows()
+            if self.journal is not None:
+                self.journal.record_remove(item)
+
+    def move_item_up(self, row):
+        if 1 <= row < len(self.queue_model.queue):
+            self.beginMoveRows(
+                QtCore.QModelIndex(), row, row, QtCore.QModelIndex(), row - 1
+            )
+            self.queue_model.move_item_up(row)
+            self.endMoveRows()
+            if self.journal is not None:
+                self.journal.record_move(self.queue_model.queue[row - 1], row - 1)
+
+    def move_item_down(self, row):
+        if 0 <= row < len(self.queue_model.queue) - 1:
+            # destination is the row the item ends up in front of
+            self.beginMoveRows(
+                QtCore.QModelIndex(), row, row, QtCore.QModelIndex(), row + 2
+            )
+            self.queue_model.move_item_down(row)
+            self.endMoveRows()
+            if self.journal is not None:
+                self.journal.record_move(self.queue_model.queue[row + 1], row + 1)
+
+    def reorder(self, items):
+        self.beginResetModel()
+        self.queue_model.reorder(items)
+        self.endResetModel()
+        if self.journal is not None:
+            self.journal.record_order(items)
+
+    def set_pinned(self, item, pinned):
+        item.pinned = pinned
+        if self.journal is not None:
+            self.journal.record_pinned(item)
+        self.item_changed(item)
+
+    def set_status(self, item, status):
+        if status is RequestStatus.REACQUIRE:
+            item.retries += 1
+        item.status = status
+        item.progress = None
+        if self.journal is not None and self.queue_model.row_of(item) is not None:
+            self.journal.record_status(item)
+        self.item_changed(item)
+
+    def item_changed(self, item):
+        row = self.queue_model.row_of(item)
+        if row is None:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
 
 class QueueWidget(QtWidgets.QWidget):
     queue_updated = QtCore.Signal(object)
 
-    def __init__(self):
+    def __init__(self, journal_name=None):
         super().__init__()
         self.model = QueueModel()
+        journal = None
+        if journal_name is not None:
+            journal = QueueJournal(os.path.join(MAIA_QUEUE_JOURNAL_DIR, journal_name))
+        self.list_model = QueueListModel(self.model, journal)
         self.init_ui()
+        if journal is not None:
+            restored = journal.restore()
+            self.model.add_items(restored)
+            self.list_model.beginResetModel()
+            self.list_model.endResetModel()
 
     def init_ui(self):
         self.setLayout(QtWidgets.QVBoxLayout())
 
-        self.list_widget = QtWidgets.QListWidget()
-        self.layout().addWidget(self.list_widget)
+        self.list_view = QtWidgets.QListView()
+        self.list_view.setModel(self.list_model)
+        self.list_view.setUniformItemSizes(True)
+        self.layout().addWidget(self.list_view)
 
         # self.add_button = QtWidgets.QPushButton("Add Item")
         # self.add_button.clicked.connect(self.add_item)
@@ -146,10 +549,17 @@ class QueueWidget(QtWidgets.QWidget):
         self.down_button = QtWidgets.QPushButton("Move Down")
         self.down_button.clicked.connect(self.move_item_down)
         self.layout().addWidget(self.down_button)
-        self.list_widget.itemEntered.connect(self.show_tooltip)
 
-    def show_tooltip(self, item):
-        QtWidgets.QToolTip.showText(QtGui.QCursor.pos(), item.toolTip())
+    def selected_row(self):
+        indexes = self.list_view.selectionModel().selectedIndexes()
+        if indexes:
+            return indexes[0].row()
+        return None
+
+    def index_at(self, global_pos):
+        return self.list_view.indexAt(
+            self.list_view.viewport().mapFromGlobal(global_pos)
+        )
 
     def add_item(self):
         """
@@ -167,48 +577,27 @@ class QueueWidget(QtWidgets.QWidget):
         pass
 
     def remove_item(self):
-        selected_items = self.list_widget.selectedItems()
-        if selected_items:
-            index = self.list_widget.row(selected_items[0])
-            self.model.remove_item(index)
-            self.update_list()
+        index = self.selected_row()
+        if index is not None:
+            self.list_model.remove_item(index)
+            self.queue_updated.emit(self.model.get_items())
 
     def move_item_up(self):
-        selected_items = self.list_widget.selectedItems()
-        if selected_items:
-            index = self.list_widget.row(selected_items[0])
-            self.model.move_item_up(index)
-            self.update_list()
+        index = self.selected_row()
+        if index is not None:
+            self.list_model.move_item_up(index)
+            self.queue_updated.emit(self.model.get_items())
 
     def move_item_down(self):
-        selected_items = self.list_widget.selectedItems()
-        if selected_items:
-            index = self.list_widget.row(selected_items[0])
-            self.model.move_item_down(index)
-            self.update_list()
+        index = self.selected_row()
+        if index is not None:
+            self.list_model.move_item_down(index)
+            self.queue_updated.emit(self.model.get_items())
 
     def update_list(self):
-        self.list_widget.clear()
-        for item in self.model.get_items():
-            list_item = QtWidgets.QListWidgetItem(str(item.label))
-            text = """<table border='1' style='border-collapse: collapse;'>
-            <tr>
-            <th style='border: 1px solid black;'>Parameter</th>
-            <th style='border: 1px solid black;'>Value</th>
-            </tr>"""
-            # for key, value in item.data[0].items():
-            for field in fields(item.data):
-                key = field.name
-                value = getattr(item.data, key)
-
-                text += f"""<tr><td style='border: 1px solid black;'>{key}</td>
-                <td style='border: 1px solid black;'>{value}</td></tr>"""
-            text = text + "</table>"
-            list_item.setToolTip(text)
-            list_item.setForeground(QtGui.QBrush(item.status.value[0]))
-            list_item.setBackground(QtGui.QBrush(item.status.value[1]))
-            self.list_widget.addItem(list_item)
-
+        # Full refresh, only needed if self.model was changed directly
+        self.list_model.beginResetModel()
+        self.list_model.endResetModel()
         self.queue_updated.emit(self.model.get_items())
 
 
@@ -217,11 +606,9 @@ class SamplePositionQueueWidget(QueueWidget):
 
     def contextMenuEvent(self, event):
         # Find the item at the click position
-        item = self.list_widget.itemAt(
-            self.list_widget.mapFromGlobal(event.globalPos())
-        )
+        index = self.index_at(event.globalPos())
 
-        if item:
+        if index.isValid():
             # Create a context menu
             menu = QtWidgets.QMenu(self)
 
@@ -229,22 +616,21 @@ class SamplePositionQueueWidget(QueueWidget):
             go_to_position_action = menu.addAction("Go to position")
 
             go_to_position_action.triggered.connect(
-                lambda: self.emit_go_to_position(item)
+                lambda: self.emit_go_to_position(index.row())
             )
 
             # Execute the menu and get the selected action
             action = menu.exec_(event.globalPos())
 
-    def emit_go_to_position(self, item):
-        index = self.list_widget.indexFromItem(item).row()
-        position_item = self.model.get_items()[index]
+    def emit_go_to_position(self, index):
+        position_item = self.list_model.item(index)
         self.go_to_position_signal.emit(position_item.data)
 
     def add_item(self, position_name, x, y, z):
         item = QueueItem(label=position_name, data=Position(x, y, z))
         try:
-            self.model.add_item(item)
-            self.update_list()
+            self.list_model.add_item(item)
+            self.queue_updated.emit(self.model.get_items())
         except ValueError as e:
             show_error_message(str(e))
 
@@ -254,11 +640,9 @@ class CollectionQueueWidget(QueueWidget):
 
     def contextMenuEvent(self, event):
         # Find the item at the click position
-        item = self.list_widget.itemAt(
-            self.list_widget.mapFromGlobal(event.globalPos())
-        )
+        index = self.index_at(event.globalPos())
 
-        if item:
+        if index.isValid():
             # Create a context menu
             menu = QtWidgets.QMenu(self)
 
@@ -268,27 +652,80 @@ class CollectionQueueWidget(QueueWidget):
             # move_up_action = menu.addAction("Move Up")
             # move_down_action = menu.addAction("Move Down")
 
-            edit_action.triggered.connect(lambda: self.edit_item(item))
+            edit_action.triggered.connect(lambda: self.edit_item(index.row()))
+
+            item = self.list_model.item(index.row())
+            pin_action = menu.addAction("Unpin position" if item.pinned else "Pin position")
+            pin_action.triggered.connect(
+                lambda: self.list_model.set_pinned(item, not item.pinned)
+            )
 
             # Execute the menu and get the selected action
             action = menu.exec_(event.globalPos())
 
-    def edit_item(self, item):
-        index = self.list_widget.indexFromItem(item).row()
-        queue_item = self.model.get_items()[index]
+    def edit_item(self, index):
+        queue_item = self.list_model.item(index)
         self.selected_item_data_signal.emit(queue_item.data, index)
     
     def set_status(self, item: QueueItem, status: RequestStatus):
-        item.status = status
-        self.update_list()
+        self.list_model.set_status(item, status)
+        self.queue_updated.emit(self.model.get_items())
+
+    def set_progress(self, item: QueueItem, progress: float):
+        item.progress = progress
+        self.list_model.item_changed(item)
 
     def add_item(self, label, data: MaiaFlyDefinition):
-        item = QueueItem(label=label, data=data)
+        self.add_items([(label, data)])
+
+    def optimize_order(self, start, *, chain=True):
+        """Reorder the queued scans to cut stage travel.
+
+        Only QUEUED items move, and only between the rows QUEUED items
+        already hold; pinned items, running and complete scans stay put.
+        Scans to be taken again after a beam outage (REACQUIRE) run after
+        all QUEUED ones whatever their row, so they are left out too.
+
+        Returns
+        -------
+        before, after : float
+            Stage travel time in s of the old and new order.
+        """
+        items = list(self.model.get_items())
+        rows = [
+            row for row, item in enumerate(items) if item.status is RequestStatus.QUEUED
+        ]
+        pending = [items[row] for row in rows]
+        order, before, after = order_scans_for_travel(
+            [item.data for item in pending],
+            start=start,
+            pinned=[i for i, item in enumerate(pending) if item.pinned],
+            params=MaiaMotionParams.from_stage(M),
+            return_to_origin=not chain,
+        )
+        if after < before:
+            for row, i in zip(rows, order):
+                items[row] = pending[i]
+            self.list_model.reorder(items)
+            self.queue_updated.emit(self.model.get_items())
+        return before, after
+
+    def add_items(self, requests):
+        """Add (label, MaiaFlyDefinition) pairs, all or none.
+
+        Returns
+        -------
+        bool
+            Whether the items were added.
+        """
+        items = [QueueItem(label=label, data=data) for label, data in requests]
         try:
-            self.model.add_item(item)
+            self.list_model.add_items(items)
         except ValueError as e:
             show_error_message(str(e))
-        self.update_list()
+            return False
+        self.queue_updated.emit(self.model.get_items())
+        return True
 
 
 
@@ -298,7 +735,7 @@ class RunEngineState(str, Enum):
     paused = "paused"
 
 
-def maia_plan(payload):
+def maia_plan(payload, **kwargs):
     def main_plan(payload):
         yield from fly_maia(
                 ystart=payload.ystart,
@@ -312,12 +749,279 @@ def maia_plan(payload):
                 hf_stage=M,
                 maia=maia,
                 print_params=True,
+                **kwargs,
             )
     
     return (yield from main_plan(payload))
 
-class RunEngineControls:
+
+def _on_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+class MainThreadDuringTask(DuringTask):
+    """Blocks with ``during_task`` on the main thread and plainly waits on any other."""
+
+    def __init__(self, during_task):
+        super().__init__()
+        self.during_task = during_task
+
+    def block(self, blocking_event):
+        if _on_main_thread():
+            self.during_task.block(blocking_event)
+        else:
+            blocking_event.wait()
+
+
+def main_thread_only(context_manager):
+    """RunEngine context manager that is only entered on the main thread."""
+    def enter(RE):
+        return context_manager(RE) if _on_main_thread() else contextlib.nullcontext()
+    enter.main_thread_only = True
+    return enter
+
+
+def share_run_engine_with_threads(RE):
+    """Let RE be called from a worker thread as well as from IPython.
+
+    The RunEngine installs a SIGINT handler and, with a Qt matplotlib
+    backend, spins the Qt event loop while it waits.  Neither is allowed
+    off the main thread, so both are limited to calls from the main
+    thread, once, leaving IPython use of RE as it was.
+
+    The RE built by nslsii.configure_base carries the databroker and
+    Kafka subscriptions, the baseline preprocessor, the beam suspender
+    and the persistent metadata, which cannot be carried over to a new
+    RunEngine through its public API, so the queue runs on that RE.  It
+    is not built here, so its during task cannot be given to the
+    RunEngine constructor and the private attribute is wrapped instead.
+    """
+    RE.context_managers = [
+        cm if getattr(cm, "main_thread_only", False) else main_thread_only(cm)
+        for cm in RE.context_managers
+    ]
+    if not isinstance(RE._during_task, MainThreadDuringTask):
+        RE._during_task = MainThreadDuringTask(RE._during_task)
+
+
+class QueueExecutor(QtCore.QObject):
+    """Runs the collection queue on the RunEngine from a worker thread.
+
+    The slots are invoked through queued signals so they execute in the
+    worker thread, and everything the GUI needs to know is sent back as
+    signals.  The executor never touches the queue model: the GUI hands
+    it a snapshot of the queue with ``set_queue`` whenever the queue
+    changes, and a new status is sent back as (item id, status) with
+    ``item_status_changed``.  Until the snapshot has it the executor goes
+    by the statuses it sent.  ``RE.request_pause`` is thread safe and
+    can be called from the GUI directly; resume and stop block while the
+    plan (or its cleanup) runs, so they are done here.
+    """
+    state_changed = QtCore.Signal(object, object)
+    item_status_changed = QtCore.Signal(str, object)
+    progress = QtCore.Signal(int, int)
+    document = QtCore.Signal(str, object)
+    error = QtCore.Signal(str)
+    finished = QtCore.Signal()
+
+    def __init__(self, RE):
+        super().__init__()
+        self.RE = RE
+        # QueueEntry snapshot of the queue, replaced by the GUI thread
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self.current_item = None
+        # extra fly_maia arguments, e.g. the outline mode, replaced as a whole
+        self.plan_kwargs = {}
+        # skip the return to the scan origin when another scan follows
+        self.chain_scans = True
+        # leave the shutter open into the next scan if the gap is short
+        self.keep_shutter_open = True
+        self.shutter_gap = SHUTTER_KEEP_OPEN_MAX_GAP
+        self._shutter_left_open = False
+        self._current_kwargs = {}
+        self._interruptions = 0
+        # statuses sent to the GUI, by item id
+        self._statuses = {}
+        share_run_engine_with_threads(self.RE)
+        self._token = self.RE.subscribe(self.document.emit)
+
+    def close(self):
+        self.RE.unsubscribe(self._token)
+
+    def _call_re(self, func, *args):
+        pbar_manager = self.RE.waiting_hook
+        self.RE.waiting_hook = None
+        try:
+            return func(*args)
+        finally:
+            self.RE.waiting_hook = pbar_manager
+
+    def set_queue(self, items):
+        """Take a snapshot of the QueueItems to run, called from the GUI thread."""
+        snapshot = queue_snapshot(items)
+        with self._queue_lock:
+            self._queue = snapshot
+
+    def _snapshot(self):
+        with self._queue_lock:
+            return self._queue
+
+    def _set_status(self, item, status):
+        self._statuses[item.id] = status
+        self.item_status_changed.emit(item.id, status)
+
+    def _status(self, item):
+        return self._statuses.get(item.id, item.status)
+
+    def _next_pending(self):
+        return next_pending(self._snapshot(), self._statuses)
+
+    def _run_current(self, func, *args):
+        """Run the RE call for the current item, return True if it completed."""
+        try:
+            self._call_re(func, *args)
+        except RunEngineInterrupted:
+            return False
+        except Exception as e:
+            traceback.print_exc()
+            self.error.emit(f"{type(e).__name__}: {e}")
+            self._set_status(self.current_item, RequestStatus.QUEUED)
+            self.current_item = None
+            return False
+        if beam_outages.interruptions > self._interruptions:
+            # the map has a gap from the outage, take it again after the
+            # rest of the queue, but not forever if the beam keeps dumping
+            label = self.current_item.label
+            if self.current_item.retries < MAIA_MAX_REACQUIRE:
+                print(f"{label} was interrupted by the beam, queued to be taken again")
+                self._set_status(self.current_item, RequestStatus.REACQUIRE)
+            else:
+                self.error.emit(
+                    f"{label} was interrupted by the beam again after "
+                    f"{self.current_item.retries} retakes, it is left with a gap"
+                )
+                self._set_status(self.current_item, RequestStatus.COMPLETE)
+        else:
+            self._set_status(self.current_item, RequestStatus.COMPLETE)
+        self.current_item = None
+        return True
+
+    def _emit_progress(self):
+        items = self._snapshot()
+        done = sum(self._status(item) is RequestStatus.COMPLETE for item in items)
+        self.progress.emit(done, len(items))
+
+    @QtCore.Slot()
+    def run_queue(self):
+        # Pick the next pending item from the latest snapshot each time,
+        # so edits to the queue while it runs are honoured
+        while (item := self._next_pending()) is not None:
+            self._emit_progress()
+            self.current_item = item
+            self._set_status(item, RequestStatus.COLLECTING)
+            self._interruptions = beam_outages.interruptions
+            self._current_kwargs = self._plan_kwargs(item)
+            if not self._run_current(self.RE, maia_plan(item.data, **self._current_kwargs)):
+                return
+            self._shutter_left_open = self._current_kwargs.get("close_shutter") is False
+        self._close_shutter()
+        self._emit_progress()
+        self.finished.emit()
+
+    def _plan_kwargs(self, item):
+        """fly_maia arguments for item, chained to the next pending item."""
+        kwargs = dict(self.plan_kwargs)
+        next_item = self._next_pending()
+        if next_item is None:
+            return kwargs
+        if self.chain_scans:
+            kwargs["return_to_origin"] = False
+        if self.keep_shutter_open:
+            gap = estimate_scan_gaps(
+                [item.data, next_item.data],
+                params=MaiaMotionParams.from_stage(M),
+                return_to_origin=not self.chain_scans,
+                outline=kwargs.get("outline", "fast"),
+            )[0]
+            if gap <= self.shutter_gap:
+                kwargs["close_shutter"] = False
+        return kwargs
+
+    def _close_shutter(self):
+        # the last scan kept the shutter open for an item that went away
+        if not self._shutter_left_open:
+            return
+        self._shutter_left_open = False
+        try:
+            self._call_re(self.RE, actuate_shutter(shutter, "Close", waits=MaiaFlyWaits()))
+        except Exception as e:
+            self.error.emit(f"Could not close the shutter: {type(e).__name__}: {e}")
+
+    @QtCore.Slot()
+    def resume(self):
+        if self.current_item is None:
+            return
+        if self._run_current(self.RE.resume):
+            self._shutter_left_open = self._current_kwargs.get("close_shutter") is False
+            self.run_queue()
+
+    @QtCore.Slot()
+    def stop(self):
+        try:
+            self._call_re(self.RE.stop)
+        except Exception as e:
+            self.error.emit(f"{type(e).__name__}: {e}")
+        if self.current_item is not None:
+            self._set_status(self.current_item, RequestStatus.QUEUED)
+            self.current_item = None
+
+
+class EventLoopMonitor(QtCore.QObject):
+    """Measures how often the GUI event loop gets to service a timer.
+
+    A timer is asked to fire every ``interval`` ms; the achieved tick
+    rate and the longest gap between ticks are reported once a second.
+    """
+    updated = QtCore.Signal(float, float)
+
+    def __init__(self, interval=20):
+        super().__init__()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._tick)
+        self._last = self._window_start = time.monotonic()
+        self._ticks = 0
+        self._max_gap = 0.0
+        self._timer.start()
+
+    def _tick(self):
+        now = time.monotonic()
+        self._max_gap = max(self._max_gap, now - self._last)
+        self._last = now
+        self._ticks += 1
+        if now - self._window_start >= 1.0:
+            self.updated.emit(self._ticks / (now - self._window_start), self._max_gap)
+            self._window_start = now
+            self._ticks = 0
+            self._max_gap = 0.0
+
+
+class RunEngineControls(QtCore.QObject):
+    """Run, pause and state display of the queue executor.
+
+    Lives in the GUI thread; everything the executor sends from its
+    thread is connected with queued connections to the methods here,
+    which update the widgets and the queue model.
+    """
+    # Signals are delivered to the executor in its own thread
+    class _Requests(QtCore.QObject):
+        run = QtCore.Signal()
+        resume = QtCore.Signal()
+        stop = QtCore.Signal()
+
     def __init__(self, RE, GUI):
+        super().__init__()
         self.RE = RE
         self.GUI = GUI
 
@@ -344,46 +1048,81 @@ class RunEngineControls:
         info_label.setAlignment(QtCore.Qt.AlignLeft)
         # label.setStyleSheet('QLabel {background-color: green; color: white}')
         button_layout.addWidget(info_label)
-        
 
-        self.RE.state_hook = self.handle_state_change
-        self.handle_state_change(self.RE.state, None)
+        self.fps_label = QtWidgets.QLabel("GUI: -")
+        button_layout.addWidget(self.fps_label)
+        self.event_loop_monitor = EventLoopMonitor()
+        self.event_loop_monitor.updated.connect(self.update_fps_label)
+
         self.current_request = None
+        self.executor_thread = QtCore.QThread()
+        self.executor = QueueExecutor(self.RE)
+        self.executor.moveToThread(self.executor_thread)
+        self.update_queue(self.GUI.queue_widget.model.get_items())
+        self.GUI.queue_widget.queue_updated.connect(self.update_queue)
+        self.requests = self._Requests()
+        self.requests.run.connect(self.executor.run_queue)
+        self.requests.resume.connect(self.executor.resume)
+        self.requests.stop.connect(self.executor.stop)
+        queued = QtCore.Qt.QueuedConnection
+        self.executor.state_changed.connect(self.handle_state_change, queued)
+        self.executor.item_status_changed.connect(self.handle_item_status, queued)
+        self.executor.error.connect(self.show_error, queued)
+        self.executor.document.connect(self.handle_document, queued)
+        self._progress_descriptor = None
+        self.executor_thread.start()
+
+        self.RE.state_hook = self.executor.state_changed.emit
+        self.handle_state_change(self.RE.state, None)
+
+    def close(self):
+        self.RE.state_hook = None
+        self.executor.close()
+        self.executor_thread.quit()
+        self.executor_thread.wait()
 
     def run(self):
-        pbar_manager = self.RE.waiting_hook
-        self.RE.waiting_hook = None
-        try:
-            if self.RE.state == RunEngineState.paused:
-                self.RE.resume()
-                if self.current_request is not None:
-                    self.GUI.queue_widget.set_status(self.current_request, RequestStatus.COMPLETE)
-                    self.current_request = None
-            # if self.RE.state == RunEngineState.idle:
-            for item in self.GUI.queue_widget.model.get_items():
-                self.current_request = item
-                payload = item.data
-                if item.status is not RequestStatus.COMPLETE:
-                    self.GUI.queue_widget.set_status(item, RequestStatus.COLLECTING)
-                    self.RE(
-                        maia_plan(payload)
-                    )
-                    self.GUI.queue_widget.set_status(item, RequestStatus.COMPLETE)
-        except RunEngineInterrupted:
-            pass
-        except Exception as e:
-            print(f"{type(e).__name__}")
-            print(f"Exception occured: {e}")
-            self.current_request = None
-        finally:
-            self.RE.waiting_hook = pbar_manager
-                
+        if self.RE.state == RunEngineState.paused:
+            self.requests.resume.emit()
+        else:
+            self.requests.run.emit()
+
+    def update_queue(self, items):
+        self.executor.set_queue(items)
+
+    def show_error(self, text):
+        show_error_message(text)
+
+    def handle_item_status(self, id, status):
+        item = self.GUI.queue_widget.model.get_item(id)
+        self.current_request = item if status is RequestStatus.COLLECTING else None
+        if item is None:
+            # removed from the queue while it ran
+            return
+        self.GUI.queue_widget.set_status(item, status)
+
+    def handle_document(self, name, doc):
+        if name == "descriptor" and doc.get("name") == "fly_progress":
+            self._progress_descriptor = doc["uid"]
+        elif (
+            name == "event"
+            and doc["descriptor"] == self._progress_descriptor
+            and self.current_request is not None
+        ):
+            data = doc["data"]
+            self.GUI.queue_widget.set_progress(
+                self.current_request,
+                (data["fly_progress_row"] + 1) / data["fly_progress_nrows"],
+            )
 
     def pause(self):
         if RunEngineState(self.RE.state) == RunEngineState.running:
             self.RE.request_pause()
         elif RunEngineState(self.RE.state) == RunEngineState.paused:
-            self.RE.stop()
+            self.requests.stop.emit()
+
+    def update_fps_label(self, rate, max_gap):
+        self.fps_label.setText(f"GUI: {rate:.0f} Hz, max stall {max_gap * 1000:.0f} ms")
 
     def handle_state_change(self, new, old):
         if new == "idle":
@@ -445,8 +1184,151 @@ class RunEngineControls:
         self.button_pause.setText(button_pause_text)
 
 
+class ReadbackAggregator(QtCore.QObject):
+    """Coalesces motor readback monitors and hands them to the GUI.
+
+    The Channel Access callbacks only store the latest value per axis;
+    a timer on the Qt thread emits ``updated`` for the axes that changed
+    at ``rate`` Hz.
+    """
+    updated = QtCore.Signal(str, float)
+
+    def __init__(self, motors, rate=10):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._subscriptions = [
+            (motor, motor.subscribe(partial(self._on_value, axis)))
+            for axis, motor in motors.items()
+        ]
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self.set_rate(rate)
+        self._timer.start()
+
+    def _on_value(self, axis, value, **kwargs):
+        # Called from the Channel Access thread
+        with self._lock:
+            self._latest[axis] = value
+
+    def set_rate(self, rate):
+        self._timer.setInterval(int(1000 / rate))
+
+    def flush(self):
+        with self._lock:
+            latest, self._latest = self._latest, {}
+        for axis, value in latest.items():
+            self.updated.emit(axis, value)
+
+    def close(self):
+        self._timer.stop()
+        for motor, cid in self._subscriptions:
+            motor.unsubscribe(cid)
+        self._subscriptions = []
+
+
+def format_targets(targets):
+    return ", ".join(f"{axis} {target:.4f}" for axis, target in targets.items())
+
+
+class StageMotionService(QtCore.QObject):
+    """Stage moves for the GUI that do not block the event loop.
+
+    ``move`` starts all the axes it is given together and reports
+    through ``finished`` or ``failed`` once all of them are done.  A
+    move requested while one is running is held back and merged with
+    any held before it, so a burst of nudge clicks ends in a single move
+    to the sum of the nudges.  Nudges are relative to the last requested
+    target, not to the readback, so none get lost while the stage is
+    still moving.  Moves are refused while the RunEngine is not idle.
+    """
+    started = QtCore.Signal(object)
+    finished = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+    # emitted from the ophyd callback thread
+    _status_done = QtCore.Signal(object, object)
+
+    def __init__(self, motors, run_engine=RE, parent=None):
+        super().__init__(parent)
+        self.motors = motors
+        self.RE = run_engine
+        self.status = None
+        self._targets = {}
+        self._pending = {}
+        self._stopped = False
+        self._status_done.connect(self._move_done)
+
+    @property
+    def busy(self):
+        return self.status is not None
+
+    def target(self, axis):
+        """Where an axis is going, the held, running or current position."""
+        for targets in (self._pending, self._targets):
+            if axis in targets:
+                return targets[axis]
+        return self.motors[axis].position
+
+    def move(self, targets):
+        """Move the axes of an {axis: position} dict together."""
+        if self.RE.state != "idle":
+            self.failed.emit(f"The RunEngine is {self.RE.state}, stage moves are disabled")
+            return
+        self._pending.update(targets)
+        if self.status is None:
+            self._start()
+
+    def nudge(self, axis, delta):
+        self.move({axis: self.target(axis) + delta})
+
+    def stop(self):
+        """Stop the stage and drop the held moves."""
+        self._pending = {}
+        self._stopped = self.busy
+        for axis in self._targets:
+            self.motors[axis].stop()
+
+    def _start(self):
+        targets, self._pending = self._pending, {}
+        statuses = []
+        try:
+            for axis, target in targets.items():
+                statuses.append(self.motors[axis].set(target))
+        except Exception as e:
+            # e.g. a target outside the limits, don't leave the others half way
+            for axis in list(targets)[: len(statuses)]:
+                self.motors[axis].stop()
+            self.failed.emit(f"Move to {format_targets(targets)} failed: {e}")
+            return
+        status = statuses[0]
+        for other in statuses[1:]:
+            status = status & other
+        self.status = status
+        self._targets = targets
+        self.started.emit(dict(targets))
+        status.add_callback(lambda status: self._status_done.emit(status, targets))
+
+    def _move_done(self, status, targets):
+        if status is not self.status:
+            return
+        self.status = None
+        self._targets = {}
+        stopped, self._stopped = self._stopped, False
+        error = status.exception()
+        if error is not None:
+            self._pending = {}
+            if stopped:
+                self.failed.emit(f"Move to {format_targets(targets)} stopped")
+            else:
+                self.failed.emit(f"Move to {format_targets(targets)} failed: {error}")
+            return
+        self.finished.emit(dict(targets))
+        if self._pending:
+            self._start()
+
+
 class SampleControlWidget(QtWidgets.QGroupBox):
-    def __init__(self):
+    def __init__(self, readback_rate=10):
         super().__init__()
 
         # label = QtWidgets.QLabel("Sample control widget")
@@ -511,6 +1393,9 @@ class SampleControlWidget(QtWidgets.QGroupBox):
         z_label = QtWidgets.QLabel("Z Pos:")
         self.z_rb_label = QtWidgets.QLabel("0")
         self.z_val_input = QtWidgets.QLineEdit()
+        r_label = QtWidgets.QLabel("R Pos:")
+        self.r_rb_label = QtWidgets.QLabel("0")
+        self.r_val_input = QtWidgets.QLineEdit()
         nudge_buttons.addWidget(x_label, 0, 4)
         nudge_buttons.addWidget(self.x_rb_label, 0, 5)
         nudge_buttons.addWidget(self.x_val_input, 0, 6)
@@ -520,16 +1405,35 @@ class SampleControlWidget(QtWidgets.QGroupBox):
         nudge_buttons.addWidget(z_label, 2, 4)
         nudge_buttons.addWidget(self.z_rb_label, 2, 5)
         nudge_buttons.addWidget(self.z_val_input, 2, 6)
+        nudge_buttons.addWidget(r_label, 3, 4)
+        nudge_buttons.addWidget(self.r_rb_label, 3, 5)
+        nudge_buttons.addWidget(self.r_val_input, 3, 6)
+
+        self.stop_button = QtWidgets.QPushButton("Stop")
+        self.stop_button.clicked.connect(lambda: self.motion.stop())
+        nudge_buttons.addWidget(self.stop_button, 3, 1)
+        self.motion_status_label = QtWidgets.QLabel("")
+        nudge_buttons.addWidget(self.motion_status_label, 4, 0, 1, 7)
 
         self.x_val_input.returnPressed.connect(lambda: self.set_motor_position("x"))
         self.y_val_input.returnPressed.connect(lambda: self.set_motor_position("y"))
         self.z_val_input.returnPressed.connect(lambda: self.set_motor_position("z"))
+        self.r_val_input.returnPressed.connect(lambda: self.set_motor_position("r"))
 
         readback_values_layout = QtWidgets.QGridLayout()
 
-        M.x.subscribe(lambda value, **kwargs: self.update_label("x", value))
-        M.y.subscribe(lambda value, **kwargs: self.update_label("y", value))
-        M.z.subscribe(lambda value, **kwargs: self.update_label("z", value))
+        motors = {"x": M.x, "y": M.y, "z": M.z, "r": M.r}
+        self.readbacks = ReadbackAggregator(motors, rate=readback_rate)
+        self.readbacks.updated.connect(self.update_label)
+
+        self.motion = StageMotionService(motors, parent=self)
+        self.motion.started.connect(
+            lambda targets: self.show_motion_status(f"Moving to {format_targets(targets)}")
+        )
+        self.motion.finished.connect(
+            lambda targets: self.show_motion_status(f"At {format_targets(targets)}")
+        )
+        self.motion.failed.connect(lambda message: self.show_motion_status(message, error=True))
 
         self.position_save_text_box = QtWidgets.QLineEdit()
         self.position_save_button = QtWidgets.QPushButton("Save Position")
@@ -537,7 +1441,9 @@ class SampleControlWidget(QtWidgets.QGroupBox):
         readback_values_layout.addWidget(self.position_save_text_box, 3, 0)
         readback_values_layout.addWidget(self.position_save_button, 3, 1)
 
-        self.saved_positions_list = SamplePositionQueueWidget()
+        self.saved_positions_list = SamplePositionQueueWidget(
+            journal_name="saved_positions.jsonl"
+        )
         self.position_save_button.clicked.connect(self.save_motor_positions)
         self.saved_positions_list.go_to_position_signal.connect(
             self.set_motor_positions
@@ -551,23 +1457,31 @@ class SampleControlWidget(QtWidgets.QGroupBox):
         self.setLayout(layout)
 
     def set_motor_position(self, pos):
+        text = getattr(self, f"{pos}_val_input").text()
         try:
-            if pos == "x":
-                M.x.user_setpoint.set(float(self.x_val_input.text()))
-            elif pos == "y":
-                M.y.user_setpoint.set(float(self.y_val_input.text()))
-            elif pos == "z":
-                M.z.user_setpoint.set(float(self.z_val_input.text()))
-        except Exception as e:
-            pass
+            target = float(text)
+        except ValueError:
+            self.show_motion_status(f"Not a {pos} position: {text!r}", error=True)
+            return
+        self.motion.move({pos: target})
 
     def set_motor_positions(self, data: Position):
         self.x_val_input.setText(str(data.x))
         self.y_val_input.setText(str(data.y))
         self.z_val_input.setText(str(data.z))
-        self.set_motor_position("x")
-        self.set_motor_position("y")
-        self.set_motor_position("z")
+        self.motion.move({"x": data.x, "y": data.y, "z": data.z})
+
+    def move_to(self, x, y):
+        """Move the stage to (x, y), as clicked on the microscope view."""
+        self.x_val_input.setText(f"{x:.4f}")
+        self.y_val_input.setText(f"{y:.4f}")
+        self.motion.move({"x": x, "y": y})
+
+    def show_motion_status(self, message, error=False):
+        self.motion_status_label.setText(message)
+        self.motion_status_label.setStyleSheet("color: red" if error else "")
+        if error:
+            print(message)
 
     def save_motor_positions(self):
         self.saved_positions_list.add_item(
@@ -582,23 +1496,22 @@ class SampleControlWidget(QtWidgets.QGroupBox):
             "x": self.x_rb_label,
             "y": self.y_rb_label,
             "z": self.z_rb_label,
+            "r": self.r_rb_label,
         }
         label_mapping[label_name].setText(f"{value:.3f}")
 
     def nudge(self, direction: str):
-        direction_motors = {
-            "up": (M.y, 1),
-            "down": (M.y, -1),
-            "left": (M.x, -1),
-            "right": (M.x, 1),
-            "in": (M.z, 1),
-            "out": (M.z, -1),
+        direction_axes = {
+            "up": ("y", 1),
+            "down": ("y", -1),
+            "left": ("x", -1),
+            "right": ("x", 1),
+            "in": ("z", 1),
+            "out": ("z", -1),
         }
-        motor, factor = direction_motors[direction]
-        pbar_manager = RE.waiting_hook
-        RE.waiting_hook = None
-        RE(bps.mvr(motor, float(self.nudge_amount_spin_box.text()) * factor))
-        RE.waiting_hook = pbar_manager
+        axis, factor = direction_axes[direction]
+        self.motion.nudge(axis, self.nudge_amount_spin_box.value() * factor)
+
 
 class ScanSetupWidget(QtWidgets.QGroupBox):
     add_to_queue_signal = QtCore.Signal(str, object)
@@ -611,9 +1524,20 @@ class ScanSetupWidget(QtWidgets.QGroupBox):
         # self.widget_layout.addWidget(label)
         self.setLayout(self.widget_layout)
         self.positions: list[QueueItem] = []
+        # regions dragged on the microscope view are numbered on from this
+        self.region_count = 0
+        # stage motion parameters and position for the estimate, read
+        # every few seconds instead of on every keystroke
+        self.motion_params = None
+        self.stage_position = None
+        self._stage_timer = QtCore.QTimer(self)
+        self._stage_timer.setInterval(10000)
+        self._stage_timer.timeout.connect(self.refresh_stage)
         self.setup_position_inputs()
         self.setup_other_inputs()
         self.setup_metadata_inputs()
+        self.refresh_stage()
+        self._stage_timer.start()
 
     def setup_position_inputs(self):
         validator = QtGui.QDoubleValidator()
@@ -685,7 +1609,7 @@ class ScanSetupWidget(QtWidgets.QGroupBox):
         self.widget_layout.addWidget(self.scan_name_input, 5, 1)
 
         self.widget_layout.addWidget(
-            QtWidgets.QLabel("Est. Time (s): "), 6, 0
+            QtWidgets.QLabel("Est. Time: "), 6, 0
         )
         self.widget_layout.addWidget(self.estimated_time, 6, 1)
 
@@ -701,19 +1625,45 @@ class ScanSetupWidget(QtWidgets.QGroupBox):
         self.dwell_input.textChanged.connect(self.calculate_estimated_time)
         self.add_to_queue_button.clicked.connect(self.add_to_queue)
 
+    def refresh_stage(self):
+        """Read the stage motion parameters and position used by the estimate."""
+        try:
+            self.motion_params = MaiaMotionParams.from_stage(M)
+            self.stage_position = (M.x.position, M.y.position)
+        except Exception as e:
+            print(f"Could not read the stage for the time estimate: {e}")
+            return
+        self.calculate_estimated_time(None)
+
     def calculate_estimated_time(self, _):
         try:
-            num_pixels_x = abs(
-                float(self.stop_x_input.text()) - float(self.start_x_input.text())
-            ) / float(self.step_size_input.text())
-            num_pixels_y = abs(
-                float(self.stop_y_input.text()) - float(self.start_y_input.text())
-            ) / float(self.step_size_input.text())
-            # Time in ms
-            est_time = num_pixels_x * num_pixels_y * float(self.dwell_input.text())
-            self.estimated_time.setText(str(est_time))
+            step = float(self.step_size_input.text())
+            est = estimate_fly_maia_times(
+                ystart=float(self.start_y_input.text()),
+                ystop=float(self.stop_y_input.text()),
+                ypitch=step,
+                xstart=float(self.start_x_input.text()),
+                xstop=float(self.stop_x_input.text()),
+                xpitch=step,
+                dwell=float(self.dwell_input.text()),
+                params=self.motion_params,
+                start=self.stage_position,
+            )
+            self.estimated_time.setText(format_duration(est["total"]))
+            self.estimated_time.setToolTip(
+                "\n".join(
+                    f"{key}: {format_duration(est[key])}"
+                    for key in ["setup", "outline", "rows", "cleanup"]
+                )
+            )
+        except ValueError:
+            # the fields are not all filled in yet
+            self.estimated_time.setText("")
+            self.estimated_time.setToolTip("")
         except Exception as e:
-            pass
+            print(f"Could not estimate the scan time: {type(e).__name__}: {e}")
+            self.estimated_time.setText("Estimate failed")
+            self.estimated_time.setToolTip(f"{type(e).__name__}: {e}")
 
     def setup_metadata_inputs(self):
         self.dynamic_widget_container = QtWidgets.QWidget()
@@ -761,32 +1711,521 @@ class ScanSetupWidget(QtWidgets.QGroupBox):
                 widget = self.dynamic_layout.itemAtPosition(i, 1).widget()
                 widget.setText(str(val))
 
+    def metadata(self):
+        return SampleMetadata(
+            info=self.dynamic_layout.itemAtPosition(0, 1).widget().text(),
+            owner=self.dynamic_layout.itemAtPosition(1, 1).widget().text(),
+            serial=self.dynamic_layout.itemAtPosition(2, 1).widget().text(),
+            type=self.dynamic_layout.itemAtPosition(3, 1).widget().text(),
+        )
+
+    def definition(self, xstart, xstop, ystart, ystop, name=""):
+        """MaiaFlyDefinition of a region with the step size, dwell and metadata of the inputs."""
+        step = float(self.step_size_input.text())
+        return MaiaFlyDefinition(
+            ystart=ystart,
+            ystop=ystop,
+            ypitch=step,
+            xstart=xstart,
+            xstop=xstop,
+            xpitch=step,
+            dwell=float(self.dwell_input.text()),
+            name=name,
+            md=self.metadata(),
+        )
+
     def add_to_queue(self):
-        md = SampleMetadata(
-                    info=self.dynamic_layout.itemAtPosition(0, 1).widget().text(),
-                    owner=self.dynamic_layout.itemAtPosition(1, 1).widget().text(),
-                    serial=self.dynamic_layout.itemAtPosition(2, 1).widget().text(),
-                    type=self.dynamic_layout.itemAtPosition(3, 1).widget().text(),
-                )
+        name = self.scan_name_input.text()
         self.add_to_queue_signal.emit(
-            self.scan_name_input.text(),
-            MaiaFlyDefinition(
-                **{
-                    "ystart": float(self.start_y_input.text()),
-                    "ystop": float(self.stop_y_input.text()),
-                    "ypitch": float(self.step_size_input.text()),
-                    "xstart": float(self.stop_x_input.text()),
-                    "xstop": float(self.stop_y_input.text()),
-                    "xpitch": float(self.step_size_input.text()),
-                    "dwell": float(self.dwell_input.text()),
-                    "md": md,
-                }
+            name,
+            self.definition(
+                float(self.start_x_input.text()),
+                float(self.stop_x_input.text()),
+                float(self.start_y_input.text()),
+                float(self.stop_y_input.text()),
+                name,
             ),
         )
 
+    def region_definitions(self, regions):
+        """(label, MaiaFlyDefinition) pairs of (xstart, xstop, ystart, ystop) regions.
+
+        The regions are named after the scan name, numbered on from the
+        regions added before.
+        """
+        prefix = self.scan_name_input.text() or "region"
+        requests = []
+        try:
+            for region in regions:
+                self.region_count += 1
+                name = f"{prefix}-{self.region_count}"
+                requests.append((name, self.definition(*region, name=name)))
+        except ValueError:
+            show_error_message("Set the step size and dwell time of the regions first")
+            return []
+        return requests
+
+
+MICROSCOPE_URL = "http://10.68.25.92/mjpg/1/video.mjpg"
+# height the microscope frames are scaled to, the calibration is in these pixels
+MICROSCOPE_HEIGHT = 400
+# stop the microscope stream while the RunEngine is running
+MICROSCOPE_PAUSE_DURING_SCANS = False
+
+
+@dataclass
+class FrameTiming:
+    """time.monotonic() of a microscope frame being received, decoded and shown."""
+    number: int
+    received: float
+    decoded: float = 0.0
+    shown: float = 0.0
+
+
+class MjpegFramePipeline(QtCore.QObject):
+    """Microscope MJPEG stream, read and decoded off the GUI thread.
+
+    A reader thread splits the stream into JPEG frames and keeps the
+    newest ``ring_size``, dropping the oldest.  A decoder thread decodes
+    the newest frame and scales it to ``height``, but only once the GUI
+    has shown the previous one and no faster than ``max_fps``.  The
+    decode rate so follows what the GUI manages to display, and a busy
+    GUI shows a late frame rather than a backlog.
+    """
+
+    frame_ready = QtCore.Signal(object, object)
+    error = QtCore.Signal(str)
+
+    def __init__(self, url, *, max_fps=30, height=MICROSCOPE_HEIGHT, ring_size=2, timeout=5.0, history=300):
+        super().__init__()
+        self.url = url
+        self.max_fps = max_fps
+        self.height = height
+        self.timeout = timeout
+        self.timings = collections.deque(maxlen=history)
+        self.received = self.decoded = self.dropped = self.shown = 0
+        self._ring = collections.deque(maxlen=ring_size)
+        self._cond = threading.Condition()
+        # set while the threads of the current start() should run, a new
+        # event per start() so a restart does not revive the old reader
+        self._run = None
+        self._ready = True
+        self._emitted = 0.0
+        self._decoder = None
+        self._response = None
+
+    @property
+    def running(self):
+        return self._run is not None and self._run.is_set()
+
+    def start(self):
+        if self.running:
+            return
+        run = threading.Event()
+        run.set()
+        with self._cond:
+            self._run = run
+            self._ready = True
+        threading.Thread(target=self._read, args=(run,), daemon=True).start()
+        self._decoder = threading.Thread(target=self._decode, args=(run,), daemon=True)
+        self._decoder.start()
+
+    def stop(self):
+        with self._cond:
+            if self._run is not None:
+                self._run.clear()
+            self._cond.notify_all()
+            response, self._response = self._response, None
+        if response is not None:
+            response.close()
+        # the reader stops at its next chunk, it is not waited for
+        if self._decoder is not None:
+            self._decoder.join(self.timeout)
+            self._decoder = None
+        self._ring.clear()
+
+    def _read(self, run):
+        # Axis cameras send no more than the fps asked for
+        url = "{}{}fps={}".format(self.url, "&" if "?" in self.url else "?", self.max_fps)
+        buf = bytearray()
+        response = None
+        try:
+            response = urllib.request.urlopen(url, timeout=self.timeout)
+            with self._cond:
+                # only the current reader's response is closed by stop()
+                if run.is_set():
+                    self._response = response
+            while run.is_set():
+                chunk = response.read1(65536)
+                if not chunk:
+                    raise ConnectionError("stream ended")
+                buf += chunk
+                while True:
+                    start = buf.find(b"\xff\xd8")
+                    if start < 0:
+                        del buf[:-1]
+                        break
+                    end = buf.find(b"\xff\xd9", start + 2)
+                    if end < 0:
+                        del buf[:start]
+                        break
+                    self._push(bytes(buf[start : end + 2]), run)
+                    del buf[: end + 2]
+        except Exception as e:
+            if run.is_set():
+                self.error.emit(f"Microscope stream {self.url}: {e}")
+        finally:
+            if response is not None:
+                response.close()
+
+    def _push(self, frame, run):
+        with self._cond:
+            if not run.is_set():
+                return
+            if len(self._ring) == self._ring.maxlen:
+                self.dropped += 1
+            self._ring.append((frame, FrameTiming(self.received, time.monotonic())))
+            self.received += 1
+            self._cond.notify_all()
+
+    def _decode(self, run):
+        last = 0.0
+        while True:
+            time.sleep(max(0.0, last + 1 / self.max_fps - time.monotonic()))
+            with self._cond:
+                # give up on a frame the GUI never confirmed after 1 s
+                self._cond.wait_for(
+                    lambda: not run.is_set()
+                    or (self._ring and (self._ready or time.monotonic() - self._emitted > 1.0)),
+                    timeout=0.1,
+                )
+                if not run.is_set():
+                    return
+                if not self._ring or not (self._ready or time.monotonic() - self._emitted > 1.0):
+                    continue
+                frame, timing = self._ring.pop()
+                self.dropped += len(self._ring)
+                self._ring.clear()
+                self._ready = False
+            last = time.monotonic()
+            image = QtGui.QImage.fromData(frame, "JPG")
+            if image.isNull():
+                with self._cond:
+                    self._ready = True
+                continue
+            if self.height:
+                image = image.scaledToHeight(self.height, QtCore.Qt.SmoothTransformation)
+            timing.decoded = self._emitted = time.monotonic()
+            self.decoded += 1
+            self.frame_ready.emit(image, timing)
+
+    def frame_shown(self, timing):
+        """Called by the GUI once it has shown a frame, lets the next one be decoded."""
+        timing.shown = time.monotonic()
+        self.timings.append(timing)
+        self.shown += 1
+        with self._cond:
+            self._ready = True
+            self._cond.notify_all()
+
+    def latency_report(self):
+        """Frame counts, display rate and decode/display latency in ms of the recent frames."""
+        timings = list(self.timings)
+        decode = np.array([t.decoded - t.received for t in timings]) * 1e3
+        display = np.array([t.shown - t.received for t in timings]) * 1e3
+        span = timings[-1].shown - timings[0].shown if len(timings) > 1 else 0.0
+        report = dict(
+            received=self.received,
+            decoded=self.decoded,
+            shown=self.shown,
+            dropped=self.dropped,
+            display_fps=(len(timings) - 1) / span if span else 0.0,
+            decode_ms=float(decode.mean()) if len(decode) else float("nan"),
+            decode_ms_p95=float(np.percentile(decode, 95)) if len(decode) else float("nan"),
+            display_ms=float(display.mean()) if len(display) else float("nan"),
+            display_ms_p95=float(np.percentile(display, 95)) if len(display) else float("nan"),
+        )
+        print(
+            "microscope: {received} received, {decoded} decoded, {shown} shown, {dropped} dropped, "
+            "{display_fps:.1f} fps; latency decode {decode_ms:.1f} ms (p95 {decode_ms_p95:.1f}), "
+            "display {display_ms:.1f} ms (p95 {display_ms_p95:.1f})".format(**report)
+        )
+        return report
+
+
+MICROSCOPE_CALIBRATION_FILE = os.path.join(MAIA_QUEUE_JOURNAL_DIR, "microscope_calibration.json")
+
+
+@dataclass
+class MicroscopeCalibration:
+    """Mapping between stage positions and microscope view pixels.
+
+    The beam is where the CrossHairPlugin is drawn, ``beam`` is that
+    point in view pixels.  ``pixel_size`` is in mm per view pixel.  The
+    sample position of a feature is the stage position that puts it in
+    the beam, the signs are +1 if the view pixel grows with it; a feature
+    then moves the other way on screen when the stage moves positive.
+    """
+    pixel_size: float = 0.001
+    x_sign: int = 1
+    y_sign: int = -1
+
+    def stage_to_view(self, x, y, stage_x, stage_y, beam):
+        """View pixel of the sample point at (x, y) with the stage at (stage_x, stage_y)."""
+        return (
+            beam[0] + self.x_sign * (x - stage_x) / self.pixel_size,
+            beam[1] + self.y_sign * (y - stage_y) / self.pixel_size,
+        )
+
+    def view_to_stage(self, px, py, stage_x, stage_y, beam):
+        """Sample point (x, y) at view pixel (px, py) with the stage at (stage_x, stage_y)."""
+        return (
+            stage_x + self.x_sign * (px - beam[0]) * self.pixel_size,
+            stage_y + self.y_sign * (py - beam[1]) * self.pixel_size,
+        )
+
+    def calibrate(self, view_before, view_after, stage_before, stage_after, min_pixels=10):
+        """Set the scale from one sample feature seen at two stage positions.
+
+        The feature is at view pixel ``view_before`` with the stage at
+        ``stage_before`` (x, y) and at ``view_after`` with the stage at
+        ``stage_after``.  The view is assumed square to the stage, an
+        axis that did not move keeps its sign.
+        """
+        dpx = (view_after[0] - view_before[0], view_after[1] - view_before[1])
+        dstage = (stage_after[0] - stage_before[0], stage_after[1] - stage_before[1])
+        pixels = math.hypot(*dpx)
+        if pixels < min_pixels:
+            raise ValueError(
+                f"The feature moved {pixels:.0f} pixels, move the stage further to calibrate"
+            )
+        self.pixel_size = math.hypot(*dstage) / pixels
+        signs = []
+        for d, p, sign in zip(dstage, dpx, (self.x_sign, self.y_sign)):
+            if abs(p) >= min_pixels / 2 and d != 0:
+                sign = -1 if (d > 0) == (p > 0) else 1
+            signs.append(sign)
+        self.x_sign, self.y_sign = signs
+
+    def save(self, path=MICROSCOPE_CALIBRATION_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(asdict(self), f)
+
+    @classmethod
+    def load(cls, path=MICROSCOPE_CALIBRATION_FILE):
+        """The saved calibration, the default one if none was saved."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+def crosshair_center(settings, view_width, view_height):
+    """Scene point of the crosshair from CrossHairPlugin.write_settings().
+
+    The plugin keeps an always centered crosshair in the middle of the
+    view and otherwise draws it at its "pos" setting.
+    """
+    if settings.get("always_centered", True):
+        return view_width / 2, view_height / 2
+    pos = settings["pos"]
+    return pos.x(), pos.y()
+
+
+class ScanOutlineOverlay(QtWidgets.QWidget):
+    """Transparent layer over the microscope that draws a scan outline.
+
+    ``beam_position`` returns the view pixel of the beam, the widget
+    center if not given.
+    """
+
+    def __init__(self, calibration, beam_position=None, parent=None):
+        super().__init__(parent)
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.setAttribute(QtCore.Qt.WA_NoSystemBackground)
+        self.calibration = calibration
+        self.beam_position = beam_position or (lambda: (self.width() / 2, self.height() / 2))
+        self.stage = {"x": 0.0, "y": 0.0}
+        self.outline = None
+
+    def set_outline(self, outline):
+        """(xstart, xstop, ystart, ystop) in mm, or None to clear it."""
+        self.outline = outline
+        self.update()
+
+    def set_stage_position(self, axis, value):
+        if axis in self.stage:
+            self.stage[axis] = value
+            self.update()
+
+    def to_view(self, x, y):
+        return self.calibration.stage_to_view(
+            x, y, self.stage["x"], self.stage["y"], self.beam_position()
+        )
+
+    def to_stage(self, point):
+        return self.calibration.view_to_stage(
+            point.x(), point.y(), self.stage["x"], self.stage["y"], self.beam_position()
+        )
+
+    def region_rect(self, region):
+        """View rectangle of a (xstart, xstop, ystart, ystop) region."""
+        xstart, xstop, ystart, ystop = region
+        (x0, y0), (x1, y1) = self.to_view(xstart, ystart), self.to_view(xstop, ystop)
+        return QtCore.QRectF(
+            QtCore.QPointF(min(x0, x1), min(y0, y1)),
+            QtCore.QPointF(max(x0, x1), max(y0, y1)),
+        )
+
+    def paintEvent(self, event):
+        if self.outline is None:
+            return
+        painter = QtGui.QPainter(self)
+        pen = QtGui.QPen(QtCore.Qt.GlobalColor.yellow)
+        pen.setWidth(2)
+        pen.setStyle(QtCore.Qt.PenStyle.DashLine)
+        painter.setPen(pen)
+        painter.drawRect(self.region_rect(self.outline))
+        painter.end()
+
+
+class StageSelectOverlay(ScanOutlineOverlay):
+    """Scan outline overlay that also takes clicks and drags on the microscope.
+
+    In "select" mode a click asks to move the stage so the clicked point
+    is in the beam, a drag adds a scan region and a right click removes
+    the region under the cursor.  Regions are kept in stage mm, so they
+    stay on their part of the sample as the stage moves.  In "calibrate"
+    mode two clicks on the same feature, with the stage moved in
+    between, calibrate the view.  In "off" mode the mouse goes to the
+    microscope.
+    """
+
+    move_requested = QtCore.Signal(float, float)
+    regions_changed = QtCore.Signal(int)
+    calibrated = QtCore.Signal(object)
+
+    # a press and release closer than this many pixels is a click, not a drag
+    click_distance = 4
+
+    def __init__(self, calibration, beam_position=None, parent=None):
+        super().__init__(calibration, beam_position, parent)
+        self.mode = "off"
+        self.moves_enabled = True
+        self.regions = []
+        self._drag = None
+        self._calibration_point = None
+
+    def set_mode(self, mode):
+        """"off", "select" or "calibrate"."""
+        self.mode = mode
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents, mode == "off")
+        if mode == "off":
+            self.unsetCursor()
+        else:
+            self.setCursor(QtCore.Qt.CursorShape.CrossCursor)
+        self._drag = None
+        self._calibration_point = None
+        self.update()
+
+    def add_region(self, start, end):
+        """Add the region between two view points."""
+        (x0, y0), (x1, y1) = self.to_stage(start), self.to_stage(end)
+        region = tuple(
+            round(v, 4) for v in (min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1))
+        )
+        self.regions.append(region)
+        self.regions_changed.emit(len(self.regions))
+        self.update()
+
+    def remove_region_at(self, point):
+        for i in reversed(range(len(self.regions))):
+            if self.region_rect(self.regions[i]).contains(QtCore.QPointF(point)):
+                del self.regions[i]
+                self.regions_changed.emit(len(self.regions))
+                self.update()
+                return
+
+    def clear_regions(self):
+        self.regions = []
+        self.regions_changed.emit(0)
+        self.update()
+
+    def click(self, point):
+        if self.mode == "select":
+            if not self.moves_enabled:
+                print("Stage moves from the microscope view are disabled while a scan runs")
+                return
+            self.move_requested.emit(*self.to_stage(point))
+        elif self.mode == "calibrate":
+            stage = (self.stage["x"], self.stage["y"])
+            if self._calibration_point is None:
+                self._calibration_point = ((point.x(), point.y()), stage)
+                print("Move the stage and click the same feature again")
+                return
+            view_before, stage_before = self._calibration_point
+            self._calibration_point = None
+            try:
+                self.calibration.calibrate(view_before, (point.x(), point.y()), stage_before, stage)
+            except ValueError as e:
+                show_error_message(str(e))
+                return
+            self.calibrated.emit(self.calibration)
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.MouseButton.LeftButton:
+            self._drag = (event.pos(), event.pos())
+        elif event.button() == QtCore.Qt.MouseButton.RightButton and self.mode == "select":
+            self.remove_region_at(event.pos())
+
+    def mouseMoveEvent(self, event):
+        if self._drag is not None:
+            self._drag = (self._drag[0], event.pos())
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self._drag is None or event.button() != QtCore.Qt.MouseButton.LeftButton:
+            return
+        start, end = self._drag[0], event.pos()
+        self._drag = None
+        if (end - start).manhattanLength() <= self.click_distance:
+            self.click(end)
+        elif self.mode == "select":
+            self.add_region(start, end)
+        self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        painter = QtGui.QPainter(self)
+        pen = QtGui.QPen(QtCore.Qt.GlobalColor.cyan)
+        pen.setWidth(2)
+        painter.setPen(pen)
+        for i, region in enumerate(self.regions):
+            rect = self.region_rect(region)
+            painter.drawRect(rect)
+            painter.drawText(rect.topLeft() + QtCore.QPointF(3, 14), str(i + 1))
+        if self._drag is not None:
+            pen = QtGui.QPen(QtCore.Qt.GlobalColor.white)
+            pen.setStyle(QtCore.Qt.PenStyle.DashLine)
+            painter.setPen(pen)
+            start, end = (QtCore.QPointF(point) for point in self._drag)
+            painter.drawRect(QtCore.QRectF(start, end).normalized())
+        if self._calibration_point is not None:
+            painter.setPen(QtGui.QPen(QtCore.Qt.GlobalColor.magenta))
+            (px, py), _ = self._calibration_point
+            painter.drawEllipse(QtCore.QPointF(px, py), 6, 6)
+        painter.end()
+
 
 class MicroscopeViewWidget(QtWidgets.QWidget):
-    def __init__(self):
+    # emitted from the RunEngine thread by the visual scan outline
+    outline_requested = QtCore.Signal(object)
+    # (xstart, xstop, ystart, ystop) regions dragged on the view
+    add_regions_requested = QtCore.Signal(object)
+
+    def __init__(self, url=MICROSCOPE_URL, pause_during_scans=MICROSCOPE_PAUSE_DURING_SCANS):
         super().__init__()
         self.widget_layout = QtWidgets.QGridLayout()
         # label = QtWidgets.QLabel("Microscope View widget")
@@ -794,37 +2233,404 @@ class MicroscopeViewWidget(QtWidgets.QWidget):
         self.setLayout(self.widget_layout)
         plugins = [CrossHairPlugin]
         self.microscope = Microscope(self, viewport=False, plugins=plugins)
-        self.microscope.scale = [0, 400]
+        # frames arrive scaled from self.stream, not from the Microscope's own thread
+        self.microscope.scale = []
         self.microscope.fps = 30
         # self.microscope.url = "http://10.68.25.94/mjpg/1/video.mjpg"
-        self.microscope.url = "http://10.68.25.92/mjpg/1/video.mjpg"
+        self.sim_camera = None
+        if MAIA_SIMULATE:
+            self.sim_camera = SimMjpegCamera()
+            url = self.sim_camera.url
+        self.microscope.url = url
         self.widget_layout.addWidget(self.microscope, 0, 0)
-        # self.microscope.acquire(True)
+        self.stream = MjpegFramePipeline(url, max_fps=self.microscope.fps)
+        self.stream.frame_ready.connect(self.show_frame)
+        self.stream.error.connect(print)
+        self.pause_during_scans = pause_during_scans
+        self._acquiring = False
+        self._paused_for_scan = False
+        self.calibration = MicroscopeCalibration.load()
+        self.overlay = StageSelectOverlay(self.calibration, self.beam_position, self)
+        self.widget_layout.addWidget(self.overlay, 0, 0)
+        self.outline_requested.connect(self.overlay.set_outline)
+        self.overlay.calibrated.connect(self.save_calibration)
+        maia_outline_callbacks.append(self.show_scan_outline)
+        self.setup_region_controls()
+
+    def setup_region_controls(self):
+        controls = QtWidgets.QHBoxLayout()
+        self.mouse_mode_combobox = QtWidgets.QComboBox()
+        for label, mode in (
+            ("Off", "off"),
+            ("Click to move, drag to add regions", "select"),
+            ("Calibrate", "calibrate"),
+        ):
+            self.mouse_mode_combobox.addItem(label, mode)
+        self.mouse_mode_combobox.currentIndexChanged.connect(
+            lambda _: self.overlay.set_mode(self.mouse_mode_combobox.currentData())
+        )
+        self.regions_label = QtWidgets.QLabel("0 regions")
+        self.overlay.regions_changed.connect(
+            lambda n: self.regions_label.setText(f"{n} regions")
+        )
+        add_regions_button = QtWidgets.QPushButton("Add Regions to Queue")
+        add_regions_button.clicked.connect(
+            lambda: self.add_regions_requested.emit(list(self.overlay.regions))
+        )
+        clear_regions_button = QtWidgets.QPushButton("Clear Regions")
+        clear_regions_button.clicked.connect(self.overlay.clear_regions)
+        controls.addWidget(QtWidgets.QLabel("Mouse: "))
+        controls.addWidget(self.mouse_mode_combobox)
+        controls.addWidget(self.regions_label)
+        controls.addWidget(add_regions_button)
+        controls.addWidget(clear_regions_button)
+        self.widget_layout.addLayout(controls, 1, 0)
+
+    def beam_position(self):
+        """The crosshair center, where the beam is, in overlay pixels."""
+        settings = self.microscope.plugins["CrossHairPlugin"].write_settings()
+        view = self.microscope.view
+        x, y = crosshair_center(settings, view.width(), view.height())
+        pos = view.viewport().mapTo(self, view.mapFromScene(QtCore.QPointF(x, y)))
+        pos = self.overlay.mapFrom(self, pos)
+        return pos.x(), pos.y()
+
+    def save_calibration(self, calibration):
+        calibration.save()
+        print(
+            f"Microscope calibrated, {calibration.pixel_size * 1000:.3f} um per pixel, "
+            f"x sign {calibration.x_sign}, y sign {calibration.y_sign}"
+        )
+
+    def show_scan_outline(self, xstart, xstop, ystart, ystop):
+        self.outline_requested.emit((xstart, xstop, ystart, ystop))
+
+    def acquire(self, start=True):
+        """Start or stop the microscope stream."""
+        self._acquiring = start
+        self._paused_for_scan = False
+        for plugin in self.microscope.plugins.values():
+            if start:
+                plugin.start_plugin()
+            else:
+                plugin.stop_plugin()
+        if start:
+            self.stream.start()
+        else:
+            self.stream.stop()
+
+    def show_frame(self, image, timing):
+        self.microscope.updateImageData(image)
+        self.stream.frame_shown(timing)
+
+    def set_run_engine_state(self, new, old):
+        """Block click to move while a scan runs and pause the stream, if pause_during_scans is set."""
+        self.overlay.moves_enabled = new == "idle"
+        if not (self.pause_during_scans and self._acquiring):
+            return
+        if new == "running" and self.stream.running:
+            self.stream.stop()
+            self._paused_for_scan = True
+        elif new != "running" and self._paused_for_scan:
+            self._paused_for_scan = False
+            self.stream.start()
+
+    def close(self):
+        if self.show_scan_outline in maia_outline_callbacks:
+            maia_outline_callbacks.remove(self.show_scan_outline)
+        self.acquire(False)
+        if self.sim_camera is not None:
+            self.sim_camera.close()
+        super().close()
+
+
+class LiveMapBuffer:
+    """Preallocated image of a raster map, filled one row at a time.
+
+    Next to the full image a block averaged copy of at most
+    ``max_display`` pixels a side is updated with every row, so drawing
+    a 4k x 4k map costs no more than drawing a small one.
+    """
+
+    def __init__(self, max_display=1024):
+        self.max_display = max_display
+        self.allocate(1, 1)
+
+    def allocate(self, ynum, xnum, snaking=(False, True)):
+        self.snaking = snaking
+        self.block = (math.ceil(ynum / self.max_display), math.ceil(xnum / self.max_display))
+        by, bx = self.block
+        self.display = np.full((math.ceil(ynum / by), math.ceil(xnum / bx)), np.nan, dtype=np.float32)
+        # padded to whole blocks, the map is a view into it
+        self._padded = np.full(
+            (self.display.shape[0] * by, self.display.shape[1] * bx), np.nan, dtype=np.float32
+        )
+        self.image = self._padded[:ynum, :xnum]
+
+    def set_row(self, row, values):
+        """Store one row given in scan order, return False if it is off the map."""
+        ynum, xnum = self.image.shape
+        if not 0 <= row < ynum:
+            return False
+        values = np.asarray(values, dtype=np.float32)[:xnum]
+        if self.snaking[1] and row % 2:
+            values = values[::-1]
+        self.image[row, : len(values)] = values
+        by, bx = self.block
+        d = row // by
+        blocks = self._padded[d * by : (d + 1) * by].reshape(by, -1, bx)
+        with warnings.catch_warnings():
+            # blocks of rows not scanned yet are all NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.display[d] = np.nanmean(blocks, axis=(0, 2))
+        return True
+
+
+def fly_maia_map_shape(start):
+    """(rows, columns) of the map of a fly_maia run from its start document.
+
+    The start document has the ``shape`` [ynum, xnum] of the pitch
+    grid, fly_maia scans the ynum + 1 rows 0 to ynum of it.
+    """
+    ynum, xnum = start["shape"]
+    return ynum + 1, xnum
 
 
 class DetectorImageWidget(QtWidgets.QWidget):
-    def __init__(self):
+    """Live map of the running fly scan, from its 'maia_rows' stream.
+
+    ``handle_document`` takes the documents of the RunEngine.  Rows go
+    into a LiveMapBuffer and the map is redrawn at most every
+    ``refresh_period`` ms, from the downsampled copy.
+
+    fly_maia only writes the 'maia_rows' stream for a detector with a
+    ``row_counts(row)`` readout, which so far is only the simulated
+    MAIA; with the real one the widget says there is no live map.
+    """
+
+    def __init__(self, max_display=1024, refresh_period=200):
         super().__init__()
         self.widget_layout = QtWidgets.QGridLayout()
-        label = QtWidgets.QLabel("Detector Image widget")
-        self.widget_layout.addWidget(label)
+        self.live = hasattr(maia, "row_counts")
+        if self.live:
+            self.title_label = QtWidgets.QLabel("No map")
+        else:
+            self.title_label = QtWidgets.QLabel(
+                "No live map, the MAIA has no per-row readout (simulation only)"
+            )
+        self.widget_layout.addWidget(self.title_label, 0, 0)
+        self.image_label = QtWidgets.QLabel()
+        self.image_label.setMinimumSize(200, 200)
+        self.image_label.setSizePolicy(
+            QtWidgets.QSizePolicy.Ignored, QtWidgets.QSizePolicy.Ignored
+        )
+        self.image_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.widget_layout.addWidget(self.image_label, 1, 0)
         self.setLayout(self.widget_layout)
 
+        self.buffer = LiveMapBuffer(max_display)
+        self._run = None
+        self._descriptors = set()
+        self._rows_done = 0
+        self._title = ""
+        self._dirty = False
+        # index 0 is for pixels not scanned yet
+        colors = matplotlib.colormaps["viridis"](np.linspace(0, 1, 255))[:, :3] * 255
+        self._color_table = [QtGui.qRgb(128, 128, 128)] + [
+            QtGui.qRgb(*c) for c in colors.astype(int).tolist()
+        ]
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(refresh_period)
+        self._timer.timeout.connect(self.redraw)
+        self._timer.start()
+
+    def handle_document(self, name, doc):
+        if name == "start":
+            if not self.live or doc.get("plan_name") != "fly_maia":
+                return
+            nrows, xnum = fly_maia_map_shape(doc)
+            self.buffer.allocate(nrows, xnum, tuple(doc.get("snaking", (False, True))))
+            self._run = doc["uid"]
+            self._descriptors.clear()
+            self._rows_done = 0
+            self._title = f"{doc.get('sample', {}).get('name', '')} {xnum} x {nrows}".strip()
+            self.title_label.setText(self._title)
+            self._dirty = True
+        elif name == "descriptor":
+            if doc["run_start"] == self._run and doc.get("name") == "maia_rows":
+                self._descriptors.add(doc["uid"])
+        elif name == "event" and doc["descriptor"] in self._descriptors:
+            data = doc["data"]
+            if self.buffer.set_row(data[maia_rows.row.name], data[maia_rows.counts.name]):
+                self._rows_done += 1
+                self._dirty = True
+
+    def redraw(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        display = self.buffer.display
+        scanned = np.isfinite(display)
+        indexed = np.zeros(display.shape, dtype=np.uint8)
+        if scanned.any():
+            lo, hi = np.percentile(display[scanned], [1, 99])
+            scale = 254 / (hi - lo) if hi > lo else 0.0
+            indexed[scanned] = 1 + np.clip((display[scanned] - lo) * scale, 0, 254).astype(np.uint8)
+        # row 0 is at ystart, draw it at the bottom
+        self._indexed = np.ascontiguousarray(indexed[::-1])
+        height, width = self._indexed.shape
+        image = QtGui.QImage(
+            self._indexed.data, width, height, self._indexed.strides[0], QtGui.QImage.Format_Indexed8
+        )
+        image.setColorTable(self._color_table)
+        self.image_label.setPixmap(
+            QtGui.QPixmap.fromImage(image).scaled(
+                self.image_label.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation
+            )
+        )
+        if self._run is not None:
+            self.title_label.setText(f"{self._title}, {self._rows_done} rows")
+
 
 class ScanControlWidget(QtWidgets.QGroupBox):
     def __init__(self):
         super().__init__()
         self.setLayout(QtWidgets.QGridLayout())
-        self.queue_widget = CollectionQueueWidget()
+        self.queue_widget = CollectionQueueWidget(journal_name="collection_queue.jsonl")
         self.layout().addWidget(self.queue_widget, 0, 0)
         # self.re_controls = RunEngineControls(RE, self, motors=None)
         
         self._setup_shutter_button()
+        self.eta_label = QtWidgets.QLabel("Queue ETA: 0:00:00")
+        self.layout().addWidget(self.eta_label, 3, 0)
+
+        outline_layout = QtWidgets.QHBoxLayout()
+        outline_layout.addWidget(QtWidgets.QLabel("Scan outline:"))
+        self.outline_combo = QtWidgets.QComboBox()
+        self.outline_combo.addItems(MAIA_OUTLINE_MODES)
+        self.outline_combo.setCurrentText("fast")
+        self.outline_combo.setToolTip(
+            "off: no outline, fast: move to the far corner and back, "
+            "visual: draw it on the microscope view"
+        )
+        self.outline_combo.currentTextChanged.connect(self.set_outline_mode)
+        outline_layout.addWidget(self.outline_combo)
+        self.layout().addLayout(outline_layout, 4, 0)
+
+        order_layout = QtWidgets.QHBoxLayout()
+        self.chain_checkbox = QtWidgets.QCheckBox("Chain scans")
+        self.chain_checkbox.setToolTip(
+            "Do not return to the scan origin when another scan follows"
+        )
+        self.chain_checkbox.setChecked(True)
+        self.chain_checkbox.toggled.connect(self.set_chain_scans)
+        order_layout.addWidget(self.chain_checkbox)
+        self.optimize_button = QtWidgets.QPushButton("Optimize Order")
+        self.optimize_button.setToolTip(
+            "Reorder the queued scans to minimize stage travel, pinned scans keep their place"
+        )
+        self.optimize_button.clicked.connect(self.optimize_order)
+        order_layout.addWidget(self.optimize_button)
+        self.layout().addLayout(order_layout, 5, 0)
+
+        shutter_layout = QtWidgets.QHBoxLayout()
+        self.keep_shutter_checkbox = QtWidgets.QCheckBox("Keep shutter open, max gap (s):")
+        self.keep_shutter_checkbox.setToolTip(
+            "Leave the shutter open into the next scan if the time between them is short"
+        )
+        self.keep_shutter_checkbox.setChecked(True)
+        self.keep_shutter_checkbox.toggled.connect(self.set_shutter_policy)
+        shutter_layout.addWidget(self.keep_shutter_checkbox)
+        self.shutter_gap_spin_box = QtWidgets.QDoubleSpinBox()
+        self.shutter_gap_spin_box.setMaximum(3600)
+        self.shutter_gap_spin_box.setValue(SHUTTER_KEEP_OPEN_MAX_GAP)
+        self.shutter_gap_spin_box.valueChanged.connect(self.set_shutter_policy)
+        shutter_layout.addWidget(self.shutter_gap_spin_box)
+        self.layout().addLayout(shutter_layout, 6, 0)
+        # Coalesce bursts of queue updates (e.g. a plan import) into one estimate
+        self._eta_timer = QtCore.QTimer(self)
+        self._eta_timer.setSingleShot(True)
+        self._eta_timer.setInterval(100)
+        self._eta_timer.timeout.connect(self.update_eta)
+        self.queue_widget.queue_updated.connect(lambda items: self._eta_timer.start())
         self.setTitle("Scan Queue")
 
+    def update_eta(self):
+        items = [
+            item
+            for item in self.queue_widget.model.get_items()
+            if item.status is not RequestStatus.COMPLETE
+        ]
+        pending = [item.data for item in items]
+        chain = self.chain_checkbox.isChecked()
+        try:
+            # a running scan is under way, not reached from the stage position
+            collecting = any(item.status is RequestStatus.COLLECTING for item in items)
+            total, _ = estimate_queue_time(
+                pending,
+                start=None if collecting else (M.x.position, M.y.position),
+                params=MaiaMotionParams.from_stage(M),
+                outline=self.outline_combo.currentText(),
+                return_to_origin=np.arange(len(pending)) == len(pending) - 1 if chain else True,
+            )
+        except Exception as e:
+            print(f"Could not estimate queue time: {e}")
+            return
+        self.eta_label.setText(
+            f"Queue ETA: {format_duration(total)} ({len(pending)} scans)"
+        )
+
     def set_re_controls(self, re_controls):
         self.re_controls = re_controls
         self.layout().addWidget(self.re_controls.widget, 1, 0)
+        self.set_outline_mode(self.outline_combo.currentText())
+        self.set_chain_scans(self.chain_checkbox.isChecked())
+        self.set_shutter_policy()
+
+    def set_shutter_policy(self, *args):
+        if hasattr(self, "re_controls"):
+            executor = self.re_controls.executor
+            executor.keep_shutter_open = self.keep_shutter_checkbox.isChecked()
+            executor.shutter_gap = self.shutter_gap_spin_box.value()
+
+    def set_chain_scans(self, chain):
+        if hasattr(self, "re_controls"):
+            self.re_controls.executor.chain_scans = chain
+        self._eta_timer.start()
+
+    def optimize_order(self):
+        collecting = [
+            item
+            for item in self.queue_widget.model.get_items()
+            if item.status is RequestStatus.COLLECTING
+        ]
+        if collecting:
+            # continue from where the running scan leaves the stage
+            est = estimate_fly_maia_time(
+                collecting[0].data,
+                params=MaiaMotionParams.from_stage(M),
+                return_to_origin=not self.chain_checkbox.isChecked(),
+            )
+            start = (est["x_end"], est["y_end"])
+        else:
+            start = (M.x.position, M.y.position)
+        try:
+            before, after = self.queue_widget.optimize_order(
+                start, chain=self.chain_checkbox.isChecked()
+            )
+        except Exception as e:
+            show_error_message(f"Could not optimize the queue: {e}")
+            return
+        self.eta_label.setToolTip(
+            f"Stage travel between scans: {format_duration(before)} before, "
+            f"{format_duration(after)} after the last optimization"
+        )
+
+    def set_outline_mode(self, mode):
+        if hasattr(self, "re_controls"):
+            executor = self.re_controls.executor
+            executor.plan_kwargs = dict(executor.plan_kwargs, outline=mode)
+        self._eta_timer.start()
 
     def plan(self):
         yield from bps.sleep(1)
@@ -860,14 +2666,45 @@ class MAIAGUI:
             RE, self.window.scan_control_widget
         )
         self.window.scan_control_widget.set_re_controls(self.run_engine_controls)
+        self.run_engine_controls.executor.document.connect(
+            self.window.detector_image_widget.handle_document, QtCore.Qt.QueuedConnection
+        )
+        self.run_engine_controls.executor.state_changed.connect(
+            self.window.microscope_view_widget.set_run_engine_state, QtCore.Qt.QueuedConnection
+        )
 
     def show(self):
         self.window.show()
 
     def close(self):
+        self.run_engine_controls.close()
+        self.window.sample_control_widget.readbacks.close()
+        self.window.microscope_view_widget.close()
         self.window.close()
 
 
+class LazyMAIAGUI:
+    """Stands in for the MAIAGUI until it is first used.
+
+    The GUI, with the microscope and the EPICS readback subscriptions,
+    is built on the first attribute access, e.g. ``maia_gui.show()``.
+    """
+
+    def __init__(self):
+        self.gui = None
+
+    def __getattr__(self, name):
+        if self.gui is None:
+            _create_qApp()
+            with startup_timer.section("MAIAGUI"):
+                self.gui = MAIAGUI()
+        return getattr(self.gui, name)
+
+    def close(self):
+        if self.gui is not None:
+            self.gui.close()
+
+
 class MAIAGUIMainWindow(QtWidgets.QMainWindow):
 
 
@@ -881,10 +2718,10 @@ class MAIAGUIMainWindow(QtWidgets.QMainWindow):
 
     def show(self):
         super().show()
-        self.microscope_view_widget.microscope.acquire(True)
+        self.microscope_view_widget.acquire(True)
 
     def closeEvent(self, event):
-        self.microscope_view_widget.microscope.acquire(False)
+        self.microscope_view_widget.acquire(False)
         event.accept()
 
     def _create_menu_bar(self):
@@ -922,6 +2759,14 @@ class MAIAGUIMainWindow(QtWidgets.QMainWindow):
         self.scan_setup_widget = ScanSetupWidget()
         self.widget_layout.addWidget(self.scan_setup_widget, 2, 1)
 
+        self.sample_control_widget.readbacks.updated.connect(
+            self.microscope_view_widget.overlay.set_stage_position
+        )
+        self.microscope_view_widget.overlay.move_requested.connect(
+            self.sample_control_widget.move_to
+        )
+        self.microscope_view_widget.add_regions_requested.connect(self.add_scan_regions)
+
         self.detector_image_widget = DetectorImageWidget()
         self.widget_layout.addWidget(self.detector_image_widget, 2, 2)
 
@@ -935,62 +2780,56 @@ class MAIAGUIMainWindow(QtWidgets.QMainWindow):
         self.scan_control_widget.queue_widget.selected_item_data_signal.connect(
             self.scan_setup_widget.fill_inputs_from_definition
         )
+        # Refresh everything that depends on the queues restored from journals
+        for queue_widget in (
+            self.sample_control_widget.saved_positions_list,
+            self.scan_control_widget.queue_widget,
+        ):
+            queue_widget.queue_updated.emit(queue_widget.model.get_items())
+
 
+    def add_scan_regions(self, regions):
+        """Queue the regions dragged on the microscope view and clear them."""
+        requests = self.scan_setup_widget.region_definitions(regions)
+        if requests and self.scan_control_widget.queue_widget.add_items(requests):
+            self.microscope_view_widget.overlay.clear_regions()
 
     def import_excel_plan(self):
         dialog = QtWidgets.QFileDialog()
         filename, _ = dialog.getOpenFileName(
             self, "Import Plan", filter="Excel (*.xlsx), csv (*.csv)"
         )
-        df = None
-        if filename.endswith(".xlsx"):
-            df = pd.read_excel(filename)
-        elif filename.endswith(".csv"):
-            df = pd.read_csv(filename)
-
-        if df is not None:
-            df.columns = df.columns.str.lower()
-            expected_columns = [
-                "name",
-                "serial",
-                "info",
-                "xstart",
-                "xstop",
-                "ystart",
-                "ystop",
-                "pitch",
-                "dwell",
-                "type",
-                "owner",
-            ]
-
-            missing_columns = set(expected_columns) - set(df.columns)
-            if missing_columns:
-                self.show_error_dialog(
-                    f"Columns missing from imported excel: {','.join(list(missing_columns))}"
-                )
-                return
-            for i, row in df.iterrows():
-                md = SampleMetadata(
-                    info=str(row["info"]),
-                    owner=str("owner"),
-                    serial=str(row["serial"]),
-                    type=str(row["type"]),
-                )
-                collection_data = MaiaFlyDefinition(
-                    ystart=row["ystart"],
-                    ystop=row["ystop"],
-                    ypitch=row["pitch"],
-                    xstart=row["xstart"],
-                    xstop=row["xstop"],
-                    xpitch=row["pitch"],
-                    dwell=row["dwell"],
-                    name=str(row["name"]),
-                    md=md,
-                )
-                self.scan_control_widget.queue_widget.add_item(
-                    row["name"], collection_data
-                )
+        if not filename:
+            return
+        try:
+            plan, errors = load_maia_plan(filename, hf_stage=M)
+        except ValueError as e:
+            self.show_error_dialog(str(e))
+            return
+        if len(errors):
+            self.show_error_dialog(
+                f"Rejected rows from imported plan:\n{format_plan_errors(errors)}"
+            )
+        requests = [
+            (
+                row.name,
+                MaiaFlyDefinition(
+                    ystart=row.ystart,
+                    ystop=row.ystop,
+                    ypitch=row.pitch,
+                    xstart=row.xstart,
+                    xstop=row.xstop,
+                    xpitch=row.pitch,
+                    dwell=row.dwell,
+                    name=row.name,
+                    md=SampleMetadata(
+                        info=row.info, owner=row.owner, serial=row.serial, type=row.type
+                    ),
+                ),
+            )
+            for row in plan.itertuples(index=False)
+        ]
+        self.scan_control_widget.queue_widget.add_items(requests)
 
     def show_error_dialog(self, message):
         dlg = QtWidgets.QMessageBox(self)
@@ -999,11 +2838,14 @@ class MAIAGUIMainWindow(QtWidgets.QMainWindow):
         dlg.exec()
 
 
-_create_qApp()
-
 try:
     maia_gui.close()
 except NameError:
     pass
 
-maia_gui = MAIAGUI()
+if MAIA_LAZY_STARTUP:
+    maia_gui = LazyMAIAGUI()
+else:
+    _create_qApp()
+    with startup_timer.section("MAIAGUI"):
+        maia_gui = MAIAGUI()